@@ -2,6 +2,7 @@ import sys
 sys.path.append('../')
 
 import logging
+from collections import deque
 
 try:
     import Queue as queue
@@ -10,40 +11,161 @@ except ImportError:
     
 import time
 
-from settings import CSV_DATA_DIR
+from settings import CSV_DATA_DIR, OUTPUT_RESULT_DIR
+from event.event import EventType
+
+
+class EventDeque(deque):
+    """
+    Single-threaded replacement of queue.Queue for the backtest events.
+    
+    Exposes the put/get/empty/qsize methods the components use, but without
+    the locking of queue.Queue. get() never blocks and raises queue.Empty
+    when there is no event, like queue.Queue.get(False).
+    """
+    
+    def put(self, item, block=True, timeout=None):
+        self.append(item)
+        
+    def get(self, block=True, timeout=None):
+        try:
+            return self.popleft()
+        except IndexError:
+            raise queue.Empty
+        
+    def empty(self):
+        return not self
+    
+    def qsize(self):
+        return len(self)
 
 
 class Backtest(object):
     """
     Event driven back-test.
+    
+    The backtest streams every tick of the requested pairs from the CSV
+    files in csv_dir, or only the ticks between start and end (datetimes,
+    Timestamps or strings) if given. The data handler then seeks straight to
+    the first tick of the range.
+    
+    Two engines are available:
+        queue:  the original loop that polls a queue.Queue, streams a new
+                tick whenever the queue is empty and sleeps 'heartbeat'
+                seconds per loop. max_iters counts loop iterations.
+        direct: streams one tick at a time into an EventDeque and then
+                dispatches the tick and every SIGNAL and ORDER it causes,
+                in the same FIFO order as the queue engine, before the next
+                tick. max_iters counts ticks.
+    
+    With the direct engine and a batch_size, the strategy, which then has to
+    implement calculate_signals_batch(event), receives a TickBatchEvent of
+    up to batch_size ticks of one pair per dispatch. Its signals are then
+    executed at the prices of the last tick of the batch, and the portfolio
+    records one line per batch.
+    
+    Execution handlers with a poll(now) method, like NettingExecution (see
+    execution/netting.py), are advanced to the time of every tick in epoch
+    seconds, and their flush() is called once the data ends.
     """
     
     def __init__ (self, pairs, data_handler, strategy, strategy_params,
                   portfolio, execution, equity=100000.0, heartbeat=0.0,
-                  max_iters = 100000):
+                  max_iters = 100000, data_handler_params=None,
+                  start=None, end=None, engine="queue", batch_size=None,
+                  output_dir=OUTPUT_RESULT_DIR, portfolio_params=None,
+                  execution_params=None, csv_dir=CSV_DATA_DIR):
+        if engine not in ("queue", "direct"):
+            raise ValueError("Unknown backtest engine: %s" % engine)
+        if batch_size and engine != "direct":
+            raise ValueError("Tick batches need the direct engine")
         self.pairs = pairs
-        self.events = queue.Queue()
-        self.csv_dir = CSV_DATA_DIR
-        self.ticker = data_handler(self.pairs, self.events, self.csv_dir)
+        self.engine = engine
+        if self.engine == "direct":
+            self.events = EventDeque()
+        else:
+            self.events = queue.Queue()
+        self.csv_dir = csv_dir
+        # extra keyword arguments of the data handler, e.g. {"prefetch": 1}
+        self.data_handler_params = dict(data_handler_params or {})
+        if start is not None:
+            self.data_handler_params["start"] = start
+        if end is not None:
+            self.data_handler_params["end"] = end
+        self.ticker = data_handler(self.pairs, self.events, self.csv_dir,
+                                   **self.data_handler_params)
         self.strategy_params = strategy_params
         self.strategy = strategy(
                 self.pairs, self.events, **self.strategy_params)
         self.equity = equity
         self.heartbeat = heartbeat
         self.max_iters = max_iters
+        # every backtest writing into its own directory can run in parallel
+        self.output_dir = output_dir
+        # extra keyword arguments of the portfolio, e.g. the recorder_params
+        self.portfolio_params = dict(portfolio_params or {})
         self.portfolio = portfolio(self.ticker, self.events, equity=self.equity, 
-                                  backtest=True)
-        self.execution = execution()
+                                  backtest=True, output_dir=self.output_dir,
+                                  **self.portfolio_params)
+        # extra keyword arguments of the execution handler
+        self.execution_params = dict(execution_params or {})
+        self.execution = execution(**self.execution_params)
+        self.poll = getattr(self.execution, "poll", None)
+        if batch_size and not hasattr(self.strategy,
+                                      "calculate_signals_batch"):
+            raise ValueError("%s does not take tick batches"
+                             % type(self.strategy).__name__)
+        self.batch_size = batch_size
+        self.handlers = {
+                EventType.TICK: self._on_tick,
+                EventType.TICK_BATCH: self._on_tick_batch,
+                EventType.SIGNAL: self.portfolio.execute_signal,
+                EventType.ORDER: self.execution.execute_order,
+                }
         self.logger = logging.getLogger(__name__)
         
+    def _on_tick(self, event):
+        if self.poll is not None:
+            self.poll(event.time.value / 1e9)
+        self.strategy.calculate_signals(event)
+        self.portfolio.update_portfolio(event)
+        
+    def _on_tick_batch(self, event):
+        if self.poll is not None:
+            self.poll(event.time.value / 1e9)
+        self.strategy.calculate_signals_batch(event)
+        self.portfolio.update_portfolio(event)
+    
+    def _dispatch(self, event):
+        """
+        Directs a single event to the strategy, the portfolio or the
+        execution handler.
+        """
+        self.handlers[event.type](event)
+    
     def _run_backtest(self):
+        """
+        Runs the backtest with the selected engine and stops any background
+        loading of the price handler afterwards.
+        """
+        self.logger.info("Running Backtest...")
+        try:
+            if self.engine == "direct":
+                self._run_direct()
+            else:
+                self._run_queue()
+            if hasattr(self.execution, "flush"):
+                self.execution.flush()
+        finally:
+            self.ticker.close()
+    
+    def _run_queue(self):
         """
         Caries out an infinite loop that pool the events queue and directs each
         event to either the strategy component or the execution handler. The 
         loop will then pause for 'heartbeat' seconds and continue until the 
         maximum number of iterations is exceeded.
         """
-        self.logger.info("Running Backtest...")
         iters = 0
         while iters < self.max_iters and self.ticker.continue_backtest:
             try:
@@ -52,28 +174,43 @@ class Backtest(object):
                 self.ticker.stream_next_tick()
             else:
                 if event is not None:
-                    if event.type == 'TICK':
-                        self.strategy.calculate_signals(event)
-                        #print("Event sent to strategy: %s" % event)
-                        self.portfolio.update_portfolio(event) # BUG: this doesn't work, check definition
-                        #print("Portfolio update")
-                    elif event.type == 'SIGNAL':
-                        self.portfolio.execute_signal(event)
-                        #print("Portfolio execute signal: %s" % event)
-                    elif event.type == 'ORDER':
-                        self.execution.execute_order(event)
-                        #print("Execute order: %s" % event)
-                        
-            time.sleep(self.heartbeat)
+                    self._dispatch(event)
+            if self.heartbeat:
+                time.sleep(self.heartbeat)
             iters += 1
-        
     
+    def _run_direct(self):
+        """
+        Streams up to max_iters ticks. After every tick the events it caused
+        are dispatched first in first out until the deque is empty, which is
+        the order in which the queue engine handles them.
+        """
+        events = self.events
+        handlers = self.handlers
+        ticks = 0
+        while ticks < self.max_iters and self.ticker.continue_backtest:
+            if self.batch_size:
+                ticks += self.ticker.stream_next_batch(
+                        min(self.batch_size, self.max_iters - ticks))
+            else:
+                self.ticker.stream_next_tick()
+                ticks += 1
+            while events:
+                event = events.popleft()
+                if event is not None:
+                    handlers[event.type](event)
+            if self.heartbeat:
+                time.sleep(self.heartbeat)
+        
     def _output_performance(self):
         """
         Output the strategy performance from the backtest.
         """
         self.logger.info("Calculating Performance Metrics...")
         self.portfolio.output_results()
+        if hasattr(self.execution, "statistics"):
+            for name, value in self.execution.statistics().items():
+                print("%s: %s" % (name, value))
     
     def simualte_trading(self):
         """
@@ -0,0 +1,158 @@
+"""
+
+Several strategies on a single tick stream.
+
+A FanOutBacktest reads the data once with one price handler and hands every
+tick to N independent legs. A leg is a strategy with its own events deque,
+portfolio and execution handler, so the signals and orders of one strategy
+never reach another one. Within a leg the events are dispatched exactly like
+the direct engine of Backtest does, so every leg produces the same results
+and equity recording (written into its own directory if requested with
+portfolio_params) as a separate Backtest of that strategy, while the data
+is parsed and streamed only once. Execution handlers with poll() and
+flush(), like NettingExecution, are advanced to the time of every tick and
+flushed once the data ends, as in Backtest.
+"""
+import sys
+sys.path.append('../')
+
+import os
+import time
+import logging
+
+from settings import CSV_DATA_DIR, OUTPUT_RESULT_DIR, EQUITY
+from backtest.backtest import EventDeque
+from event.event import EventType
+
+
+class StrategyLeg(object):
+    """
+    One strategy with its own event routing, portfolio and execution
+    handler on a shared price handler.
+    """
+
+    def __init__(self, name, pairs, ticker, strategy, strategy_params,
+                 portfolio, execution, equity, output_dir,
+                 portfolio_params=None, execution_params=None):
+        self.name = name
+        self.events = EventDeque()
+        self.strategy = strategy(pairs, self.events, **strategy_params)
+        self.output_dir = output_dir
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+        self.portfolio = portfolio(ticker, self.events, equity=equity,
+                                   backtest=True, output_dir=output_dir,
+                                   **(portfolio_params or {}))
+        self.execution = execution(**(execution_params or {}))
+        self.poll = getattr(self.execution, "poll", None)
+        self.handlers = {
+                EventType.TICK: self._on_tick,
+                EventType.SIGNAL: self.portfolio.execute_signal,
+                EventType.ORDER: self.execution.execute_order,
+                }
+
+    def _on_tick(self, event):
+        if self.poll is not None:
+            self.poll(event.time.value / 1e9)
+        self.strategy.calculate_signals(event)
+        self.portfolio.update_portfolio(event)
+
+    def dispatch(self, tick_event):
+        """
+        Dispatches a tick and then every event it caused in this leg, first
+        in first out.
+        """
+        events = self.events
+        handlers = self.handlers
+        events.append(tick_event)
+        while events:
+            event = events.popleft()
+            if event is not None:
+                handlers[event.type](event)
+
+
+class FanOutBacktest(object):
+    """
+    Event driven back-test of several strategies on one tick stream.
+
+    strategies maps a leg name to a (strategy class, strategy parameters)
+    tuple. The ticks are read from the CSV files in csv_dir. Every leg
+    writes its output files into output_dir/<name>. Every leg creates its
+    own execution handler with execution_params.
+    """
+
+    def __init__(self, pairs, data_handler, strategies, portfolio, execution,
+                 equity=EQUITY, heartbeat=0.0, max_iters=100000,
+                 data_handler_params=None, start=None, end=None,
+                 output_dir=OUTPUT_RESULT_DIR, portfolio_params=None,
+                 execution_params=None, csv_dir=CSV_DATA_DIR):
+        self.pairs = pairs
+        self.events = EventDeque()
+        self.csv_dir = csv_dir
+        self.data_handler_params = dict(data_handler_params or {})
+        if start is not None:
+            self.data_handler_params["start"] = start
+        if end is not None:
+            self.data_handler_params["end"] = end
+        self.ticker = data_handler(self.pairs, self.events, self.csv_dir,
+                                   **self.data_handler_params)
+        self.equity = equity
+        self.heartbeat = heartbeat
+        self.max_iters = max_iters
+        self.output_dir = output_dir
+        self.portfolio_params = dict(portfolio_params or {})
+        self.execution_params = dict(execution_params or {})
+        self.legs = [
+                StrategyLeg(name, self.pairs, self.ticker, strategy, params,
+                            portfolio, execution, self.equity,
+                            os.path.join(self.output_dir, name),
+                            self.portfolio_params, self.execution_params)
+                for name, (strategy, params) in strategies.items()]
+        self.logger = logging.getLogger(__name__)
+
+    def _run_backtest(self):
+        """
+        Streams up to max_iters ticks and hands every tick to all legs.
+        """
+        self.logger.info("Running Backtest of %d strategies..." % len(self.legs))
+        events = self.events
+        legs = self.legs
+        ticks = 0
+        try:
+            while ticks < self.max_iters and self.ticker.continue_backtest:
+                self.ticker.stream_next_tick()
+                while events:
+                    tick_event = events.popleft()
+                    for leg in legs:
+                        leg.dispatch(tick_event)
+                if self.heartbeat:
+                    time.sleep(self.heartbeat)
+                ticks += 1
+            for leg in legs:
+                if hasattr(leg.execution, "flush"):
+                    leg.execution.flush()
+        finally:
+            self.ticker.close()
+            for leg in legs:
+                leg.portfolio.recorder.close()
+
+    def _output_performance(self):
+        """
+        Output the performance of every strategy, each under the name of
+        its leg.
+        """
+        self.logger.info("Calculating Performance Metrics...")
+        for leg in self.legs:
+            print("=== %s (%s) ===" % (leg.name, leg.portfolio.output_dir))
+            leg.portfolio.output_results()
+            if hasattr(leg.execution, "statistics"):
+                for name, value in leg.execution.statistics().items():
+                    print("%s: %s" % (name, value))
+
+    def simualte_trading(self):
+        """
+        Simulates the backtest and outputs the performance of every leg.
+        """
+        self._run_backtest()
+        self._output_performance()
+        self.logger.info("Backtest complete.")
@@ -0,0 +1,299 @@
+"""
+
+Parallel parameter sweep over Backtest.
+
+Every combination of a parameter grid is run as a separate Backtest on a
+process pool. Each worker keeps the parsed tick days in memory (the day_cache
+of the price handler), so a day is loaded only once per worker no matter how
+many backtests the worker runs. The cache holds at most max_cached_days
+pair-days and drops the one used longest ago first. Every run records its equity in memory and
+writes it as a compact backtest.npz (see portfolio/recorder.py) into its own
+directory below output_dir, and the final balance, maximum drawdown and
+number of trades of all runs are collected into a single table, sweep.csv.
+
+Usage:
+    python -m backtest.sweep --pairs GBPUSD --param short_window=100,500
+        --param long_window=1000,2000 [--processes 4] [--max-iters 100000]
+        [--max-cached-days 32]
+"""
+import sys
+sys.path.append('../')
+
+import os
+import ast
+import time
+import argparse
+import itertools
+import contextlib
+import multiprocessing
+from collections import OrderedDict
+
+import pandas as pd
+
+from settings import CSV_DATA_DIR, EQUITY, OUTPUT_RESULT_DIR
+from backtest.backtest import Backtest
+from data.price import HistoricCSVPriceHandler
+from execution.execution import SimulatedExecution
+from performance.performance import create_drawdowns
+from portfolio.portfolio import Portfolio
+from strategy.strategy import TestStrategy, MovingAverageCrossStrategy
+
+
+STRATEGIES = {
+        "test": TestStrategy,
+        "ma": MovingAverageCrossStrategy,
+        }
+
+# Pair-days a worker keeps parsed in memory by default
+MAX_CACHED_DAYS = 32
+
+# Parsed tick days of the current worker process, see init_worker
+_worker_days = None
+
+
+class DayCache(OrderedDict):
+    """
+    Parsed-day cache of a worker: a dict that keeps only the max_days
+    entries used last, or every entry if max_days is None.
+    """
+
+    def __init__(self, max_days=MAX_CACHED_DAYS):
+        OrderedDict.__init__(self)
+        self.max_days = max_days
+
+    def get(self, key, default=None):
+        if key not in self:
+            return default
+        self.move_to_end(key)
+        return self[key]
+
+    def __setitem__(self, key, value):
+        OrderedDict.__setitem__(self, key, value)
+        self.move_to_end(key)
+        if self.max_days is not None:
+            while len(self) > self.max_days:
+                self.popitem(last=False)
+
+
+def parameter_grid(grid):
+    """
+    Expands a dict of parameter name -> list of values into the list of
+    every combination, as dicts, in a stable order.
+    """
+    names = sorted(grid)
+    return [dict(zip(names, values))
+            for values in itertools.product(*[grid[n] for n in names])]
+
+
+def init_worker(max_cached_days=MAX_CACHED_DAYS):
+    """
+    Pool initializer: gives the worker process its own in-memory day cache
+    of up to max_cached_days pair-days.
+    """
+    global _worker_days
+    _worker_days = DayCache(max_cached_days)
+
+
+def _run_one(task):
+    """
+    Runs a single backtest of the sweep in a worker process and returns its
+    row of the results table.
+    """
+    (run_id, params, pairs, strategy, data_handler, portfolio, execution,
+     settings) = task
+    output_dir = os.path.join(settings["output_dir"], run_id)
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    data_handler_params = dict(settings["data_handler_params"])
+    if _worker_days is not None:
+        data_handler_params["day_cache"] = _worker_days
+
+    start = time.time()
+    with open(os.devnull, "w") as devnull:
+        with contextlib.redirect_stdout(devnull):
+            backtest = Backtest(
+                    pairs, data_handler, strategy, params,
+                    portfolio, execution,
+                    equity=settings["equity"], heartbeat=0.0,
+                    max_iters=settings["max_iters"],
+                    data_handler_params=data_handler_params,
+                    start=settings["start"], end=settings["end"],
+                    engine=settings["engine"], output_dir=output_dir,
+                    portfolio_params={
+                            "recorder_params": settings["recorder_params"]},
+                    csv_dir=settings["csv_dir"])
+            backtest._run_backtest()
+    elapsed = time.time() - start
+    portfolio = backtest.portfolio
+    portfolio.recorder.close()
+
+    # equity = balance + unrealised profit of every pair
+    equity = portfolio.equity_curve()
+    row = dict(params)
+    row.update({
+            "run": run_id,
+            "pairs": ",".join(pairs),
+            "balance": float(portfolio.numeric.money_to_decimal(
+                    portfolio.balance)),
+            "max_drawdown": create_drawdowns(equity.values)[1],
+            "trades": portfolio.trades,
+            "ticks": len(equity),
+            "seconds": elapsed,
+            "pid": os.getpid(),
+            "output_dir": output_dir,
+            })
+    return row
+
+
+def run_tasks(tasks, processes=None, pool=None,
+              max_cached_days=MAX_CACHED_DAYS):
+    """
+    Runs sweep tasks and returns their result rows in task order. Tasks are
+    run on the given pool, on a new pool of 'processes' workers or, with a
+    single process, in this process. max_cached_days limits the day cache
+    of the new workers or of this process.
+    """
+    if pool is not None:
+        return pool.map(_run_one, tasks, chunksize=1)
+    processes = min(processes or os.cpu_count() or 1, len(tasks))
+    if processes <= 1:
+        if _worker_days is None:
+            init_worker(max_cached_days)
+        else:
+            _worker_days.max_days = max_cached_days
+        return [_run_one(task) for task in tasks]
+    pool = multiprocessing.Pool(processes, initializer=init_worker,
+                                initargs=(max_cached_days,))
+    try:
+        return pool.map(_run_one, tasks, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+class ParameterSweep(object):
+    """
+    Runs a Backtest for every combination of the strategy parameters in grid
+    on a process pool and collects the results into one DataFrame.
+
+    A 'pairs' entry in the grid, with lists of pairs as values, sweeps over
+    the traded pairs as well.
+    """
+
+    def __init__(self, pairs, strategy, grid, data_handler=HistoricCSVPriceHandler,
+                 portfolio=Portfolio, execution=SimulatedExecution,
+                 equity=EQUITY, max_iters=100000, data_handler_params=None,
+                 start=None, end=None, engine="direct",
+                 output_dir=OUTPUT_RESULT_DIR, processes=None,
+                 recorder_params=None, csv_dir=CSV_DATA_DIR,
+                 max_cached_days=MAX_CACHED_DAYS):
+        """
+        Args:
+            pairs: the list of currency pairs of every run
+            strategy: strategy class
+            grid: dict of strategy parameter name -> list of values
+            max_iters: max_iters of every Backtest, ticks with the default
+                direct engine
+            output_dir: directory of sweep.csv, every run writes into its
+                own sub-directory run_NNN
+            processes: size of the process pool, os.cpu_count() if not given
+            recorder_params: equity recorder of every run, {"fmt": "npz"}
+                (backtest.npz) if not given
+            csv_dir: directory of the tick CSV files
+            max_cached_days: pair-days every worker keeps parsed in memory,
+                all of them if None
+        """
+        self.pairs = pairs
+        self.strategy = strategy
+        self.grid = grid
+        self.data_handler = data_handler
+        self.portfolio = portfolio
+        self.execution = execution
+        self.settings = {
+                "equity": equity,
+                "max_iters": max_iters,
+                "data_handler_params": dict(data_handler_params or {}),
+                "start": start,
+                "end": end,
+                "engine": engine,
+                "output_dir": output_dir,
+                "recorder_params": dict(recorder_params or {"fmt": "npz"}),
+                "csv_dir": csv_dir,
+                }
+        self.output_dir = output_dir
+        self.processes = processes
+        self.max_cached_days = max_cached_days
+        self.results = None
+
+    def tasks(self):
+        """
+        One task per parameter combination.
+        """
+        tasks = []
+        for i, params in enumerate(parameter_grid(self.grid)):
+            pairs = params.pop("pairs", self.pairs)
+            tasks.append((
+                    "run_%03d" % i, params, list(pairs), self.strategy,
+                    self.data_handler, self.portfolio, self.execution,
+                    self.settings))
+        return tasks
+
+    def run(self, pool=None):
+        """
+        Runs every task, on the given pool or a new one, and returns the
+        results table, which is also written to output_dir/sweep.csv.
+        """
+        rows = run_tasks(self.tasks(), self.processes, pool,
+                         self.max_cached_days)
+        self.results = pd.DataFrame(rows).set_index("run")
+        self.results.to_csv(os.path.join(self.output_dir, "sweep.csv"))
+        return self.results
+
+
+def parse_param(text):
+    """
+    Parses 'name=v1,v2,...' into (name, [values]).
+    """
+    name, _, values = text.partition("=")
+    if not values:
+        raise argparse.ArgumentTypeError("expected name=v1,v2,...: %s" % text)
+    parsed = []
+    for v in values.split(","):
+        try:
+            parsed.append(ast.literal_eval(v))
+        except (ValueError, SyntaxError):
+            parsed.append(v)
+    return name, parsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+            description="Run a backtest for every combination of parameters")
+    parser.add_argument("--pairs", default="GBPUSD",
+                        help="comma separated pairs; ';' separates pair sets "
+                             "to sweep over")
+    parser.add_argument("--strategy", default="ma", choices=sorted(STRATEGIES))
+    parser.add_argument("--param", action="append", type=parse_param,
+                        default=[], help="strategy parameter: name=v1,v2,...")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--max-iters", type=int, default=100000)
+    parser.add_argument("--start", default=None)
+    parser.add_argument("--end", default=None)
+    parser.add_argument("--output-dir", default=OUTPUT_RESULT_DIR)
+    parser.add_argument("--max-cached-days", type=int,
+                        default=MAX_CACHED_DAYS)
+    args = parser.parse_args()
+
+    pair_sets = [p.split(",") for p in args.pairs.split(";")]
+    grid = dict(args.param)
+    if len(pair_sets) > 1:
+        grid["pairs"] = pair_sets
+    sweep = ParameterSweep(
+            pair_sets[0], STRATEGIES[args.strategy], grid,
+            max_iters=args.max_iters, start=args.start, end=args.end,
+            output_dir=args.output_dir, processes=args.processes,
+            max_cached_days=args.max_cached_days)
+    started = time.time()
+    results = sweep.run()
+    print(results.to_string())
+    print("%d runs in %.2fs" % (len(results), time.time() - started))
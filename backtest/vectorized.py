@@ -0,0 +1,256 @@
+"""
+
+Vectorized backtest of the MovingAverageCrossStrategy.
+
+Instead of streaming tick events through the strategy and the portfolio, the
+ticks of every day are loaded as NumPy columns and the whole day is processed
+at once:
+
+    1. both rolling SMAs are computed over the bid prices (the recursion
+       sma = (sma * (window - 1) + price) / window of the strategy is an
+       exponentially weighted mean with alpha = 1 / window),
+    2. the crossovers give the invested state of every tick, from which the
+       entry and exit ticks follow,
+    3. the P&L of every trade and the recorded balance and unrealised profit
+       of every tick are computed in integer pipettes and cents, with the
+       same rounding as the pipette numeric backend.
+
+The SMAs, the open position and the balance are carried over from one day to
+the next, so the result matches an event driven Backtest of the strategy on
+the same ticks (see scripts/vectorized_crosscheck.py). Only the tick by tick
+event semantics are dropped, which is what makes parameter research fast.
+
+Only pairs whose base currency is the home currency (e.g. GBPUSD for a GBP
+account) are supported, because the P&L of such a pair is converted with the
+inverse of its own prices.
+"""
+import sys
+sys.path.append('../')
+
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+
+from settings import BASE_CURRENCY, CSV_DATA_DIR, EQUITY
+from data.price import HistoricCSVPriceHandler
+from numeric.numeric import PipetteBackend
+
+
+def _div_half_down(n, d):
+    """
+    Element wise integer division n / d (d > 0) of int64 arrays, rounded to
+    the nearest integer with ties towards zero (ROUND_HALF_DOWN).
+    """
+    q, r = np.divmod(np.abs(n), d)
+    q = q + (2 * r > d)
+    return np.where(n >= 0, q, -q)
+
+
+def _to_pipettes(values, backend):
+    """
+    Converts float quotes into int64 pipettes. Values too close to a rounding
+    tie to trust the float are converted exactly by the numeric backend.
+    """
+    scaled = np.asarray(values, dtype=np.float64) * backend.price_scale
+    pipettes = np.floor(scaled + 0.5).astype(np.int64)
+    ties = np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6)
+    for i in ties:
+        pipettes[i] = backend.price(float(values[i]))
+    return pipettes
+
+
+def _rolling_sma(prices, window, seed=None):
+    """
+    The rolling SMA of the strategy over a day of prices, continuing from
+    the last value of the previous day (seed). Without a seed the first
+    price starts the average.
+    """
+    prices = prices.astype(np.float64)
+    if seed is not None:
+        prices = np.concatenate(([seed], prices))
+    sma = pd.Series(prices).ewm(alpha=1.0 / window, adjust=False).mean().values
+    return sma[1:] if seed is not None else sma
+
+
+def _forward_fill(values, first):
+    """
+    Replaces every -1 in values with the last value before it, or first.
+    """
+    idx = np.where(values >= 0, np.arange(len(values)), -1)
+    idx = np.maximum.accumulate(idx)
+    return np.where(idx >= 0, values[np.maximum(idx, 0)], first)
+
+
+class VectorizedMACrossBacktest(object):
+    """
+    Whole-day vectorized backtest of the MovingAverageCrossStrategy on a
+    single pair, with the position sizing of Portfolio (equity *
+    risk_per_trade units per trade).
+    """
+
+    def __init__(self, pair, short_window=500, long_window=2000,
+                 equity=EQUITY, risk_per_trade=Decimal("0.02"),
+                 home_currency=BASE_CURRENCY, csv_dir=CSV_DATA_DIR,
+                 start=None, end=None, max_ticks=None,
+                 data_handler_params=None):
+        """
+        Args:
+            pair: currency pair to trade, its base currency has to be the
+                home currency
+            short_window, long_window: the SMA windows of the strategy
+            equity, risk_per_trade: starting balance and risk per trade as
+                used by Portfolio
+            csv_dir: absolute directory path to the CSV files
+            start, end: time range of the ticks, as for Backtest
+            max_ticks: stop after this many ticks, like max_iters of the
+                direct Backtest engine
+            data_handler_params: extra keyword arguments of the
+                HistoricCSVPriceHandler that loads the days
+        """
+        if pair[:3] != home_currency:
+            raise ValueError(
+                    "Vectorized backtest needs a pair with base currency %s, "
+                    "got %s" % (home_currency, pair))
+        self.pair = pair
+        self.short_window = short_window
+        self.long_window = long_window
+        self.equity = equity
+        self.risk_per_trade = risk_per_trade
+        self.home_currency = home_currency
+        self.csv_dir = csv_dir
+        self.start = start
+        self.end = end
+        self.max_ticks = max_ticks
+        self.data_handler_params = dict(data_handler_params or {})
+        self.numeric = PipetteBackend()
+        self.units = int(equity * risk_per_trade)
+        self.results = None
+
+    def _iter_days(self):
+        """
+        Yields (time, bid, ask) columns of every day of the pair, with bid
+        and ask converted to int64 pipettes.
+        """
+        handler = HistoricCSVPriceHandler(
+                [self.pair], None, self.csv_dir,
+                start=self.start, end=self.end, **self.data_handler_params)
+        try:
+            for date_str in handler.file_dates:
+                [(_, chunks)] = handler._load_day(date_str)
+                chunks = list(chunks)
+                if not chunks:
+                    continue
+                time = np.concatenate([c["time"] for c in chunks])
+                bid = np.concatenate([c["bid"] for c in chunks])
+                ask = np.concatenate([c["ask"] for c in chunks])
+                if len(time):
+                    yield (time, _to_pipettes(bid, self.numeric),
+                           _to_pipettes(ask, self.numeric))
+        finally:
+            handler.close()
+
+    def run(self):
+        """
+        Runs the backtest and returns a dict with the final 'balance'
+        (Decimal), the list of 'trades' and the 'equity' DataFrame, which
+        holds the balance and unrealised profit recorded by the portfolio
+        for every tick.
+        """
+        scale = self.numeric.price_scale
+        # pips * rate is scaled by 10**10, keep 10**2 for cents
+        cents_div = scale * scale // self.numeric.money_scale
+        balance = self.numeric.money(self.equity)
+        short_sma = long_sma = None
+        invested = 0
+        entry_price = None
+        entry_time = None
+        ticks = 0
+        trades = []
+        curves = []
+
+        for time, bid, ask in self._iter_days():
+            if self.max_ticks is not None:
+                left = self.max_ticks - ticks
+                if left <= 0:
+                    break
+                time, bid, ask = time[:left], bid[:left], ask[:left]
+            n = len(time)
+            short = _rolling_sma(bid, self.short_window, short_sma)
+            long_ = _rolling_sma(bid, self.long_window, long_sma)
+            short_sma, long_sma = short[-1], long_[-1]
+
+            # invested state after the signals of every tick: 1 above, 0
+            # below, unchanged where the averages are equal or the short
+            # window is not yet filled
+            wanted = np.where(short > long_, 1, np.where(short < long_, 0, -1))
+            wanted[np.arange(ticks, ticks + n) <= self.short_window] = -1
+            state = _forward_fill(wanted, invested)
+            before = np.concatenate(([invested], state[:-1]))
+            entries = np.flatnonzero((state == 1) & (before == 0))
+            exits = np.flatnonzero((state == 0) & (before == 1))
+
+            # entry price of the open position at every tick
+            avg = np.full(n, -1, dtype=np.int64)
+            avg[entries] = ask[entries]
+            avg = _forward_fill(avg, -1 if entry_price is None else entry_price)
+            opened = np.full(n, -1, dtype=np.int64)
+            opened[entries] = time[entries]
+            opened = _forward_fill(
+                    opened, -1 if entry_time is None else entry_time)
+
+            # realised P&L: pips at the bid times the inverse ask at the exit
+            pnl = np.zeros(n, dtype=np.int64)
+            pips = bid[exits] - avg[exits]
+            rate = _div_half_down(scale * scale, ask[exits])
+            pnl[exits] = _div_half_down(pips * rate * self.units, cents_div)
+
+            # the portfolio records every tick before its signals are executed
+            recorded_balance = balance + np.concatenate(
+                    ([0], np.cumsum(pnl)[:-1]))
+            open_avg = np.concatenate(
+                    ([-1 if entry_price is None else entry_price], avg[:-1]))
+            held = before == 1
+            profit = np.zeros(n, dtype=np.int64)
+            rate = _div_half_down(scale * scale, bid[held])
+            profit[held] = _div_half_down(
+                    (bid[held] - open_avg[held]) * rate * self.units, scale)
+            curves.append((time, recorded_balance, profit))
+
+            for j in exits:
+                trades.append({
+                        "entry_time": pd.Timestamp(int(opened[j])),
+                        "exit_time": pd.Timestamp(int(time[j])),
+                        "entry_price": self.numeric.price_to_decimal(int(avg[j])),
+                        "exit_price": self.numeric.price_to_decimal(int(bid[j])),
+                        "pnl": self.numeric.money_to_decimal(int(pnl[j])),
+                        })
+            balance += int(pnl.sum())
+            invested = int(state[-1])
+            entry_price = int(avg[-1]) if invested else None
+            entry_time = int(opened[-1]) if invested else None
+            ticks += n
+
+        self.results = {
+                "balance": self.numeric.money_to_decimal(balance),
+                "trades": trades,
+                "equity": self._equity_frame(curves),
+                "ticks": ticks,
+                }
+        return self.results
+
+    def _equity_frame(self, curves):
+        """
+        Builds the DataFrame of the recorded balance and unrealised profit,
+        indexed by tick time.
+        """
+        if not curves:
+            return pd.DataFrame(columns=["Balance", self.pair])
+        time = np.concatenate([c[0] for c in curves])
+        balance = np.concatenate([c[1] for c in curves])
+        profit = np.concatenate([c[2] for c in curves])
+        return pd.DataFrame(
+                {"Balance": balance / float(self.numeric.money_scale),
+                 self.pair: profit / float(self.numeric.price_scale)},
+                index=pd.DatetimeIndex(time.view("datetime64[ns]"),
+                                       name="Timestamp"))
@@ -0,0 +1,277 @@
+"""
+
+Walk-forward optimization.
+
+The trading days found in the CSV directory are split into rolling windows
+of train_days in-sample days followed by test_days out-of-sample days:
+
+    window 0: train days [0, train_days), test days [train_days, +test_days)
+    window 1: everything shifted by step_days (test_days by default)
+    ...
+
+The strategy parameters of the grid are optimized on every train window,
+all windows in parallel, and the best parameters of each window are then
+backtested on its test window. The out-of-sample equity curves are stitched
+together into a single curve, every window continuing from the equity the
+previous one ended with.
+
+All backtests run on one process pool whose workers keep the parsed days in
+memory (see backtest/sweep.py), so the days shared by overlapping windows
+are decoded once per worker instead of once per backtest, as long as
+max_cached_days covers the pair-days of a window.
+
+Usage:
+    python -m backtest.walkforward --param short_window=100,500
+        --param long_window=1000,2000 --train-days 5 --test-days 1
+"""
+import sys
+sys.path.append('../')
+
+import os
+import time
+import argparse
+import multiprocessing
+
+import pandas as pd
+
+from settings import CSV_DATA_DIR, EQUITY, OUTPUT_RESULT_DIR
+from backtest.sweep import (STRATEGIES, MAX_CACHED_DAYS, ParameterSweep,
+                            init_worker, run_tasks, parse_param)
+from data.manifest import TickManifest
+from data.price import HistoricCSVPriceHandler
+from portfolio.recorder import load_equity
+from execution.execution import SimulatedExecution
+from portfolio.portfolio import Portfolio
+
+
+def day_bounds(first_date, last_date):
+    """
+    Start of first_date and the last nanosecond of last_date (YYYYMMDD
+    strings) as Timestamps.
+    """
+    start = pd.Timestamp(first_date)
+    end = pd.Timestamp(last_date) + pd.Timedelta(days=1) - pd.Timedelta(1, "ns")
+    return start, end
+
+
+def split_windows(dates, train_days, test_days, step_days=None):
+    """
+    Splits a sorted list of dates into (train dates, test dates) windows.
+    Only windows with a complete test period are returned.
+    """
+    step_days = step_days or test_days
+    windows = []
+    i = 0
+    while i + train_days + test_days <= len(dates):
+        windows.append((dates[i:i+train_days],
+                        dates[i+train_days:i+train_days+test_days]))
+        i += step_days
+    return windows
+
+
+class WalkForward(object):
+    """
+    Rolling in-sample optimization and out-of-sample evaluation of the
+    strategy parameters in grid.
+    """
+
+    def __init__(self, pairs, strategy, grid, train_days=5, test_days=1,
+                 step_days=None, objective="balance", maximize=True,
+                 data_handler=HistoricCSVPriceHandler, portfolio=Portfolio,
+                 execution=SimulatedExecution, equity=EQUITY, max_iters=None,
+                 data_handler_params=None, csv_dir=CSV_DATA_DIR,
+                 output_dir=OUTPUT_RESULT_DIR, processes=None,
+                 max_cached_days=MAX_CACHED_DAYS):
+        """
+        Args:
+            pairs: the list of currency pairs to trade
+            strategy: strategy class
+            grid: dict of strategy parameter name -> list of values
+            train_days, test_days: number of trading days of the in-sample
+                and out-of-sample part of every window
+            step_days: days between the start of two windows, test_days
+                if not given
+            objective: column of the sweep results (e.g. 'balance' or
+                'max_drawdown') that selects the best parameters
+            maximize: whether the objective is maximized or minimized
+            max_iters: limit of ticks per backtest, unlimited if not given
+            csv_dir: directory of the tick CSV files the trading days and
+                every backtest are read from
+            output_dir: directory of walkforward.csv and oos_equity.csv,
+                the backtests write into window_NNN sub-directories
+            processes: size of the process pool, os.cpu_count() if not given
+            max_cached_days: pair-days every worker keeps parsed in memory,
+                all of them if None
+        """
+        self.pairs = pairs
+        self.strategy = strategy
+        self.grid = grid
+        self.train_days = train_days
+        self.test_days = test_days
+        self.step_days = step_days
+        self.objective = objective
+        self.maximize = maximize
+        self.data_handler = data_handler
+        self.portfolio = portfolio
+        self.execution = execution
+        self.equity = equity
+        self.max_iters = max_iters or sys.maxsize
+        self.data_handler_params = dict(data_handler_params or {})
+        self.csv_dir = csv_dir
+        self.output_dir = output_dir
+        self.processes = processes
+        self.max_cached_days = max_cached_days
+        self.results = None
+        self.equity_curve = None
+
+    def dates(self):
+        """
+        Sorted trading days for which every pair has a CSV file.
+        """
+        manifest = TickManifest(self.csv_dir).refresh()
+        return manifest.dates(self.pairs)
+
+    def _sweep(self, grid, dates, output_dir):
+        start, end = day_bounds(dates[0], dates[-1])
+        return ParameterSweep(
+                self.pairs, self.strategy, grid,
+                data_handler=self.data_handler, portfolio=self.portfolio,
+                execution=self.execution, equity=self.equity,
+                max_iters=self.max_iters,
+                data_handler_params=self.data_handler_params,
+                start=start, end=end, output_dir=output_dir,
+                csv_dir=self.csv_dir)
+
+    def _best(self, rows):
+        """
+        Row of the train sweep with the best objective; the first one wins
+        ties, so the choice is deterministic.
+        """
+        best = None
+        for row in rows:
+            if best is None or \
+                    (row[self.objective] > best[self.objective]
+                     if self.maximize else
+                     row[self.objective] < best[self.objective]):
+                best = row
+        return best
+
+    def _oos_equity(self, output_dir):
+        """
+        Equity curve (balance plus unrealised profit) of a test backtest.
+        """
+        df = load_equity(os.path.join(output_dir, "backtest.npz"))
+        return df["Balance"] + df[list(self.pairs)].sum(axis=1)
+
+    def run(self):
+        """
+        Runs the walk-forward optimization. Returns the table of windows
+        (train/test range, best parameters, in-sample objective and
+        out-of-sample result), also written to output_dir/walkforward.csv.
+        The stitched out-of-sample equity curve is kept in equity_curve and
+        written to output_dir/oos_equity.csv.
+        """
+        windows = split_windows(self.dates(), self.train_days,
+                                self.test_days, self.step_days)
+        if not windows:
+            raise ValueError("Not enough trading days for a single window")
+        names = sorted(self.grid)
+
+        # every train backtest of every window, in one batch
+        train_tasks = []
+        for w, (train, _) in enumerate(windows):
+            out = os.path.join(self.output_dir, "window_%03d" % w, "train")
+            train_tasks.append(self._sweep(self.grid, train, out).tasks())
+
+        processes = self.processes or os.cpu_count() or 1
+        pool = None
+        if processes > 1:
+            pool = multiprocessing.Pool(processes, initializer=init_worker,
+                                        initargs=(self.max_cached_days,))
+        try:
+            rows = run_tasks([t for tasks in train_tasks for t in tasks],
+                             processes, pool, self.max_cached_days)
+            best = []
+            for tasks in train_tasks:
+                best.append(self._best(rows[:len(tasks)]))
+                rows = rows[len(tasks):]
+
+            # one test backtest per window with its best parameters
+            test_tasks = []
+            for w, (_, test) in enumerate(windows):
+                grid = dict((n, [best[w][n]]) for n in names)
+                out = os.path.join(self.output_dir, "window_%03d" % w, "test")
+                test_tasks.extend(self._sweep(grid, test, out).tasks())
+            test_rows = run_tasks(test_tasks, processes, pool,
+                                  self.max_cached_days)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        table = []
+        curves = []
+        carry = float(self.equity)
+        for w, ((train, test), row) in enumerate(zip(windows, test_rows)):
+            equity = self._oos_equity(row["output_dir"])
+            # continue from the equity the previous window ended with
+            equity = equity - float(self.equity) + carry
+            if len(equity):
+                carry = float(equity.iloc[-1])
+            curves.append(equity)
+            entry = {
+                    "window": w,
+                    "train_start": train[0],
+                    "train_end": train[-1],
+                    "test_start": test[0],
+                    "test_end": test[-1],
+                    }
+            entry.update((n, best[w][n]) for n in names)
+            entry["train_%s" % self.objective] = best[w][self.objective]
+            entry["test_balance"] = row["balance"]
+            entry["test_pnl"] = row["balance"] - float(self.equity)
+            entry["test_max_drawdown"] = row["max_drawdown"]
+            entry["test_trades"] = row["trades"]
+            table.append(entry)
+
+        self.results = pd.DataFrame(table).set_index("window")
+        self.equity_curve = pd.concat(curves).rename("Equity")
+        self.results.to_csv(os.path.join(self.output_dir, "walkforward.csv"))
+        self.equity_curve.to_csv(os.path.join(self.output_dir, "oos_equity.csv"),
+                                 header=True)
+        return self.results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+            description="Walk-forward optimization of strategy parameters")
+    parser.add_argument("--pairs", default="GBPUSD", help="comma separated pairs")
+    parser.add_argument("--strategy", default="ma", choices=sorted(STRATEGIES))
+    parser.add_argument("--param", action="append", type=parse_param,
+                        default=[], help="strategy parameter: name=v1,v2,...")
+    parser.add_argument("--train-days", type=int, default=5)
+    parser.add_argument("--test-days", type=int, default=1)
+    parser.add_argument("--step-days", type=int, default=None)
+    parser.add_argument("--objective", default="balance")
+    parser.add_argument("--minimize", action="store_true",
+                        help="minimize the objective instead of maximizing it")
+    parser.add_argument("--max-iters", type=int, default=None)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--output-dir", default=OUTPUT_RESULT_DIR)
+    parser.add_argument("--max-cached-days", type=int,
+                        default=MAX_CACHED_DAYS)
+    args = parser.parse_args()
+
+    walk = WalkForward(
+            args.pairs.split(","), STRATEGIES[args.strategy], dict(args.param),
+            train_days=args.train_days, test_days=args.test_days,
+            step_days=args.step_days, objective=args.objective,
+            maximize=not args.minimize, max_iters=args.max_iters,
+            output_dir=args.output_dir, processes=args.processes,
+            max_cached_days=args.max_cached_days)
+    started = time.time()
+    results = walk.run()
+    print(results.to_string())
+    print("Out-of-sample equity: %.2f -> %.2f" % (
+            float(walk.equity), walk.equity_curve.iloc[-1]))
+    print("%d windows in %.2fs" % (len(results), time.time() - started))
@@ -0,0 +1,161 @@
+"""
+
+Cursors that hand out ticks from columnar NumPy data.
+
+Building a pandas Series for every tick (DataFrame.iterrows()) and then
+indexing it by label is the most expensive part of streaming historical data.
+A TickCursor instead pulls contiguous slices of the time, bid and ask columns
+of a single pair in blocks, converts each block to plain Python objects in one
+go and then hands out the ticks of the block one by one.
+
+Multi-pair days are combined by merge_cursors, a heap based k-way merge over
+one cursor per pair. Every pair file is already time ordered, so the merge
+only ever holds one tick per pair instead of concatenating and sorting the
+whole day.
+
+When a pair/day arrives as a sequence of column chunks (see
+tickstore.iter_csv_day_chunks), open_cursor chains one cursor per chunk, so
+only a single chunk per pair has to be in memory at any time.
+"""
+import sys
+sys.path.append('../')
+
+import heapq
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+
+
+class TickCursor(object):
+    """
+    Iterator over the ticks of a single pair/day. Every call to next()
+    returns a (time, pair, bid, ask) tuple where time is a pandas Timestamp,
+    pair the currency pair name and bid/ask are floats. If volume columns
+    are given the tuples are (time, pair, bid, ask, bid_volume, ask_volume).
+    """
+
+    def __init__(self, time, bid, ask, pair, block_size=4096,
+                 bid_volume=None, ask_volume=None):
+        """
+        Args:
+            time: int64 array of epoch nanoseconds
+            bid: float array of bid prices
+            ask: float array of ask prices
+            pair: currency pair name
+            block_size: number of ticks converted per block
+            bid_volume, ask_volume: optional float arrays of the volumes
+        """
+        self.time = time
+        self.bid = bid
+        self.ask = ask
+        self.pair = pair
+        self.block_size = block_size
+        self.bid_volume = bid_volume
+        self.ask_volume = ask_volume
+        self.pos = 0
+        self._block = iter(())
+
+    def __len__(self):
+        return len(self.time)
+
+    def __iter__(self):
+        return self
+
+    def _slice(self, start, stop):
+        """
+        Returns the columns of the block [start, stop) as Python lists.
+        """
+        times = pd.DatetimeIndex(
+                np.asarray(self.time[start:stop]).view("datetime64[ns]"))
+        columns = (times.tolist(), self.bid[start:stop].tolist(),
+                   self.ask[start:stop].tolist())
+        if self.bid_volume is not None:
+            columns += (self.bid_volume[start:stop].tolist(),
+                        self.ask_volume[start:stop].tolist())
+        return columns
+
+    def _make_block(self, start, stop):
+        columns = self._slice(start, stop)
+        return zip(columns[0], repeat(self.pair), *columns[1:])
+
+    def _next_block(self):
+        """
+        Converts the next block of the columns into a zip of Python objects.
+        Raises StopIteration when the columns are exhausted.
+        """
+        start = self.pos
+        if start >= len(self.time):
+            raise StopIteration
+        stop = min(start + self.block_size, len(self.time))
+        self.pos = stop
+        self._block = self._make_block(start, stop)
+
+    def __next__(self):
+        try:
+            return next(self._block)
+        except StopIteration:
+            self._next_block()
+            return next(self._block)
+
+
+class KeyedTickCursor(TickCursor):
+    """
+    TickCursor that prefixes every tick with an (epoch nanoseconds, pair
+    index) sort key, so ticks of several pairs can be merged in timestamp
+    order with ties broken by pair order.
+    """
+
+    def __init__(self, time, bid, ask, pair, pair_idx, block_size=4096,
+                 bid_volume=None, ask_volume=None):
+        super(KeyedTickCursor, self).__init__(
+                time, bid, ask, pair, block_size=block_size,
+                bid_volume=bid_volume, ask_volume=ask_volume)
+        self.pair_idx = pair_idx
+
+    def _make_block(self, start, stop):
+        columns = self._slice(start, stop)
+        return zip(self.time[start:stop].tolist(), repeat(self.pair_idx),
+                   columns[0], repeat(self.pair), *columns[1:])
+
+
+def merge_cursors(cursors):
+    """
+    K-way merge of KeyedTickCursors, one per pair. Yields (time, pair, bid,
+    ask) tuples (plus the volumes, if the cursors have them) in timestamp
+    order. Ticks with the same timestamp are returned in pair index order,
+    so the merge is fully deterministic.
+    """
+    for tick in heapq.merge(*cursors):
+        yield tick[2:]
+
+
+def _chunk_cursor(columns, pair, pair_idx, block_size, volumes=False):
+    bid_volume = columns["bid_volume"] if volumes else None
+    ask_volume = columns["ask_volume"] if volumes else None
+    if pair_idx is None:
+        return TickCursor(columns["time"], columns["bid"], columns["ask"],
+                          pair, block_size=block_size,
+                          bid_volume=bid_volume, ask_volume=ask_volume)
+    return KeyedTickCursor(columns["time"], columns["bid"], columns["ask"],
+                           pair, pair_idx, block_size=block_size,
+                           bid_volume=bid_volume, ask_volume=ask_volume)
+
+
+def _chain_chunks(chunks, pair, pair_idx, block_size, volumes):
+    for columns in chunks:
+        for tick in _chunk_cursor(columns, pair, pair_idx, block_size, volumes):
+            yield tick
+
+
+def open_cursor(chunks, pair, pair_idx=None, block_size=4096, volumes=False):
+    """
+    Returns an iterator over the ticks of a single pair/day whose columns are
+    given as a sequence of chunks. Chunks are only consumed when the previous
+    one is exhausted. With a pair_idx the ticks carry the merge key of a
+    KeyedTickCursor, with volumes they also carry the bid/ask volumes.
+    """
+    if isinstance(chunks, list) and len(chunks) == 1:
+        # whole day in memory, no need for the chaining generator
+        return _chunk_cursor(chunks[0], pair, pair_idx, block_size, volumes)
+    return _chain_chunks(chunks, pair, pair_idx, block_size, volumes)
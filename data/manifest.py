@@ -0,0 +1,240 @@
+"""
+
+Manifest of the CSV tick files in a data directory.
+
+For every 'pair_YYYYMMDD.csv' file the manifest records the pair, date, row
+count, first/last timestamp and a coarse time index: the timestamp, row number
+and byte offset of every 'index_step'-th row. It is persisted as JSON next to
+the CSV files (manifest.json) and only files whose size or mtime changed are
+scanned again, so building a price handler no longer lists and matches the
+whole directory, and a backtest can seek straight to the first tick of a
+date range instead of streaming and discarding history.
+
+Usage:
+    python data/manifest.py <csv_dir>
+"""
+import sys
+sys.path.append('../')
+
+import os
+import json
+import bisect
+import argparse
+
+from data.tickstore import FILE_PATTERN
+from data.timeparse import parse_time_column
+
+
+MANIFEST_FILENAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+class TickManifest(object):
+    """
+    Pairs, dates, row counts, first/last timestamps and a coarse time to
+    byte offset index of every CSV tick file in csv_dir.
+    """
+
+    def __init__(self, csv_dir, path=None, index_step=4096, time_format=None):
+        """
+        Args:
+            csv_dir: absolute directory path to the CSV files
+            path: location of the persisted manifest, defaults to
+                csv_dir/manifest.json
+            index_step: number of rows between two time index entries
+            time_format: strptime format of the time column, detected if
+                not given
+        """
+        self.csv_dir = csv_dir
+        self.path = path or os.path.join(csv_dir, MANIFEST_FILENAME)
+        self.index_step = index_step
+        self.time_format = time_format
+        self.dir_mtime_ns = None
+        self.files = {}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return
+        if data.get("version") != MANIFEST_VERSION or \
+                data.get("index_step") != self.index_step:
+            return
+        self.dir_mtime_ns = data.get("dir_mtime_ns")
+        self.files = data.get("files", {})
+
+    def _write(self):
+        data = {
+                "version": MANIFEST_VERSION,
+                "index_step": self.index_step,
+                "dir_mtime_ns": self.dir_mtime_ns,
+                "files": self.files,
+                }
+        with open(self.path, "w") as f:
+            json.dump(data, f)
+
+    def save(self):
+        """
+        Writes the manifest to disk. A read-only data directory is not an
+        error, the manifest is then simply rebuilt on the next run.
+        """
+        try:
+            existed = os.path.exists(self.path)
+            self._write()
+            if not existed:
+                # creating the file changed the mtime of the data directory,
+                # rewriting it in place does not
+                self.dir_mtime_ns = os.stat(self.csv_dir).st_mtime_ns
+                self._write()
+        except (IOError, OSError):
+            return False
+        return True
+
+    def _scan_file(self, filename, st):
+        """
+        Reads a single CSV file once, recording its row count, first/last
+        timestamps and the time index.
+        """
+        m = FILE_PATTERN.match(filename)
+        samples = []
+        offset = 0
+        rows = 0
+        last = None
+        with open(os.path.join(self.csv_dir, filename), "rb") as f:
+            for line in f:
+                if not line.strip():
+                    offset += len(line)
+                    continue
+                if rows % self.index_step == 0:
+                    samples.append((line, rows, offset))
+                last = line
+                rows += 1
+                offset += len(line)
+        index = []
+        first_ns = last_ns = None
+        if rows:
+            stamps = [s[0].split(b",", 1)[0].decode("ascii").strip()
+                      for s in samples]
+            stamps.append(last.split(b",", 1)[0].decode("ascii").strip())
+            ns = parse_time_column(stamps, self.time_format).tolist()
+            index = [[t, row, off] for t, (_, row, off) in zip(ns, samples)]
+            first_ns, last_ns = ns[0], ns[-1]
+        return {
+                "pair": m.group(1),
+                "date": m.group(2),
+                "rows": rows,
+                "first": first_ns,
+                "last": last_ns,
+                "size": st.st_size,
+                "mtime_ns": st.st_mtime_ns,
+                "index": index,
+                }
+
+    def refresh(self, save=True):
+        """
+        Brings the manifest up to date with the data directory. The directory
+        is only listed again if its mtime changed; otherwise only the known
+        files are checked for changes in size or mtime.
+        """
+        changed = False
+        dir_mtime_ns = os.stat(self.csv_dir).st_mtime_ns
+        if dir_mtime_ns != self.dir_mtime_ns:
+            names = [f for f in os.listdir(self.csv_dir)
+                     if FILE_PATTERN.match(f) and f.endswith(".csv")]
+            for f in set(self.files) - set(names):
+                del self.files[f]
+                changed = True
+            self.dir_mtime_ns = dir_mtime_ns
+            changed = True
+        else:
+            names = list(self.files)
+
+        for f in names:
+            try:
+                st = os.stat(os.path.join(self.csv_dir, f))
+            except OSError:
+                self.files.pop(f, None)
+                changed = True
+                continue
+            entry = self.files.get(f)
+            if entry is None or entry["size"] != st.st_size or \
+                    entry["mtime_ns"] != st.st_mtime_ns:
+                self.files[f] = self._scan_file(f, st)
+                changed = True
+
+        if changed and save:
+            self.save()
+        return self
+
+    def filenames(self):
+        """
+        Sorted list of the CSV files in the manifest.
+        """
+        return sorted(self.files)
+
+    def pairs(self):
+        """
+        Sorted list of the currency pairs with at least one file.
+        """
+        return sorted(set(e["pair"] for e in self.files.values()))
+
+    def dates(self, pairs=None, start_date=None, end_date=None):
+        """
+        Sorted list of YYYYMMDD date strings for which every one of pairs has
+        a file, limited to [start_date, end_date] if given.
+        """
+        by_date = {}
+        for e in self.files.values():
+            if pairs is None or e["pair"] in pairs:
+                by_date.setdefault(e["date"], set()).add(e["pair"])
+        needed = set(pairs) if pairs is not None else None
+        dates = []
+        for d, present in by_date.items():
+            if needed is not None and not needed <= present:
+                continue
+            if start_date is not None and d < start_date:
+                continue
+            if end_date is not None and d > end_date:
+                continue
+            dates.append(d)
+        dates.sort()
+        return dates
+
+    def entry(self, pair, date_str):
+        """
+        Manifest entry of a single pair/day, or None.
+        """
+        return self.files.get("%s_%s.csv" % (pair, date_str))
+
+    def locate(self, pair, date_str, time_ns):
+        """
+        Returns the (row, byte offset) of a time index point that lies before
+        the first tick at or after time_ns. Reading the file from there and
+        skipping the few earlier ticks avoids parsing the rest of the day.
+        """
+        e = self.entry(pair, date_str)
+        if e is None or not e["index"]:
+            return 0, 0
+        stamps = [point[0] for point in e["index"]]
+        # last index point strictly before time_ns, so no tick at time_ns
+        # is skipped
+        i = bisect.bisect_left(stamps, time_ns) - 1
+        if i < 0:
+            return 0, 0
+        return e["index"][i][1], e["index"][i][2]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+            description="Build or refresh the manifest of a CSV tick directory")
+    parser.add_argument("csv_dir", help="directory with pair_YYYYMMDD.csv files")
+    parser.add_argument("--index-step", type=int, default=4096,
+                        help="rows between two time index entries")
+    args = parser.parse_args()
+
+    manifest = TickManifest(args.csv_dir, index_step=args.index_step).refresh()
+    for f in manifest.filenames():
+        e = manifest.files[f]
+        print("%s: %s rows, %s index points" % (f, e["rows"], len(e["index"])))
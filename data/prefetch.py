@@ -0,0 +1,92 @@
+"""
+
+Background loading of historical trading days.
+
+While the backtest streams day N a worker thread already loads and decodes
+the following days. Days are loaded strictly in order and handed out in
+order, so the tick stream stays fully deterministic. At most 'lookahead'
+decoded days wait in the queue at any time.
+"""
+import sys
+sys.path.append('../')
+
+import threading
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+
+class DayPrefetcher(object):
+    """
+    Loads the given dates on a worker thread with load_day(date_str) and
+    hands the results out in the same order via get().
+    """
+
+    def __init__(self, load_day, dates, lookahead=1):
+        """
+        Args:
+            load_day: function that loads and decodes a single date
+            dates: list of date strings to load, in streaming order
+            lookahead: maximum number of loaded days waiting to be used
+        """
+        self.load_day = load_day
+        self.dates = list(dates)
+        self.days = queue.Queue(maxsize=max(1, lookahead))
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="DayPrefetcher")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _put(self, item):
+        """
+        Blocks until there is room in the queue, unless we are shutting down.
+        Returns False if the prefetcher was closed in the meantime.
+        """
+        while not self._stop.is_set():
+            try:
+                self.days.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(self):
+        for date_str in self.dates:
+            if self._stop.is_set():
+                return
+            try:
+                item = (date_str, self.load_day(date_str), None)
+            except Exception as e:
+                # the error is raised on the consumer side by get()
+                item = (date_str, None, e)
+            if not self._put(item) or item[2] is not None:
+                return
+        # sentinel: no more dates
+        self._put((None, None, None))
+
+    def get(self):
+        """
+        Returns the next (date_str, day) tuple, or (None, None) when all the
+        dates were handed out. Errors of the worker are raised here.
+        """
+        date_str, day, error = self.days.get()
+        if error is not None:
+            raise error
+        if date_str is None:
+            # keep returning the sentinel on repeated calls
+            self.days.put((None, None, None))
+        return date_str, day
+
+    def close(self):
+        """
+        Stops the worker thread and drops every prefetched day.
+        """
+        self._stop.set()
+        while True:
+            try:
+                self.days.get(False)
+            except queue.Empty:
+                break
+        self.thread.join()
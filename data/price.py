@@ -2,12 +2,16 @@ import sys
 sys.path.append('../')
 
 import os
-import re
+import itertools
 import pandas as pd
-from decimal import Decimal, getcontext, ROUND_HALF_DOWN
 
 import settings
-from event.event import TickEvent
+from event.event import TickEvent, VolumeTickEvent, TickBatchEvent
+from numeric.numeric import get_backend
+from data import tickstore
+from data.cursor import open_cursor, merge_cursors
+from data.prefetch import DayPrefetcher
+from data.manifest import TickManifest
 
 class PriceHandler(object):
     """
@@ -22,8 +26,14 @@ class PriceHandler(object):
     tick data would be streamed via brokerage. Thus a historic and live
     system will be treated identically by the rest of the backtesting 
     suite.
+    
+    All prices are represented by the numeric backend of the handler (see
+    numeric/numeric.py), Decimal by default. Positions and portfolios use
+    the backend of the ticker they are given.
     """
     
+    numeric = get_backend()
+    
     def _set_up_prices_dict(self):
         """
         Due to the way that the Position  object handles P&L
@@ -52,6 +62,37 @@ class PriceHandler(object):
         
         prices_dict.update(inv_prices_dict) # ???? why?
         return prices_dict
+    
+    def _set_up_readiness(self):
+        """
+        Tracks which entries of the prices dict hold a bid and an ask, so the
+        portfolio does not have to scan the dict before every order. A pair
+        and its inverse flip to ready once, on the first tick of the pair;
+        'unpriced' counts the pairs that have not been ticked yet.
+        """
+        self.priced = set()
+        self.unpriced = len(set(min(p, "%s%s" % (p[3:], p[:3]))
+                                for p in self.pairs))
+    
+    def _mark_priced(self, pair):
+        if pair not in self.priced:
+            self.priced.add(pair)
+            self.priced.add("%s%s" % (pair[3:], pair[:3]))
+            self.unpriced -= 1
+    
+    def prices_ready(self, pairs=None):
+        """
+        Whether the prices dict holds a bid and an ask for each of the given
+        entries (pairs or inverse pairs), or for every entry if no pairs are
+        given. Constant time per requested pair.
+        """
+        if pairs is None:
+            return self.unpriced == 0
+        priced = self.priced
+        for pair in pairs:
+            if pair not in priced:
+                return False
+        return True
         
     def invert_prices(self, pair, bid, ask):
         """
@@ -59,14 +100,20 @@ class PriceHandler(object):
         bid/ask of 'GBPUSD' into bid/ask for 'USDGBP' and place them in
         the prices dicrionary.
         """
-        getcontext().rounding = ROUND_HALF_DOWN
         # inv_pair = "%s_%s" % (pair[3:], pair[:3]) - original code with '_' - CONFIRM THAT THIS IS WRONG!!!
         inv_pair = "%s%s" % (pair[3:], pair[:3])
-        inv_bid = (Decimal('1.0')/bid).quantize(Decimal('0.00001'))
-        inv_ask = (Decimal('1.0')/ask).quantize(Decimal('0.00001'))
+        inv_bid = self.numeric.invert(bid)
+        inv_ask = self.numeric.invert(ask)
         
         return inv_pair, inv_bid, inv_ask
     
+    def close(self):
+        """
+        Releases any resources held by the price handler. Nothing to do by
+        default.
+        """
+        pass
+    
 class HistoricCSVPriceHandler(PriceHandler):
     """
     HistoricCSVPriceHandler is designed to read CSV files of tick data for
@@ -74,7 +121,10 @@ class HistoricCSVPriceHandler(PriceHandler):
     queue.
     """
     
-    def __init__(self, pairs, events_queue, csv_dir):
+    def __init__(self, pairs, events_queue, csv_dir, block_size=4096,
+                 prefetch=0, chunk_size=None, time_format=None, cache_dir=None,
+                 start=None, end=None, numeric=None, day_cache=None,
+                 volumes=False):
         """
         Initialises the historic data handelr by requesting the location of
         the CSV files and a list of symbols.
@@ -87,12 +137,50 @@ class HistoricCSVPriceHandler(PriceHandler):
             pairs: the list of currency pairs to obtain
             events_queue: the events queue to send the ticks to
             csv_dir: absolute directory path to the CSV files
+            block_size: number of ticks the day cursor converts at once
+            prefetch: number of days to load ahead on a background thread,
+                0 loads every day synchronously
+            chunk_size: if set, every pair file is read lazily in chunks of
+                chunk_size rows, so peak memory is bounded by
+                len(pairs) * chunk_size ticks instead of the day length.
+                With prefetch only the first chunk of every pair is read
+                ahead; the following chunks are read while the day is
+                streamed
+            time_format: strptime format of the time column, e.g.
+                '%d.%m.%Y %H:%M:%S.%f'. Detected from the first row if not
+                given
+            cache_dir: if set, parsed days are kept in this directory (keyed
+                by file path, size and mtime) and mapped on later runs
+            start: first tick time to stream (datetime, Timestamp or string),
+                the stream starts at the first available tick if not given
+            end: last tick time to stream, streams until the end of the data
+                if not given
+            numeric: numeric backend of the prices, 'decimal' (default) or
+                'pipette' (see numeric/numeric.py)
+            day_cache: if set, a dict in which the parsed days are kept in
+                memory, so handlers of later backtests in the same process
+                sharing the dict do not load them again
+            volumes: if True the ticks are sent as VolumeTickEvents that
+                also carry the bid/ask volumes of the data files
         """
+        self.numeric = get_backend(numeric)
         self.pairs = pairs
         self.csv_dir = csv_dir
+        self.block_size = block_size
+        self.chunk_size = chunk_size
+        self.time_format = time_format
+        self.cache_dir = cache_dir
+        self.day_cache = day_cache
+        self.volumes = volumes
+        self.start = None if start is None else pd.Timestamp(start)
+        self.end = None if end is None else pd.Timestamp(end)
+        self.prefetcher = None
         # prices structure -> self.prices[instrument]['bid']
         self.prices = self._set_up_prices_dict()
-        self.pair_frames = {}
+        self._set_up_readiness()
+        # pairs, dates and time index of the CSV files in csv_dir
+        self.manifest = TickManifest(
+                csv_dir, time_format=time_format).refresh()
         # date container for all available CSV files
         self.file_dates = self._list_all_file_dates()
         # index of CSV date that is currently used
@@ -100,63 +188,195 @@ class HistoricCSVPriceHandler(PriceHandler):
         # data container that combines data of all CCY pairs on current date
         self.cur_date_pairs = self._open_convert_csv_files_for_day(
                 self.file_dates[self.cur_date_idx])
+        # first tick of the next batch, read ahead by stream_next_batch
+        self._pending_tick = None
+        # load and decode the following days while the current one is streamed
+        if prefetch > 0:
+            self.prefetcher = DayPrefetcher(
+                    self._prefetch_day, self.file_dates[self.cur_date_idx+1:],
+                    lookahead=prefetch)
         # Flag that signals backtesting function to stop. It's set to True when
         # we run out of historical data.
         self.continue_backtest = True
         self.events_queue = events_queue
+    
+    @property
+    def continue_backtest(self):
+        return self._continue_backtest
+    
+    @continue_backtest.setter
+    def continue_backtest(self, value):
+        # stop loading days in the background once the backtest is over
+        self._continue_backtest = value
+        if not value:
+            self.close()
+    
+    def close(self):
+        """
+        Stops the background prefetching of days, if it is running.
+        """
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+            self.prefetcher = None
       
     def _list_all_csv_files(self):
-        files = os.listdir(settings.CSV_DATA_DIR)
-        # pattert to recognize files named as: EURUSD_20180706.csv
-        pattern = re.compile("[A-Z]{6}_\d{8}.csv")
-        matching_files = [f for f in files if pattern.search(f)]
-        matching_files.sort()
-        return matching_files
+        """
+        Returns the sorted list of CSV files named as: EURUSD_20180706.csv
+        in csv_dir, as recorded by the manifest.
+        """
+        return self.manifest.filenames()
+    
+    def _date_range(self):
+        """
+        Returns the (start, end) YYYYMMDD date strings of the requested time
+        range, None where the range is open.
+        """
+        start_date = None if self.start is None else self.start.strftime("%Y%m%d")
+        end_date = None if self.end is None else self.end.strftime("%Y%m%d")
+        return start_date, end_date
     
     def _list_all_file_dates(self):
         """
-        Removes the pair, underscore and '.csv' from the dates and eliminates
-        duplicates. Returns a list of date strings of the form YYYYMMDD
+        Returns a sorted list of date strings of the form YYYYMMDD for which
+        every requested pair has a CSV file, limited to the start/end range.
         """
-        csv_files = self._list_all_csv_files()
-        de_dup_csv = list(set(d[7:-4] for d in csv_files))
-        de_dup_csv.sort()
-        return de_dup_csv
+        start_date, end_date = self._date_range()
+        return self.manifest.dates(self.pairs, start_date, end_date)
     
-    def _open_convert_csv_files_for_day(self, date_str):
+    def _time_bounds(self):
+        """
+        Start and end of the requested time range as epoch nanoseconds.
+        """
+        start_ns = None if self.start is None else self.start.value
+        end_ns = None if self.end is None else self.end.value
+        return start_ns, end_ns
+    
+    def _start_offset(self, pair, date_str):
+        """
+        Byte offset in the CSV file of pair/date from which reading has to
+        start, found through the manifest time index. Only the first day of
+        a range starting after midnight has an offset.
+        """
+        if self.start is None or date_str != self.start.strftime("%Y%m%d"):
+            return 0
+        return self.manifest.locate(pair, date_str, self.start.value)[1]
+    
+    def _load_day_columns(self, pair, date_str, offset=0):
+        """
+        Parses the CSV file of a single pair/day into NumPy columns
+        (see tickstore.read_csv_day), going through the parsed-day cache if
+        there is one. Without a cache, parsing starts at the byte offset.
+        """
+        pairs_path = os.path.join(self.csv_dir, "%s_%s.csv" % (pair, date_str))
+        if self.cache_dir:
+            return tickstore.read_csv_day_cached(
+                    pairs_path, self.cache_dir, self.time_format)
+        return tickstore.read_csv_day(pairs_path, self.time_format, offset)
+    
+    def _cached_day_columns(self, pair, date_str, offset=0):
+        """
+        Returns the columns of a single pair/day from the in-memory day
+        cache, loading them with _load_day_columns if they are not cached.
+        """
+        if self.day_cache is None:
+            return self._load_day_columns(pair, date_str, offset)
+        key = (type(self).__name__, self.csv_dir, pair, date_str, offset)
+        columns = self.day_cache.get(key)
+        if columns is None:
+            columns = self._load_day_columns(pair, date_str, offset)
+            self.day_cache[key] = columns
+        return columns
+    
+    def _load_day_chunks(self, pair, date_str, offset=0):
+        """
+        Lazily parses the CSV file of a single pair/day into NumPy column
+        chunks of at most self.chunk_size rows.
+        """
+        pairs_path = os.path.join(self.csv_dir, "%s_%s.csv" % (pair, date_str))
+        if self.cache_dir:
+            columns = tickstore.open_cached_day(pairs_path, self.cache_dir)
+            if columns is not None:
+                return tickstore.iter_column_chunks(columns, self.chunk_size)
+        return tickstore.iter_csv_day_chunks(
+                pairs_path, self.chunk_size, self.time_format, offset)
+    
+    def _load_day(self, date_str):
         """
         Opens the CSV files from the data directory, converting them into
-        pandas DataFrame within a pairs dictionary.
-        
-        The function then concatenates all of the seperate pairs for a single
-        day into a single data frame that is time orderd, allowing tick data
-        events to be added to the queie in a chronological fashion.
+        NumPy columns for every pair. Returns a list of (pair, chunks)
+        tuples in the order of self.pairs. Without a chunk_size the whole
+        day of a pair is a single chunk, otherwise chunks is a lazy iterator.
         """
+        start_ns, end_ns = self._time_bounds()
+        day = []
         for p in self.pairs:
-            pairs_path = os.path.join(self.csv_dir, "%s_%s.csv" % (p, date_str))
-            self.pair_frames[p] = pd.read_csv(
-                    pairs_path, header=None, index_col=0, parse_dates=True,
-                    dayfirst=True,
-                    names=("Time", "Bid", "Ask", "BidVolume", "AskVolume")) # BIdVolume and AskVolume?!
-            # since first column is Time and index_col is set to 0
-            # index column will be Time  
-            self.pair_frames[p]['Pair'] = p
-            #print(self.pair_frames)
-            #tmp = pd.concat(self.pair_frames.values())
-            #print(tmp)
-        return pd.concat(self.pair_frames.values()).sort_index().iterrows() 
-    # original code was:
-    # pd.concat(self.pair_frames.values()).sort_index().iterrows()
-    # the sort() was depreciated for DataFrame in favor of sort_value() and 
-    # sort_index()
-    # I've assumed the sorting needs to be done on Time level so i've used
-    # sort_index() - CONFIRM THIS!
+            offset = self._start_offset(p, date_str)
+            if self.chunk_size:
+                chunks = self._load_day_chunks(p, date_str, offset)
+                if start_ns is not None or end_ns is not None:
+                    chunks = tickstore.clip_chunks(chunks, start_ns, end_ns)
+            else:
+                columns = self._cached_day_columns(p, date_str, offset)
+                chunks = [tickstore.clip_columns(columns, start_ns, end_ns)]
+            day.append((p, chunks))
+        return day
+    
+    def _prefetch_day(self, date_str):
+        """
+        Loads a day on the prefetch thread. Lazy chunks would only be read
+        once the day is streamed, so the first chunk of every pair is read
+        here already; the chunks after it are still read lazily, keeping
+        the memory bound of chunk_size.
+        """
+        day = self._load_day(date_str)
+        if not self.chunk_size:
+            return day
+        prefetched = []
+        for p, chunks in day:
+            chunks = iter(chunks)
+            first = next(chunks, None)
+            if first is not None:
+                chunks = itertools.chain([first], chunks)
+            prefetched.append((p, chunks))
+        return prefetched
+    
+    def _open_day(self, day):
+        """
+        Every pair file is already time ordered, so the seperate pairs for a
+        single day are combined by a streaming k-way merge, allowing tick
+        data events to be added to the queie in a chronological fashion.
+        Ticks with the same timestamp keep the order of self.pairs.
+        
+        Returns an iterator that hands out (time, pair, bid, ask) tuples.
+        """
+        if len(day) == 1:
+            p, chunks = day[0]
+            return open_cursor(chunks, p, block_size=self.block_size,
+                               volumes=self.volumes)
+        return merge_cursors([
+                open_cursor(chunks, p, pair_idx=i, block_size=self.block_size,
+                            volumes=self.volumes)
+                for i, (p, chunks) in enumerate(day)])
+    
+    def _open_convert_csv_files_for_day(self, date_str):
+        """
+        Loads a single day and returns an iterator over its ticks.
+        """
+        return self._open_day(self._load_day(date_str))
     
     def _update_csv_for_day(self):
         """
         Function that adds CCY pairs data to data container for next date.
         If date is not available returns False. 
         """
+        if self.prefetcher is not None:
+            # the next day was already loaded by the background thread
+            next_date, day = self.prefetcher.get()
+            if next_date is None:
+                return False
+            self.cur_date_pairs = self._open_day(day)
+            self.cur_date_idx += 1
+            return True
         try:
             # go to the next date in a list of CVS file dates
             next_date = self.file_dates[self.cur_date_idx+1]
@@ -169,40 +389,35 @@ class HistoricCSVPriceHandler(PriceHandler):
             self.cur_date_idx += 1
             return True
         
-    def stream_next_tick(self):
+    def _next_tick(self):
         """
-        The Backtester is run on single thread in order to fully reproduce
-        results on each run. This means that the stream_to_queue method is
-        replaced by stream_next_tick.
-        
-        This method is called by the ebacktesting function outside of this
-        class and places a single tick onto the queue, as well as updating 
-        the current bid/ask and inverse bid/ask.
+        Returns the next (time, pair, bid, ask) tuple of the data, moving on
+        to the next day when the current one is exhausted, or None at the
+        end of the data.
         """
-        try:
-            # index = Time, we have rows since we used .iterrows() to create 
-            # the container
-            index, row = next(self.cur_date_pairs)
-        except StopIteration:
-            # End of the current days date
-            if self._update_csv_for_day():
-                index, row = next(self.cur_date_pairs)
-            else: # End of the data
-                self.continue_backtest = False
-                print("Continue Backtest: False. End of available historical data")
-                return
-            
-        getcontext().rounding = ROUND_HALF_DOWN
-        # TODO:
-        # how to set this for whole class so i dont have to re-specified it 
-        # in every function? - is it simpel as doing:
-        # getcontext().rounding = ROUND_HALF_DOWN in def __init__() ?
-        
-        pair = row['Pair']
-        bid = Decimal(str(row['Bid'])).quantize(
-                Decimal("0.00001"))
-        ask = Decimal(str(row['Ask'])).quantize(
-                Decimal("0.00001"))
+        if self._pending_tick is not None:
+            tick, self._pending_tick = self._pending_tick, None
+            return tick
+        while True:
+            try:
+                # index = Time of the tick, the cursor hands out plain tuples
+                return next(self.cur_date_pairs)
+            except StopIteration:
+                # End of the current days date, days without any tick in
+                # the requested range are skipped
+                if not self._update_csv_for_day(): # End of the data
+                    self.continue_backtest = False
+                    print("Continue Backtest: False. End of available historical data")
+                    return None
+    
+    def _update_prices(self, pair, index, bid, ask):
+        """
+        Converts the quotes with the numeric backend and stores them, and
+        their inverse, as the current prices. Returns the converted bid/ask.
+        """
+        # Rounding (ROUND_HALF_DOWN) is handled by the numeric backend
+        bid = self.numeric.price(bid)
+        ask = self.numeric.price(ask)
 
         # Create decimalised prices for traded pair
         # self.prices[instrument]['bid'] = bid
@@ -212,17 +427,160 @@ class HistoricCSVPriceHandler(PriceHandler):
         
         # Create decimalised prices for inverted pair
         inv_pair, inv_bid, inv_ask = self.invert_prices(pair, bid, ask)
-        #print("Pair: %s, Bid: %s, Ask: %s" %(pair, bid, ask))
-        #print("Inv_pair: %s, Inv_bid: %s, Inv_ask: %s" %(inv_pair, inv_bid, inv_ask))
         self.prices[inv_pair]['bid'] = inv_bid
         self.prices[inv_pair]['ask'] = inv_ask
         self.prices[inv_pair]['time'] = index # index = TIme of a data row
+        if self.unpriced:
+            self._mark_priced(pair)
+        return bid, ask
+        
+    def stream_next_tick(self):
+        """
+        The Backtester is run on single thread in order to fully reproduce
+        results on each run. This means that the stream_to_queue method is
+        replaced by stream_next_tick.
         
-        #print("self.prices: ", self.prices)
-        # Create the tick event for the queue
-        tick_event = TickEvent(pair, index, bid, ask)
+        This method is called by the ebacktesting function outside of this
+        class and places a single tick onto the queue, as well as updating 
+        the current bid/ask and inverse bid/ask.
+        """
+        tick = self._next_tick()
+        if tick is None:
+            return
+        if self.volumes:
+            index, pair, bid, ask, bid_volume, ask_volume = tick
+            bid, ask = self._update_prices(pair, index, bid, ask)
+            tick_event = VolumeTickEvent(
+                    pair, index, bid, ask, bid_volume, ask_volume)
+        else:
+            index, pair, bid, ask = tick
+            bid, ask = self._update_prices(pair, index, bid, ask)
+            # Create the tick event for the queue
+            tick_event = TickEvent(pair, index, bid, ask)
         self.events_queue.put(tick_event)
         
+    def stream_next_batch(self, max_ticks):
+        """
+        Places a TickBatchEvent with up to max_ticks consecutive ticks of a
+        single pair onto the queue. The batch ends early where the stream
+        switches to another pair, so the ticks keep their global order. The
+        prices of the batch are converted with the numeric backend, like
+        those of a TickEvent, and the current prices are those of the last
+        tick of the batch. If the data
+        ends within the batch, continue_backtest is already False when the
+        batch is put onto the queue.
         
+        Returns the number of ticks in the batch, 0 at the end of the data.
+        """
+        tick = self._next_tick()
+        if tick is None:
+            return 0
+        pair = tick[1]
+        times, bids, asks = [tick[0]], [tick[2]], [tick[3]]
+        while len(times) < max_ticks:
+            tick = self._next_tick()
+            if tick is None:
+                break
+            if tick[1] != pair:
+                self._pending_tick = tick
+                break
+            times.append(tick[0])
+            bids.append(tick[2])
+            asks.append(tick[3])
+        price = self.numeric.price
+        bid, ask = self._update_prices(pair, times[-1], bids[-1], asks[-1])
+        bids = [price(b) for b in bids[:-1]]
+        asks = [price(a) for a in asks[:-1]]
+        bids.append(bid)
+        asks.append(ask)
+        self.events_queue.put(TickBatchEvent(pair, times, bids, asks))
+        return len(times)
+
+
+class HistoricTickStorePriceHandler(HistoricCSVPriceHandler):
+    """
+    HistoricTickStorePriceHandler streams ticks from the columnar binary
+    tick store (see data/tickstore.py) instead of parsing the CSV files on
+    every run.
+    
+    Each pair/day is memory-mapped, so repeated backtests skip the parsing
+    completely and many backtest processes share the OS page cache. A day
+    that is missing from the store is converted from its CSV file the first
+    time it is requested.
+    """
+    
+    def __init__(self, pairs, events_queue, csv_dir, store_dir=None,
+                 block_size=4096, prefetch=0, chunk_size=None,
+                 time_format=None, start=None, end=None, numeric=None,
+                 day_cache=None, volumes=False):
+        """
+        Args:
+            pairs: the list of currency pairs to obtain
+            events_queue: the events queue to send the ticks to
+            csv_dir: absolute directory path to the CSV files
+            store_dir: absolute directory path to the tick store, defaults
+                to settings.TICK_STORE_DIR
+            block_size: number of ticks the day cursor converts at once
+            prefetch: number of days to load ahead on a background thread
+            chunk_size: if set, the mapped columns are streamed in views of
+                chunk_size rows
+            time_format: strptime format of the time column of CSV files
+                that still have to be converted
+            start: first tick time to stream
+            end: last tick time to stream
+            numeric: numeric backend of the prices
+            day_cache: dict in which the mapped days are kept in memory
+            volumes: send VolumeTickEvents with the bid/ask volumes
+        """
+        if store_dir is None:
+            store_dir = settings.TICK_STORE_DIR
+        self.store_dir = store_dir
+        super(HistoricTickStorePriceHandler, self).__init__(
+                pairs, events_queue, csv_dir, block_size=block_size,
+                prefetch=prefetch, chunk_size=chunk_size,
+                time_format=time_format, start=start, end=end, numeric=numeric,
+                day_cache=day_cache, volumes=volumes)
         
-                    
\ No newline at end of file
+    def _list_all_file_dates(self):
+        """
+        Dates are collected from both the store and the CSV directory, so the
+        CSV files can be removed once they were converted.
+        """
+        start_date, end_date = self._date_range()
+        by_date = {}
+        for p, d in tickstore.list_store_days(self.store_dir):
+            if p in self.pairs:
+                by_date.setdefault(d, set()).add(p)
+        store_dates = set(
+                d for d, present in by_date.items()
+                if len(present) == len(set(self.pairs)) and
+                (start_date is None or d >= start_date) and
+                (end_date is None or d <= end_date))
+        csv_dates = set(
+                super(HistoricTickStorePriceHandler, self)._list_all_file_dates())
+        return sorted(store_dates | csv_dates)
+    
+    def _load_day_columns(self, pair, date_str, offset=0):
+        """
+        Returns the memory-mapped columns of a single pair/day, converting
+        the CSV file into the store if necessary. The whole day is always
+        mapped, so the byte offset is not needed.
+        """
+        columns = tickstore.open_day(self.store_dir, pair, date_str)
+        if columns is None:
+            csv_path = os.path.join(
+                    self.csv_dir, "%s.csv" % tickstore.day_name(pair, date_str))
+            os.makedirs(self.store_dir, exist_ok=True)
+            tickstore.write_day(
+                    self.store_dir, pair, date_str,
+                    tickstore.read_csv_day(csv_path, self.time_format))
+            columns = tickstore.open_day(self.store_dir, pair, date_str)
+        return columns
+    
+    def _load_day_chunks(self, pair, date_str, offset=0):
+        """
+        The mapped columns are only paged in when they are read, so the
+        chunks are simply views of chunk_size rows.
+        """
+        return tickstore.iter_column_chunks(
+                self._load_day_columns(pair, date_str), self.chunk_size)
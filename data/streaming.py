@@ -6,15 +6,16 @@ Streaming using OANDA REST V20.
 import sys
 sys.path.append('../')
 
-from decimal import Decimal, getcontext, ROUND_HALF_DOWN
 import logging
 import json
+import threading
 
 import requests
 from requests.exceptions import ConnectionError
 
 from event.event import TickEvent
 from data.price import PriceHandler
+from numeric.numeric import get_backend
 
 import oandapyV20
 from oandapyV20 import API
@@ -24,27 +25,21 @@ from oandapyV20.endpoints.pricing import PricingStream
 
 
 class StreamingForexPrices(PriceHandler):
-    def __init__(self, domain, access_token, account_id, pairs, events_queue):
+    def __init__(self, domain, access_token, account_id, pairs, events_queue,
+                 numeric=None):
+        self.numeric = get_backend(numeric)
         self.domain = domain
         self.access_token = access_token
         self.account_id = account_id
         self.pairs = pairs
         self.events_queue = events_queue
         self.prices = self._set_up_prices_dict() # inherited from PriceHandler
+        self._set_up_readiness()
         self.logger = logging.getLogger(__name__)
+        self.request = None
+        self.client = None
+        self.stop_event = threading.Event()
         
-    def invert_prices(self, pair, bid, ask):
-        """
-        Simply inverts the prices for a particular currency pair.
-        This will turn the bid/ask of "GBPUSD" into bid/ask for
-        "USDGBP" and palce them in the prices dictionary.
-        """
-        getcontext().rounding = ROUND_HALF_DOWN
-        inv_pair = "%s%s" % (pair[3:], pair[:3])
-        inv_bid = (Decimal("1.0")/bid).quantize(Decimal("0.00001"))
-        inv_ask = (Decimal("1.0")/ask).quantize(Decimal("0.00001"))
-        return inv_pair, inv_bid, inv_ask
-    
     def connect_to_stream(self):
         """
         Converts CCY pair to OANDA style pair.
@@ -59,8 +54,30 @@ class StreamingForexPrices(PriceHandler):
         params = {"instruments": pairs_list}
         client = API(access_token=self.access_token, environment=self.domain)
         request = PricingStream(accountID=self.account_id, params=params)
+        self.client = client
+        self.request = request
         return client.request(request)
     
+    def stop(self):
+        """
+        Asks stream_to_queue to return. It returns before the next message,
+        at the latest with the next heartbeat of the stream (every 5
+        seconds), and closes the stream on its own thread.
+        
+        Can be called from any thread. The HTTP session of the stream is
+        closed as well, but nothing is thrown into the stream generator
+        (as PricingStream.terminate() does): that fails with "generator
+        already executing" while the price thread reads the stream.
+        """
+        self.stop_event.set()
+        session = getattr(self.client, "client", None)
+        if session is not None:
+            try:
+                session.close()
+            except Exception as e:
+                self.logger.warning("Could not close the price stream "
+                                    "session: %s" % e)
+    
     def stream_to_queue(self):
         """
         Receives responce from OANDA request. Checks if 'instrument' or 'tick'
@@ -77,16 +94,15 @@ class StreamingForexPrices(PriceHandler):
         #   return
         try:
             for msg in response:
+                if self.stop_event.is_set():
+                    break
                 if 'instrument' in msg or 'tick' in msg:
                     print(msg)
                     self.logger.debug(msg)
-                    getcontext().rounding = ROUND_HALF_DOWN
                     instrument = msg['instrument'].replace("_","")
                     time = msg['time']
-                    bid = Decimal(str(msg['bids'][0]['price'])).quantize(
-                            Decimal("0.00001"))
-                    ask = Decimal(str(msg['asks'][0]['price'])).quantize(
-                            Decimal("0.00001"))
+                    bid = self.numeric.price(msg['bids'][0]['price'])
+                    ask = self.numeric.price(msg['asks'][0]['price'])
                     print("Bid: %s, Ask: %s" % (bid, ask))
                     self.prices[instrument]['bid'] = bid
                     self.prices[instrument]['ask'] = ask
@@ -95,6 +111,10 @@ class StreamingForexPrices(PriceHandler):
                     self.prices[inv_pair]['bid'] = inv_bid
                     self.prices[inv_pair]['ask'] = inv_ask
                     self.prices[inv_pair]['time'] = time
+                    # flagged only once both prices are set, the trading
+                    # thread may check the readiness at any time
+                    if self.unpriced:
+                        self._mark_priced(instrument)
                     
                     tick_event = TickEvent(instrument, time, bid, ask)
                     self.events_queue.put(tick_event)
@@ -104,10 +124,21 @@ class StreamingForexPrices(PriceHandler):
         except V20Error as e:
             # catch API related errors that may occur
             self.logger.error(str(e))
-        except ConnectionError as e:
-            self.logger.error(str(e))
-        except StreamTerminated as e:
-            self.logger.error(str(e))
+        except (ConnectionError, StreamTerminated) as e:
+            # closing the session in stop() may break the connection
+            if self.stop_event.is_set():
+                self.logger.info(str(e))
+            else:
+                self.logger.error(str(e))
         except Exception as e:
-            self.logger.error('Unidentified connection error: '.format(str(e))) 
+            self.logger.error('Unidentified connection error: {}'.format(str(e)))
+        finally:
+            # the generator is only closed on the thread that iterates it
+            close = getattr(response, "close", None)
+            if close is not None:
+                try:
+                    close()
+                except Exception as e:
+                    self.logger.warning("Could not close the price stream: %s"
+                                        % e) 
             
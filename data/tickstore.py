@@ -0,0 +1,300 @@
+"""
+
+Columnar tick store.
+
+Converts the text tick files (e.g. GBPUSD_20180703.csv) into fixed-width
+binary columns that can be memory-mapped. Every pair/day gets its own
+directory inside the store directory:
+
+    GBPUSD_20180703/time.npy        int64 epoch nanoseconds
+    GBPUSD_20180703/bid.npy         float64
+    GBPUSD_20180703/ask.npy         float64
+    GBPUSD_20180703/bid_volume.npy  float64
+    GBPUSD_20180703/ask_volume.npy  float64
+
+The conversion is done once. After that every backtest maps the columns
+straight from disk, so repeat runs skip CSV parsing and several backtest
+processes share the same OS page cache.
+
+The same column layout is used by the parsed-day cache (read_csv_day_cached),
+which keys every entry by the path, size and mtime of its CSV file.
+
+Usage:
+    python data/tickstore.py <csv_dir> <store_dir>
+"""
+import sys
+sys.path.append('../')
+
+import os
+import re
+import shutil
+import hashlib
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from data.timeparse import parse_time_column, detect_time_format
+
+
+# Column name and fixed-width dtype of every stored column
+COLUMNS = (
+        ("time", "<i8"),
+        ("bid", "<f8"),
+        ("ask", "<f8"),
+        ("bid_volume", "<f8"),
+        ("ask_volume", "<f8"),
+        )
+
+# pattern to recognize files and store entries named as: EURUSD_20180706
+FILE_PATTERN = re.compile(r"^([A-Z]{6})_(\d{8})(\.csv)?$")
+
+
+def day_name(pair, date_str):
+    """
+    Name of the CSV file (without extension) and the store entry of a day.
+    """
+    return "%s_%s" % (pair, date_str)
+
+
+# pd.read_csv arguments of the CSV tick files. The time column is kept as
+# text and parsed by data.timeparse, which is much faster than letting pandas
+# infer the format with dayfirst=True.
+CSV_OPTIONS = dict(
+        header=None, names=("Time", "Bid", "Ask", "BidVolume", "AskVolume"),
+        dtype={"Time": str})
+
+
+def _frame_to_columns(df, time_format=None):
+    """
+    Converts a CSV frame into a dictionary of NumPy columns. The time column
+    is parsed into int64 epoch nanoseconds.
+    """
+    return {
+            "time": parse_time_column(df["Time"].values, time_format),
+            "bid": df["Bid"].values.astype(np.float64),
+            "ask": df["Ask"].values.astype(np.float64),
+            "bid_volume": df["BidVolume"].values.astype(np.float64),
+            "ask_volume": df["AskVolume"].values.astype(np.float64),
+            }
+
+
+def read_csv_day(path, time_format=None, offset=0):
+    """
+    Parses a single pair/day CSV file into a dictionary of NumPy columns.
+    
+    Args:
+        path: path to the CSV file
+        time_format: strptime style format of the time column, detected
+            from the first row if not given
+        offset: byte offset of the first row to read (see TickManifest)
+    """
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return _frame_to_columns(pd.read_csv(f, **CSV_OPTIONS), time_format)
+
+
+def iter_csv_day_chunks(path, chunk_size, time_format=None, offset=0):
+    """
+    Parses a single pair/day CSV file lazily, yielding dictionaries of NumPy
+    columns of at most chunk_size rows each.
+    """
+    with open(path, "rb") as f:
+        f.seek(offset)
+        for df in pd.read_csv(f, chunksize=chunk_size, **CSV_OPTIONS):
+            columns = _frame_to_columns(df, time_format)
+            if time_format is None and len(df):
+                # detect the format once per file
+                time_format = detect_time_format(str(df["Time"].values[0]))
+            yield columns
+
+
+def iter_column_chunks(columns, chunk_size):
+    """
+    Splits a dictionary of (memory-mapped) columns into views of at most
+    chunk_size rows each.
+    """
+    for start in range(0, len(columns["time"]), chunk_size):
+        yield dict((col, values[start:start+chunk_size])
+                   for col, values in columns.items())
+
+
+def clip_columns(columns, start_ns=None, end_ns=None):
+    """
+    Returns views of the columns limited to ticks with start_ns <= time <=
+    end_ns. The time column is sorted, so this is a binary search.
+    """
+    time = columns["time"]
+    lo = 0 if start_ns is None else int(np.searchsorted(time, start_ns, "left"))
+    hi = len(time) if end_ns is None else \
+        int(np.searchsorted(time, end_ns, "right"))
+    if lo == 0 and hi == len(time):
+        return columns
+    return dict((col, values[lo:hi]) for col, values in columns.items())
+
+
+def clip_chunks(chunks, start_ns=None, end_ns=None):
+    """
+    Lazily clips a sequence of column chunks to [start_ns, end_ns] and stops
+    reading once a chunk starts after end_ns.
+    """
+    for columns in chunks:
+        time = columns["time"]
+        if len(time) and end_ns is not None and time[0] > end_ns:
+            return
+        if len(time) and start_ns is not None and time[-1] < start_ns:
+            continue
+        yield clip_columns(columns, start_ns, end_ns)
+
+
+def _write_entry(parent_dir, name, columns):
+    """
+    Writes a dictionary of columns into parent_dir/name. The entry is written
+    into a temporary directory first and then renamed, so a concurrent
+    reader never sees a half written entry.
+    """
+    final_dir = os.path.join(parent_dir, name)
+    tmp_dir = os.path.join(parent_dir, ".%s.%s.tmp" % (name, os.getpid()))
+    os.makedirs(tmp_dir, exist_ok=True)
+    for col, dtype in COLUMNS:
+        np.save(os.path.join(tmp_dir, col + ".npy"),
+                np.ascontiguousarray(columns[col], dtype=dtype))
+    if os.path.isdir(final_dir):
+        shutil.rmtree(final_dir, ignore_errors=True)
+    try:
+        os.rename(tmp_dir, final_dir)
+    except OSError:
+        # another process wrote the same entry in the meantime
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if not os.path.isdir(final_dir):
+            raise
+    return final_dir
+
+
+def _open_entry(entry_dir, mmap=True):
+    """
+    Opens the columns of an entry, or returns None if it does not exist.
+    """
+    if not os.path.isdir(entry_dir):
+        return None
+    mode = "r" if mmap else None
+    return dict(
+            (col, np.load(os.path.join(entry_dir, col + ".npy"), mmap_mode=mode))
+            for col, _ in COLUMNS)
+
+
+def write_day(store_dir, pair, date_str, columns):
+    """
+    Writes the columns of a single pair/day into the store.
+    """
+    return _write_entry(store_dir, day_name(pair, date_str), columns)
+
+
+def open_day(store_dir, pair, date_str, mmap=True):
+    """
+    Opens the columns of a single pair/day. The arrays are read-only
+    memory maps unless mmap is False. Returns None if the day is not in
+    the store.
+    """
+    return _open_entry(os.path.join(store_dir, day_name(pair, date_str)), mmap)
+
+
+def _cache_name(path):
+    """
+    Name of the parsed-day cache entry of a CSV file. The key combines the
+    absolute path, the size and the modification time of the file, so an
+    edited file is parsed again.
+    """
+    st = os.stat(path)
+    key = "%s|%s|%s" % (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    base = os.path.splitext(os.path.basename(path))[0]
+    return "%s-%s" % (base, hashlib.sha1(key.encode("utf-8")).hexdigest()[:16])
+
+
+def read_csv_day_cached(path, cache_dir, time_format=None):
+    """
+    Same as read_csv_day, but the parsed columns are kept in cache_dir and
+    memory-mapped on the following calls, so repeat backtests over the same
+    dates skip parsing completely.
+    """
+    name = _cache_name(path)
+    columns = _open_entry(os.path.join(cache_dir, name))
+    if columns is not None:
+        return columns
+    columns = read_csv_day(path, time_format)
+    os.makedirs(cache_dir, exist_ok=True)
+    # drop entries of older versions of the same file
+    base = name.rsplit("-", 1)[0]
+    for f in os.listdir(cache_dir):
+        if f != name and f.rsplit("-", 1)[0] == base:
+            shutil.rmtree(os.path.join(cache_dir, f), ignore_errors=True)
+    _write_entry(cache_dir, name, columns)
+    return columns
+
+
+def open_cached_day(path, cache_dir):
+    """
+    Returns the cached columns of a CSV file, or None if it was not parsed
+    before (or changed since).
+    """
+    return _open_entry(os.path.join(cache_dir, _cache_name(path)))
+
+
+def list_store_days(store_dir):
+    """
+    Returns a sorted list of (pair, date_str) tuples available in the store.
+    """
+    if not os.path.isdir(store_dir):
+        return []
+    days = []
+    for f in os.listdir(store_dir):
+        m = FILE_PATTERN.match(f)
+        if m and m.group(3) is None:
+            days.append((m.group(1), m.group(2)))
+    days.sort()
+    return days
+
+
+def convert_csv_dir(csv_dir, store_dir, pairs=None, overwrite=False,
+                    time_format=None):
+    """
+    One-time conversion of every 'pair_YYYYMMDD.csv' file in csv_dir into
+    the store. Days already in the store are skipped unless overwrite is
+    True. Returns the list of converted store entries.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    converted = []
+    for f in sorted(os.listdir(csv_dir)):
+        m = FILE_PATTERN.match(f)
+        if not m or m.group(3) is None:
+            continue
+        pair, date_str = m.group(1), m.group(2)
+        if pairs is not None and pair not in pairs:
+            continue
+        if not overwrite and os.path.isdir(
+                os.path.join(store_dir, day_name(pair, date_str))):
+            continue
+        columns = read_csv_day(os.path.join(csv_dir, f), time_format)
+        write_day(store_dir, pair, date_str, columns)
+        converted.append(day_name(pair, date_str))
+    return converted
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+            description="Convert CSV tick files into the binary tick store")
+    parser.add_argument("csv_dir", help="directory with pair_YYYYMMDD.csv files")
+    parser.add_argument("store_dir", help="output directory of the tick store")
+    parser.add_argument("--pairs", nargs="*", default=None,
+                        help="only convert these pairs, e.g. GBPUSD EURUSD")
+    parser.add_argument("--overwrite", action="store_true",
+                        help="re-convert days that are already in the store")
+    parser.add_argument("--time-format", default=None,
+                        help="strptime format of the time column, "
+                             "detected from the first row by default")
+    args = parser.parse_args()
+
+    done = convert_csv_dir(args.csv_dir, args.store_dir,
+                           pairs=args.pairs, overwrite=args.overwrite,
+                           time_format=args.time_format)
+    print("Converted %s day(s) into %s" % (len(done), args.store_dir))
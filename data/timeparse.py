@@ -0,0 +1,170 @@
+"""
+
+Fast parsing of tick timestamps.
+
+The tick files written by scripts/genrate_simulated_pair.py always use the
+fixed format '%d.%m.%Y %H:%M:%S.%f' (e.g. '03.07.2018 00:00:01.833'). Letting
+pandas infer the format with dayfirst=True is far slower than parsing a known
+format, so the loader detects the format from the first timestamp and then
+parses the whole column at once into int64 epoch nanoseconds.
+
+If every timestamp has the same width the fields are read straight from the
+character matrix with NumPy. Otherwise pd.to_datetime with the explicit format
+is used, and unknown formats fall back to the old dayfirst inference.
+"""
+import sys
+sys.path.append('../')
+
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+
+# Formats tried (in order) when no time format is given
+KNOWN_TIME_FORMATS = (
+        "%d.%m.%Y %H:%M:%S.%f",
+        "%d.%m.%Y %H:%M:%S",
+        "%Y-%m-%d %H:%M:%S.%f",
+        "%Y-%m-%d %H:%M:%S",
+        "%Y%m%d %H:%M:%S.%f",
+        "%Y%m%d %H%M%S%f",
+        )
+
+# Width in characters of every fixed-width directive
+_FIELD_WIDTHS = {"d": 2, "m": 2, "Y": 4, "H": 2, "M": 2, "S": 2}
+
+
+def detect_time_format(sample):
+    """
+    Returns the first of KNOWN_TIME_FORMATS that parses the sample timestamp,
+    or None if none of them does.
+    """
+    sample = sample.strip()
+    for fmt in KNOWN_TIME_FORMATS:
+        try:
+            datetime.strptime(sample, fmt)
+        except ValueError:
+            continue
+        return fmt
+    return None
+
+
+def _field_positions(fmt, sample):
+    """
+    Maps every directive of fmt to its (start, stop) character positions in
+    the sample timestamp. Returns None if the format contains directives
+    other than %d %m %Y %H %M %S %f or does not line up with the sample.
+    """
+    fields = {}
+    pos = 0
+    i = 0
+    while i < len(fmt):
+        if fmt[i] != "%":
+            if pos >= len(sample) or sample[pos] != fmt[i]:
+                return None
+            pos += 1
+            i += 1
+            continue
+        if i + 1 >= len(fmt):
+            return None
+        directive = fmt[i+1]
+        if directive == "f":
+            # fractional seconds take every following digit (at most 9)
+            stop = pos
+            while stop < len(sample) and stop - pos < 9 and sample[stop].isdigit():
+                stop += 1
+            width = stop - pos
+        elif directive in _FIELD_WIDTHS:
+            width = _FIELD_WIDTHS[directive]
+        else:
+            return None
+        if width == 0 or not sample[pos:pos+width].isdigit():
+            return None
+        fields[directive] = (pos, pos + width)
+        pos += width
+        i += 2
+    if pos != len(sample):
+        return None
+    return fields
+
+
+def _days_from_civil(y, m, d):
+    """
+    Vectorised number of days since 1970-01-01 for proleptic Gregorian
+    year/month/day arrays.
+    """
+    y = y - (m <= 2)
+    era = y // 400
+    yoe = y - era * 400
+    doy = (153 * (m + np.where(m > 2, -3, 9)) + 2) // 5 + d - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146097 + doe - 719468
+
+
+def _parse_fixed_width(values, fields, width):
+    """
+    Parses equally wide timestamp strings by reading the digits of every
+    field straight from the character matrix. Returns None if any value
+    does not fit the layout.
+    """
+    try:
+        # one extra character, so longer values are not silently truncated
+        chars = np.asarray(values, dtype="S%d" % (width + 1))
+    except UnicodeEncodeError:
+        return None
+    if (np.char.str_len(chars) != width).any():
+        return None
+    digits = chars.view(np.uint8).reshape(len(chars), width + 1)[:, :width]
+    digits = digits.astype(np.int64) - 48
+
+    def field(name):
+        start, stop = fields[name]
+        block = digits[:, start:stop]
+        if ((block < 0) | (block > 9)).any():
+            raise ValueError
+        weights = 10 ** np.arange(stop - start - 1, -1, -1, dtype=np.int64)
+        return block.dot(weights)
+
+    try:
+        days = _days_from_civil(field("Y"), field("m"), field("d"))
+        ns = days * 86400
+        for name, seconds in (("H", 3600), ("M", 60), ("S", 1)):
+            if name in fields:
+                ns = ns + field(name) * seconds
+        ns = ns * 1000000000
+        if "f" in fields:
+            start, stop = fields["f"]
+            ns = ns + field("f") * 10 ** (9 - (stop - start))
+    except ValueError:
+        return None
+    return ns
+
+
+def parse_time_column(values, time_format=None):
+    """
+    Parses an array of timestamp strings into int64 epoch nanoseconds.
+
+    Args:
+        values: array or list of timestamp strings
+        time_format: strptime style format, detected from the first value
+            if not given
+    """
+    values = np.asarray(values, dtype=object)
+    if len(values) == 0:
+        return np.empty(0, dtype=np.int64)
+    sample = str(values[0])
+    if time_format is None:
+        time_format = detect_time_format(sample)
+    if time_format is None:
+        # unknown format, let pandas infer it
+        parsed = pd.to_datetime(values, dayfirst=True)
+        return np.asarray(parsed.values).astype("datetime64[ns]").astype(np.int64)
+
+    fields = _field_positions(time_format, sample)
+    if fields is not None and all(f in fields for f in ("Y", "m", "d")):
+        ns = _parse_fixed_width(values, fields, len(sample))
+        if ns is not None:
+            return ns
+    parsed = pd.to_datetime(values, format=time_format)
+    return np.asarray(parsed.values).astype("datetime64[ns]").astype(np.int64)
@@ -4,20 +4,42 @@ Defines classes for all event types that will be sent to queue and used to
 activate different scripts and functions.
 
 Event types:
-    Tick:   event between two queue requests with no signal or order
-    Signal: event created by trading strategy # check?
-    Order:  event to place a order to Oanda 
+    Tick:       event between two queue requests with no signal or order
+    Signal:     event created by trading strategy # check?
+    Order:      event to place a order to Oanda 
+    Tick batch: consecutive ticks of a single pair, for strategies that
+                consume many ticks per dispatch (see TickBatchEvent)
+    Fill:       result of an order sent to Oanda, filled or rejected (see
+                FillEvent)
     
+The kind of an event is the integer enum EventType, stored on the class, and
+all events use __slots__, so millions of ticks do not each carry a __dict__.
 """
 import sys
 sys.path.append('../')
 
+from enum import IntEnum
+
+
+class EventType(IntEnum):
+    TICK = 1
+    SIGNAL = 2
+    ORDER = 3
+    TICK_BATCH = 4
+    FILL = 5
+
+
 class Event(object):
-    pass
+    __slots__ = ()
 
 class TickEvent(Event):
+    __slots__ = ("instrument", "time", "bid", "ask")
+    type = EventType.TICK
+    # only VolumeTickEvent carries volumes
+    bid_volume = None
+    ask_volume = None
+    
     def __init__(self, instrument, time, bid, ask):
-        self.type = 'TICK'
         self.instrument = instrument
         self.time = time
         self.bid = bid
@@ -25,15 +47,29 @@ class TickEvent(Event):
         
     def __str__(self):
         return ("Type: {}, Instrument: {}, Time: {}, Bid: {}, Ask: {}".format(
-                str(self.type), str(self.instrument), str(self.time),
+                self.type.name, str(self.instrument), str(self.time),
                 str(self.bid), str(self.ask)))
         
     def __repr__(self):
         return str(self)
     
+class VolumeTickEvent(TickEvent):
+    """
+    TickEvent that also carries the bid/ask volumes of the tick, sent by the
+    historic price handlers when they are created with volumes=True.
+    """
+    __slots__ = ("bid_volume", "ask_volume")
+    
+    def __init__(self, instrument, time, bid, ask, bid_volume, ask_volume):
+        super(VolumeTickEvent, self).__init__(instrument, time, bid, ask)
+        self.bid_volume = bid_volume
+        self.ask_volume = ask_volume
+    
 class SignalEvent(Event):
+    __slots__ = ("instrument", "order_type", "side", "time")
+    type = EventType.SIGNAL
+    
     def __init__(self, instrument, order_type, side, time):
-        self.type = 'SIGNAL'
         self.instrument = instrument
         self.order_type = order_type
         self.side = side
@@ -41,15 +77,17 @@ class SignalEvent(Event):
         
     def __str__(self):
         return ("Type: {}, Instrument: {}, Order Type: {}, Side: {}, Time: {}".format(
-                str(self.type), str(self.instrument), str(self.order_type),
+                self.type.name, str(self.instrument), str(self.order_type),
                 str(self.side), str(self.time)))
     
     def __repr__(self):
         return str(self)
     
 class OrderEvent(Event):
+    __slots__ = ("instrument", "units", "order_type", "side")
+    type = EventType.ORDER
+    
     def __init__(self, instrument, units, order_type, side):
-        self.type = 'ORDER'
         self.instrument = instrument
         self.units = units
         self.order_type = order_type
@@ -57,8 +95,85 @@ class OrderEvent(Event):
         
     def __str__(self):
         return ("Type: {}, Instrument: {}, Units: {}, Order Type: {}, Side: {}".format(
-                str(self.type), str(self.instrument), str(self.units),
+                self.type.name, str(self.instrument), str(self.units),
                 str(self.order_type), str(self.side)))
         
     def __repr__(self):
-        return str(self)
\ No newline at end of file
+        return str(self)
+    
+class TickBatchEvent(Event):
+    """
+    A run of consecutive ticks of a single pair. times is a list of the tick
+    times, bids and asks are lists of the same length of prices of the
+    numeric backend, as in a TickEvent. time is the
+    time of the last tick, so a batch can be passed wherever the portfolio
+    expects a TickEvent; the ticker prices are those of the last tick.
+    """
+    __slots__ = ("instrument", "times", "bids", "asks", "time")
+    type = EventType.TICK_BATCH
+    
+    def __init__(self, instrument, times, bids, asks):
+        self.instrument = instrument
+        self.times = times
+        self.bids = bids
+        self.asks = asks
+        self.time = times[-1]
+        
+    def __len__(self):
+        return len(self.times)
+    
+    def ticks(self):
+        """
+        Iterates over the batch as TickEvents.
+        """
+        for time, bid, ask in zip(self.times, self.bids, self.asks):
+            yield TickEvent(self.instrument, time, bid, ask)
+        
+    def __str__(self):
+        return ("Type: {}, Instrument: {}, Ticks: {}, Time: {}".format(
+                self.type.name, str(self.instrument), len(self.times),
+                str(self.time)))
+    
+    def __repr__(self):
+        return str(self)
+
+class FillEvent(Event):
+    """
+    Result of an OrderEvent at the broker, put onto the events queue by the
+    execution handler once the broker answered. status is 'filled',
+    'rejected' or 'unknown'; a filled order carries the fill price, time and
+    id of the broker, a rejected one the reason. An order is unknown if it
+    may have reached the broker but neither its answer nor a look-up of its
+    client_id told what became of it. latency is the time in seconds from
+    the submission of the order to the answer.
+    """
+    __slots__ = ("instrument", "units", "side", "status", "price", "time",
+                 "order_id", "reason", "latency", "client_id")
+    type = EventType.FILL
+    
+    def __init__(self, instrument, units, side, status, price=None, time=None,
+                 order_id=None, reason=None, latency=None, client_id=None):
+        self.instrument = instrument
+        self.units = units
+        self.side = side
+        self.status = status
+        self.price = price
+        self.time = time
+        self.order_id = order_id
+        self.reason = reason
+        self.latency = latency
+        self.client_id = client_id
+        
+    @property
+    def filled(self):
+        return self.status == "filled"
+        
+    def __str__(self):
+        return ("Type: {}, Instrument: {}, Units: {}, Side: {}, Status: {}, "
+                "Price: {}, Time: {}, Reason: {}, Client ID: {}".format(
+                self.type.name, str(self.instrument), str(self.units),
+                str(self.side), str(self.status), str(self.price),
+                str(self.time), str(self.reason), str(self.client_id)))
+    
+    def __repr__(self):
+        return str(self)
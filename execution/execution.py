@@ -3,13 +3,33 @@ sys.path.append('../')
 
 from abc import ABCMeta, abstractmethod
 # https://www.python-course.eu/python3_abstract_classes.php
+import itertools
 import logging
+import threading
+import time
+from decimal import Decimal
 
-import oandapyV20
-from oandapyV20 import API
-import oandapyV20.endpoints.orders as orders
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+import requests
+from requests.packages.urllib3.exceptions import NewConnectionError
 from oandapyV20.contrib.requests import MarketOrderRequest
 
+from event.event import FillEvent
+
+
+# REST hosts of the OANDA v20 environments
+API_URLS = {
+        "practice": "https://api-fxpractice.oanda.com",
+        "live": "https://api-fxtrade.oanda.com",
+        }
+
+# Put on the order queue to stop a worker
+_STOP = None
+
 
 class ExecutionHandler(object):
     """
@@ -38,34 +58,313 @@ class SimulatedExecution(object):
     def execute_order(self, event):
         pass
     
+class RateLimiter(object):
+    """
+    Token bucket shared by the execution workers: on average at most 'rate'
+    orders per second, and at most 'burst' orders at once.
+    """
+    
+    def __init__(self, rate, burst=1, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = self.burst
+        self.last = clock()
+        self.lock = threading.Lock()
+        
+    def acquire(self):
+        """
+        Takes a token, waiting until one is available. Returns the time
+        waited in seconds.
+        """
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens = min(self.burst,
+                                  self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return waited
+                wait = (1.0 - self.tokens) / self.rate
+            self.sleep(wait)
+            waited += wait
+    
 class OANDAExecutionHandler(ExecutionHandler):
+    """
+    Sends market orders to the OANDA v20 REST API without blocking the
+    trading thread.
+    
+    execute_order() only puts the order onto a bounded queue. A pool of
+    worker threads, each with its own keep-alive requests.Session, takes the
+    orders off the queue, waits for the shared rate limiter and posts them.
+    The answer of the broker is put onto the events queue as a FillEvent,
+    filled or rejected. Every order carries a client order id; if the order
+    may have reached the broker but its answer was lost, e.g. on a read
+    timeout, the order is looked up by that id and posted as the broker
+    booked it, or as 'unknown' if the look-up fails as well. Once max_pending orders are waiting, execute_order()
+    blocks until a worker is free, so a broker that falls behind slows the
+    trading loop down instead of piling up orders.
     
-    def __init__(self, domain, access_token, account_id):
+    With workers=0 every order is sent on the calling thread.
+    """
+    
+    def __init__(self, domain, access_token, account_id, events_queue=None,
+                 workers=4, max_pending=64, rate=100, burst=1, timeout=10.0,
+                 api_url=None, reconcile_attempts=3, reconcile_delay=1.0):
+        """
+        Args:
+            domain: OANDA environment, 'practice' or 'live'
+            access_token: OANDA API token
+            account_id: OANDA account the orders are placed in
+            events_queue: queue the FillEvents are put onto, the fills are
+                only logged if None
+            workers: number of worker threads and HTTP sessions, 0 sends the
+                orders synchronously
+            max_pending: number of orders that may wait for a worker
+            rate: most orders sent per second, None for no limit
+            burst: number of orders that may be sent at once within the rate
+            timeout: HTTP timeout of an order in seconds
+            api_url: REST host, e.g. of a local stand-in broker (see
+                scripts/fake_v20.py); the host of the domain if None
+            reconcile_attempts: look-ups of an order whose answer was lost
+            reconcile_delay: seconds between the look-ups
+        """
         self.domain = domain
         self.access_token = access_token
         self.account_id = account_id
-        self.client = self.create_OADAN_client()
+        self.events_queue = events_queue
+        self.timeout = timeout
+        self.api_url = (api_url or API_URLS[domain]).rstrip("/")
+        self.orders_url = "%s/v3/accounts/%s/orders" % (self.api_url,
+                                                       account_id)
+        self.limiter = RateLimiter(rate, burst) if rate else None
+        self.reconcile_attempts = reconcile_attempts
+        self.reconcile_delay = reconcile_delay
+        # client order ids, unique over the restarts of the handler
+        self.client_prefix = "%x" % int(time.time() * 1000)
+        self.client_ids = itertools.count(1)
         self.logger = logging.getLogger(__name__)
+        # one HTTP session per thread, requests.Session is not thread safe
+        self.local = threading.local()
+        self.orders = queue.Queue(max_pending)
+        self.workers = []
+        for i in range(workers):
+            worker = threading.Thread(target=self._work,
+                                      name="oanda-execution-%d" % i)
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
         
-        
-    def create_OADAN_client(self):
-        return API(self.access_token)
-        
+    def create_session(self):
+        session = requests.Session()
+        session.headers.update({
+                "Authorization": "Bearer %s" % self.access_token,
+                "Content-Type": "application/json",
+                "Accept-Datetime-Format": "RFC3339",
+                })
+        return session
+    
+    def session(self):
+        """
+        The keep-alive HTTP session of the calling thread.
+        """
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = self.local.session = self.create_session()
+        return session
     
     def execute_order(self, event):
-        print("execute order")
-        instrument = "%s_%s" % (event.instrument[:3], event.instrument[3:])
-        units = event.units
-        
+        """
+        Submits a market order. Returns once the order is queued for a
+        worker, or once it is sent with workers=0.
+        """
+        if self.workers:
+            self.orders.put((event, time.monotonic()))
+        else:
+            self.send_order(event, time.monotonic())
+            
+    def _work(self):
+        while True:
+            item = self.orders.get()
+            if item is _STOP:
+                break
+            try:
+                self.send_order(*item)
+            except Exception:
+                self.logger.exception("Order %s was not sent" % item[0])
+        session = getattr(self.local, "session", None)
+        if session is not None:
+            session.close()
+    
+    def send_order(self, event, submitted):
+        """
+        Posts the order to the broker and puts its FillEvent onto the events
+        queue. submitted is the time.monotonic() the order was submitted at.
         
-        #Market order
-        mo = MarketOrderRequest(instrument=instrument, units=units)
-        print(mo)
-        # Create order request
-        request = orders.OrderCreate(self.account_id, data=mo.data)
-        print(request)
-        # perform the request
-        rv = self.client.request(request)
-        print(rv)
-        self.logger.debug(rv)
-        
\ No newline at end of file
+        Every order gets exactly one FillEvent. An order that never reached
+        the broker is posted as rejected. An order that may have reached it
+        but got no readable answer is reconciled by its client order id, see
+        reconcile().
+        """
+        client_id = "%s-%d" % (self.client_prefix, next(self.client_ids))
+        try:
+            fill = self._send(event, client_id)
+        except Exception as e:
+            self.logger.exception("Order %s failed" % event)
+            fill = FillEvent(event.instrument, event.units, event.side,
+                             "rejected", reason=str(e) or type(e).__name__,
+                             client_id=client_id)
+        fill.latency = time.monotonic() - submitted
+        self.logger.debug(fill)
+        if self.events_queue is not None:
+            self.events_queue.put(fill)
+        return fill
+    
+    @staticmethod
+    def _not_sent(e):
+        """
+        True if the request failed before any of it reached the broker: the
+        connection could not be made or the request could not be built.
+        Read timeouts and connections dropped after the request was sent
+        leave the order unknown.
+        """
+        if isinstance(e, requests.ConnectTimeout):
+            return True
+        if isinstance(e, (requests.ConnectionError, requests.Timeout,
+                          requests.exceptions.ChunkedEncodingError,
+                          requests.exceptions.ContentDecodingError)):
+            reason = e.args[0] if e.args else None
+            # requests wraps the urllib3 error in a MaxRetryError
+            reason = getattr(reason, "reason", reason)
+            return isinstance(reason, NewConnectionError)
+        return True
+    
+    def _send(self, event, client_id):
+        if self.limiter is not None:
+            self.limiter.acquire()
+        instrument = "%s_%s" % (event.instrument[:3], event.instrument[3:])
+        mo = MarketOrderRequest(instrument=instrument, units=event.units,
+                                clientExtensions={"id": client_id})
+        try:
+            response = self.session().post(self.orders_url, json=mo.data,
+                                           timeout=self.timeout)
+        except requests.RequestException as e:
+            if self._not_sent(e):
+                return FillEvent(event.instrument, event.units, event.side,
+                                 "rejected", reason=str(e),
+                                 client_id=client_id)
+            return self.reconcile(event, client_id, str(e))
+        try:
+            fill = self.create_fill(event, response.status_code,
+                                    response.json())
+        except (ValueError, AttributeError) as e:
+            reason = "HTTP %d, invalid answer: %s" % (response.status_code, e)
+            if response.status_code < 300:
+                return self.reconcile(event, client_id, reason)
+            fill = FillEvent(event.instrument, event.units, event.side,
+                             "rejected", reason=reason)
+        fill.client_id = client_id
+        return fill
+    
+    def reconcile(self, event, client_id, reason):
+        """
+        FillEvent of an order whose answer was lost, looked up at the broker
+        by its client order id: filled with the fill transaction of the
+        order, rejected if the broker cancelled it or still does not know it
+        after the last look-up, and unknown if the look-ups failed. reason
+        is why the answer was lost.
+        """
+        url = "%s/@%s" % (self.orders_url, client_id)
+        self.logger.warning("Answer to order %s (client id %s) lost: %s"
+                            % (event, client_id, reason))
+        for attempt in range(self.reconcile_attempts):
+            if attempt:
+                time.sleep(self.reconcile_delay)
+            try:
+                response = self.session().get(url, timeout=self.timeout)
+                if response.status_code == 404:
+                    if attempt + 1 < self.reconcile_attempts:
+                        continue
+                    return FillEvent(event.instrument, event.units,
+                                     event.side, "rejected",
+                                     reason="%s, order not at the broker"
+                                     % reason, client_id=client_id)
+                if response.status_code >= 300:
+                    continue
+                order = response.json()["order"]
+                state = order.get("state")
+                if state == "FILLED":
+                    transaction = self.session().get(
+                            "%s/v3/accounts/%s/transactions/%s" % (
+                                    self.api_url, self.account_id,
+                                    order["fillingTransactionID"]),
+                            timeout=self.timeout).json()["transaction"]
+                    fill = self.create_fill(
+                            event, 200, {"orderFillTransaction": transaction})
+                elif state == "CANCELLED":
+                    fill = FillEvent(event.instrument, event.units,
+                                     event.side, "rejected",
+                                     order_id=order.get("id"),
+                                     reason="%s, order cancelled" % reason)
+                else:
+                    continue
+                fill.client_id = client_id
+                self.logger.info("Order %s reconciled: %s"
+                                 % (client_id, fill.status))
+                return fill
+            except (requests.RequestException, ValueError, KeyError,
+                    TypeError) as e:
+                self.logger.warning("Look-up of order %s failed: %s"
+                                    % (client_id, e))
+        self.logger.error("Order %s (client id %s) is unknown" % (event,
+                                                                  client_id))
+        return FillEvent(event.instrument, event.units, event.side,
+                         "unknown", reason=reason, client_id=client_id)
+    
+    def create_fill(self, event, status_code, body):
+        """
+        FillEvent of the v20 answer to an order: filled if it holds an
+        orderFillTransaction, rejected otherwise. The order was filled at
+        the broker whatever the fields of the fill hold, so units or a price
+        that cannot be read are logged and replaced by the ordered units and
+        None instead.
+        """
+        fill = body.get("orderFillTransaction")
+        if status_code < 300 and fill is not None:
+            units = event.units
+            if fill.get("units") is not None:
+                try:
+                    units = int(Decimal(str(fill["units"])))
+                except (ArithmeticError, ValueError):
+                    self.logger.warning("Fill of %s with invalid units: %s"
+                                        % (event, fill["units"]))
+            price = None
+            try:
+                price = Decimal(str(fill["price"]))
+            except (KeyError, ArithmeticError, ValueError):
+                self.logger.warning("Fill of %s without a valid price: %s"
+                                    % (event, fill.get("price")))
+            return FillEvent(event.instrument, units, event.side, "filled",
+                             price=price, time=fill.get("time"),
+                             order_id=fill.get("orderID"))
+        cancel = (body.get("orderCancelTransaction") or
+                  body.get("orderRejectTransaction") or {})
+        reason = (cancel.get("reason") or cancel.get("rejectReason") or
+                  body.get("errorMessage") or "HTTP %d" % status_code)
+        return FillEvent(event.instrument, event.units, event.side,
+                         "rejected", order_id=cancel.get("orderID"),
+                         reason=reason)
+    
+    def stop(self, wait=True):
+        """
+        Stops the workers once they have sent the orders already submitted.
+        """
+        for _ in self.workers:
+            self.orders.put(_STOP)
+        if wait:
+            for worker in self.workers:
+                worker.join()
+        self.workers = []
@@ -0,0 +1,162 @@
+"""
+
+Order netting between the Portfolio and an execution handler.
+
+A strategy that flips between buy and sell, like TestStrategy, makes the
+portfolio emit bursts of opposing market orders, each of which costs a
+round trip to the broker and a spread crossing. NettingExecution is an
+execution handler that collects the market orders of every instrument over
+a netting window and sends the execution handler behind it one order of the
+net units, or nothing if the orders cancel out. A window of an instrument
+opens with its first order and closes after
+
+    window:     seconds, or
+    max_orders: orders of the instrument
+
+whichever comes first. The Portfolio keeps booking every signal as before.
+The net order carries the sum of the units of the orders it replaces, so
+whenever a window closes the position at the broker equals the position
+the portfolio booked. statistics() reports the orders and units saved.
+
+The time of the windows comes from clock, e.g. time.monotonic for live
+trading, where the trading loop calls poll() to close the windows that ran
+out. Without a clock the time is the one last passed to poll(): Backtest
+and FanOutBacktest pass the time of every tick (in epoch seconds), so
+backtests net on the tick times and stay reproducible.
+
+    backtest = Backtest(..., execution=NettingExecution,
+                        execution_params={"max_orders": 10})
+"""
+import sys
+sys.path.append('../')
+
+import logging
+
+from event.event import OrderEvent
+from execution.execution import SimulatedExecution
+
+
+class NettingExecution(object):
+    """
+    Execution handler that nets the market orders of every instrument over
+    a window before handing them to another execution handler.
+    """
+
+    def __init__(self, execution=SimulatedExecution, execution_params=None,
+                 window=None, max_orders=None, clock=None):
+        """
+        Args:
+            execution: execution handler the net orders are sent to, an
+                instance or a class that is created with execution_params
+            execution_params: keyword arguments of the execution class
+            window: seconds a netting window stays open
+            max_orders: orders of an instrument after which its window closes
+            clock: time source of the windows in seconds, the time last
+                passed to poll() if None
+        """
+        if window is None and max_orders is None:
+            raise ValueError("Netting needs a window or max_orders")
+        if max_orders is not None and max_orders < 1:
+            raise ValueError("max_orders has to be at least 1, got %s"
+                             % max_orders)
+        if isinstance(execution, type):
+            execution = execution(**(execution_params or {}))
+        self.execution = execution
+        self.window = window
+        self.max_orders = max_orders
+        self.clock = clock
+        self.now = None
+        # instrument -> [opened, net units, orders, gross units] of the
+        # open window
+        self.pending = {}
+        # net units sent per instrument
+        self.sent = {}
+        # totals of the closed windows
+        self.orders = 0
+        self.orders_sent = 0
+        self.units = 0
+        self.units_sent = 0
+        self.logger = logging.getLogger(__name__)
+
+    def time(self):
+        return self.clock() if self.clock is not None else self.now
+
+    def execute_order(self, event):
+        """
+        Adds a market order to the window of its instrument. Other orders
+        close the window and are passed on as they are.
+        """
+        now = self.time()
+        if self.window is not None:
+            self.poll(now)
+        instrument = event.instrument
+        if event.order_type != "market":
+            self.flush(instrument)
+            self.execution.execute_order(event)
+            return
+        pending = self.pending.get(instrument)
+        if pending is None:
+            pending = self.pending[instrument] = [now, 0, 0, 0]
+        pending[1] += event.units
+        pending[2] += 1
+        pending[3] += abs(event.units)
+        if self.max_orders is not None and pending[2] >= self.max_orders:
+            self.flush(instrument)
+
+    def poll(self, now=None):
+        """
+        Advances the time to now, or reads the clock if now is None, and
+        sends the net orders of the windows that ran out.
+        """
+        if now is None:
+            now = self.time()
+        else:
+            self.now = now
+        if self.window is None or not self.pending or now is None:
+            return
+        expired = [instrument for instrument, pending in self.pending.items()
+                   if pending[0] is None or now - pending[0] >= self.window]
+        for instrument in expired:
+            self.flush(instrument)
+
+    def flush(self, instrument=None):
+        """
+        Closes the window of an instrument, or every window, and sends the
+        net order if the units do not cancel out.
+        """
+        if instrument is None:
+            instruments = list(self.pending)
+        elif instrument in self.pending:
+            instruments = [instrument]
+        else:
+            return
+        for instrument in instruments:
+            opened, units, orders, gross = self.pending.pop(instrument)
+            self.orders += orders
+            self.units += gross
+            if units == 0:
+                self.logger.debug("%d orders of %s netted out"
+                                  % (orders, instrument))
+                continue
+            self.orders_sent += 1
+            self.units_sent += abs(units)
+            self.sent[instrument] = self.sent.get(instrument, 0) + units
+            side = "buy" if units > 0 else "sell"
+            self.execution.execute_order(
+                    OrderEvent(instrument, units, "market", side))
+
+    def statistics(self):
+        """
+        Orders and units of the closed windows, before and after netting,
+        and the orders still waiting in open windows.
+        """
+        return {
+                "orders": self.orders,
+                "orders_sent": self.orders_sent,
+                "orders_saved": self.orders - self.orders_sent,
+                "units": self.units,
+                "units_sent": self.units_sent,
+                "units_saved": self.units - self.units_sent,
+                "orders_pending": sum(pending[2] for pending
+                                      in self.pending.values()),
+                }
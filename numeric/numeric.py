@@ -0,0 +1,255 @@
+"""
+
+Numeric backends for prices and P&L.
+
+All price, pip and profit arithmetic of the price handlers, Position and
+Portfolio goes through a backend object, so the representation of the
+numbers can be swapped without touching the trading logic:
+
+    DecimalBackend:  decimal.Decimal values quantized with ROUND_HALF_DOWN.
+                     This is the reference implementation.
+    PipetteBackend:  plain integers in fixed-point units. Prices and pips are
+                     counted in pipettes (0.00001), unrealised profit in
+                     0.00001 of the home currency and realised P&L/balances
+                     in 0.01 (cents). All operations are exact integer
+                     arithmetic with the same ROUND_HALF_DOWN rounding, so the
+                     results are identical to the Decimal backend, only much
+                     cheaper per tick.
+
+Use get_backend("decimal") or get_backend("pipette") to obtain a backend.
+"""
+import sys
+sys.path.append('../')
+
+import math
+from decimal import Decimal, Context, ROUND_HALF_DOWN
+from fractions import Fraction
+
+
+PRICE_PLACES = 5    # prices, pips and unrealised profit: 0.00001
+MONEY_PLACES = 2    # realised P&L and balances: 0.01
+
+
+class DecimalBackend(object):
+    """
+    Reference backend: every value is a Decimal, quantized with
+    ROUND_HALF_DOWN exactly as the original Position/PriceHandler code.
+    """
+
+    name = "decimal"
+
+    def __init__(self):
+        # a private context, so the global decimal context (and its rounding)
+        # does not have to be reset on every call
+        self.context = Context(prec=28, rounding=ROUND_HALF_DOWN)
+        self.price_exp = Decimal("0.00001")
+        self.money_exp = Decimal("0.01")
+        self.one = Decimal("1.0")
+        self.minus_one = Decimal("-1")
+        self.hundred = Decimal("100.00")
+
+    def price(self, value):
+        """
+        Converts a float (or string) quote into a backend price.
+        """
+        return Decimal(str(value)).quantize(self.price_exp, context=self.context)
+
+    def invert(self, price):
+        """
+        Returns 1 / price quantized to a backend price.
+        """
+        return self.context.divide(self.one, price).quantize(
+                self.price_exp, context=self.context)
+
+    def units(self, units):
+        return Decimal(str(units))
+
+    def money(self, value):
+        """
+        Converts an amount of the home currency (e.g. the equity) into the
+        backend balance type.
+        """
+        return Decimal(str(value))
+
+    def pips(self, position_type, cur_price, avg_price):
+        """
+        Difference between current and average price, positive when the
+        position is in profit.
+        """
+        mult = self.one if position_type == 'long' else self.minus_one
+        return self.context.multiply(mult, self.context.subtract(
+                cur_price, avg_price).quantize(self.price_exp, context=self.context))
+
+    def profit(self, pips, rate, units):
+        """
+        Unrealised profit in the home currency, quantized to 0.00001.
+        """
+        ctx = self.context
+        return ctx.multiply(ctx.multiply(pips, rate), units).quantize(
+                self.price_exp, context=ctx)
+
+    def pnl(self, pips, rate, units):
+        """
+        Realised profit in the home currency, quantized to 0.01.
+        """
+        ctx = self.context
+        return ctx.multiply(ctx.multiply(pips, rate), units).quantize(
+                self.money_exp, context=ctx)
+
+    def profit_perc(self, profit, units):
+        ctx = self.context
+        return ctx.multiply(ctx.divide(profit, units), self.hundred).quantize(
+                self.price_exp, context=ctx)
+
+    def average_price(self, avg_price, units, add_price, add_units):
+        """
+        Average price of a position after adding add_units at add_price.
+        """
+        ctx = self.context
+        total_cost = ctx.add(ctx.multiply(avg_price, units),
+                             ctx.multiply(add_price, add_units))
+        return ctx.divide(total_cost, ctx.add(units, add_units))
+
+    def profit_to_decimal(self, profit):
+        return profit
+
+    def money_to_decimal(self, money):
+        return money
+
+    def price_to_decimal(self, price):
+        return price
+
+    def profit_to_fixed(self, profit):
+        """
+        Unrealised profit as an integer count of 0.00001.
+        """
+        return int(profit.scaleb(PRICE_PLACES).to_integral_value(
+                rounding=ROUND_HALF_DOWN))
+
+    def money_to_fixed(self, money):
+        """
+        Balance as an integer count of cents.
+        """
+        return int(money.scaleb(MONEY_PLACES).to_integral_value(
+                rounding=ROUND_HALF_DOWN))
+
+
+def _div_half_down(n, d):
+    """
+    Integer division n / d (d > 0) rounded to the nearest integer, ties
+    towards zero (ROUND_HALF_DOWN).
+    """
+    q, r = divmod(abs(n), d)
+    if 2 * r > d:
+        q += 1
+    return q if n >= 0 else -q
+
+
+class PipetteBackend(object):
+    """
+    Fixed-point backend on Python integers. Prices and pips are integer
+    pipettes, unrealised profit is scaled by 10**5 and realised P&L and
+    balances are integer cents.
+
+    A position's average price can become fractional when units are added
+    at a different price; it is then kept as an exact Fraction of pipettes.
+    """
+
+    name = "pipette"
+
+    def __init__(self):
+        self.price_scale = 10 ** PRICE_PLACES
+        self.money_scale = 10 ** MONEY_PLACES
+        self.decimal = DecimalBackend()
+
+    def price(self, value):
+        """
+        Converts a float (or string) quote into integer pipettes.
+        """
+        if isinstance(value, int):
+            return value
+        scaled = float(value) * self.price_scale
+        rounded = math.floor(scaled + 0.5)
+        if abs(scaled - math.floor(scaled) - 0.5) < 1e-6:
+            # too close to a tie to trust the float, round the exact decimal
+            return int(self.decimal.price(value).scaleb(PRICE_PLACES))
+        return int(rounded)
+
+    def invert(self, price):
+        """
+        Returns 1 / price in pipettes: 10**10 / price rounded half down.
+        """
+        return _div_half_down(self.price_scale * self.price_scale, price)
+
+    def units(self, units):
+        return int(units)
+
+    def money(self, value):
+        """
+        Converts an amount of the home currency into integer cents.
+        """
+        return int(Decimal(str(value)).scaleb(MONEY_PLACES).to_integral_value(
+                rounding=ROUND_HALF_DOWN))
+
+    def pips(self, position_type, cur_price, avg_price):
+        diff = cur_price - avg_price
+        if not isinstance(diff, int):
+            # fractional average price
+            diff = _div_half_down(diff.numerator, diff.denominator)
+        return diff if position_type == 'long' else -diff
+
+    def profit(self, pips, rate, units):
+        # pips * rate is scaled by 10**10, keep 10**5
+        return _div_half_down(pips * rate * units, self.price_scale)
+
+    def pnl(self, pips, rate, units):
+        # pips * rate is scaled by 10**10, keep 10**2
+        return _div_half_down(
+                pips * rate * units,
+                self.price_scale * self.price_scale // self.money_scale)
+
+    def profit_perc(self, profit, units):
+        return _div_half_down(profit * 100, int(units))
+
+    def average_price(self, avg_price, units, add_price, add_units):
+        avg = Fraction(avg_price * units + add_price * add_units,
+                       units + add_units)
+        return avg.numerator if avg.denominator == 1 else avg
+
+    def profit_to_decimal(self, profit):
+        return Decimal(profit).scaleb(-PRICE_PLACES)
+
+    def money_to_decimal(self, money):
+        return Decimal(money).scaleb(-MONEY_PLACES)
+
+    def price_to_decimal(self, price):
+        if not isinstance(price, int):
+            return Decimal(price.numerator).scaleb(-PRICE_PLACES) / price.denominator
+        return Decimal(price).scaleb(-PRICE_PLACES)
+
+    def profit_to_fixed(self, profit):
+        return profit
+
+    def money_to_fixed(self, money):
+        return money
+
+
+BACKENDS = {
+        "decimal": DecimalBackend,
+        "pipette": PipetteBackend,
+        }
+
+
+def get_backend(backend=None):
+    """
+    Returns a numeric backend. Accepts a backend instance, a name from
+    BACKENDS or None for the Decimal reference backend.
+    """
+    if backend is None:
+        backend = "decimal"
+    if isinstance(backend, str):
+        try:
+            return BACKENDS[backend]()
+        except KeyError:
+            raise ValueError("Unknown numeric backend: %s" % backend)
+    return backend
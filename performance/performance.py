@@ -1,38 +1,235 @@
+"""
+
+Vectorized performance statistics of equity curves.
+
+Every function works on NumPy arrays (pandas Series are accepted as well),
+with no Python loop over the points of the curve, so the statistics of an
+equity curve of millions of ticks take milliseconds:
+
+    create_drawdowns:      drawdown, maximum drawdown and longest drawdown
+    relative_drawdowns:    drawdown as a fraction of the high water mark
+    returns:               simple returns of an equity curve
+    periods_per_year:      sampling frequency of a curve from its timestamps
+    annualised_return,
+    annualised_volatility,
+    sharpe_ratio,
+    sortino_ratio,
+    calmar_ratio:          the usual risk adjusted return measures
+    hit_rate:              fraction of the closed trades that made money
+    exposure:              fraction of the time a position was open
+    summary:               all of the above in a dict
+"""
+import sys
+sys.path.append('../')
+
+import numpy as np
 import pandas as pd
 
+
+NS_PER_YEAR = 365.25 * 24 * 3600 * 10**9
+
+
+def _values(x):
+    return np.asarray(x, dtype=np.float64)
+
+
 def create_drawdowns(pnl):
     """
     Calculate the largest peak-to-trough drawdown of the PnL curve as well as
-    the duration of the drawdown. Requires that the pnl_returns is a panda
-    Series.
-    
+    the duration of the drawdown.
+
     Args:
-        pnl: A panda Series representing period percentage returns
-        
+        pnl: equity (or PnL) curve, a NumPy array or a pandas Series
+
     Returns:
-        drawdown, duration - Highest peak-to-trough drawdown and duration
-    """
-    
-    # Calculate the cumulative return curve and set up the High Water Mark (hwm)
-    hwm = [0]
-    
-    # Create the drawdown and duration series
-    idx = pnl.index
-    drawdown = pd.Series(index=idx)
-    duration = pd.Series(index=idx)
-    
-    # Loop over the index range
-    for t in range(1, len(idx)):
-        hwm.append(max(hwm[t-1], pnl.ix[t]))
-        # drawdown is a difference between High Water Mark and current pnl
-        # if pnl is increasing drawdown is equal to zero
-        drawdown.ix[t] = (hwm[t] - pnl.ix[t])
-        # duration remains zero when pnl is positive
-        duration.ix[t] = (0 if drawdown.ix[t] == 0 else duration.ix[t-1] + 1)
-    return drawdown, drawdown.max(), duration.max()
-
-def sharp_ratio(pnl, rate):
-    """
-    TODO: Define sharp ratio
-    """
-    pass
\ No newline at end of file
+        drawdown, max_drawdown, max_duration - the drawdown below the High
+        Water Mark at every point (a Series with the index of pnl if pnl is
+        one), the largest drawdown and the longest number of points spent
+        below a High Water Mark
+    """
+    values = _values(pnl)
+    if len(values) == 0:
+        return values, 0.0, 0
+    # High Water Mark and the drawdown below it, computed in place: every
+    # temporary array of a long curve costs more than the arithmetic
+    drawdown = np.maximum.accumulate(values)
+    np.subtract(drawdown, values, out=drawdown)
+    # the longest drawdown lies between two consecutive points at the High
+    # Water Mark, or after the last one
+    peaks = np.flatnonzero(drawdown == 0)
+    max_duration = len(values) - 1 - peaks[-1]
+    if len(peaks) > 1:
+        max_duration = max(max_duration, np.diff(peaks).max() - 1)
+    if isinstance(pnl, pd.Series):
+        drawdown = pd.Series(drawdown, index=pnl.index)
+    return drawdown, float(drawdown.max()), int(max_duration)
+
+
+def relative_drawdowns(equity):
+    """
+    Drawdown as a fraction of the High Water Mark at every point.
+    """
+    values = _values(equity)
+    if len(values) == 0:
+        return values
+    hwm = np.maximum.accumulate(values)
+    drawdown = np.subtract(hwm, values)
+    np.divide(drawdown, hwm, out=drawdown)
+    return drawdown
+
+
+def returns(equity):
+    """
+    Simple returns of an equity curve; one value less than the curve.
+    """
+    values = _values(equity)
+    return values[1:] / values[:-1] - 1.0
+
+
+def periods_per_year(times):
+    """
+    Number of points per year of a curve sampled at times (datetime64
+    values, a DatetimeIndex or epoch nanoseconds), from its average spacing.
+    """
+    times = np.asarray(times)
+    if len(times) < 2:
+        return 0.0
+    if times.dtype.kind == "M":
+        times = times.astype("datetime64[ns]").astype(np.int64)
+    span = float(times[-1] - times[0])
+    if span <= 0:
+        return 0.0
+    return (len(times) - 1) * NS_PER_YEAR / span
+
+
+def annualised_return(equity, periods=252):
+    """
+    Compound annual growth rate of an equity curve with 'periods' points per
+    year.
+    """
+    values = _values(equity)
+    if len(values) < 2 or values[0] <= 0 or periods <= 0:
+        return 0.0
+    years = (len(values) - 1) / float(periods)
+    return float((values[-1] / values[0]) ** (1.0 / years) - 1.0)
+
+
+def annualised_volatility(rets, periods=252):
+    """
+    Standard deviation of the returns scaled to a year.
+    """
+    rets = _values(rets)
+    if len(rets) < 2:
+        return 0.0
+    return float(np.std(rets, ddof=1) * np.sqrt(periods))
+
+
+def sharpe_ratio(rets, periods=252, risk_free=0.0):
+    """
+    Annualised Sharpe ratio of the returns against an annual risk free rate.
+    """
+    excess = _values(rets) - risk_free / float(periods)
+    if len(excess) < 2:
+        return 0.0
+    std = np.std(excess, ddof=1)
+    if std == 0:
+        return 0.0
+    return float(np.sqrt(periods) * np.mean(excess) / std)
+
+
+# the original (misspelt) name of the stub
+sharp_ratio = sharpe_ratio
+
+
+def sortino_ratio(rets, periods=252, risk_free=0.0):
+    """
+    Annualised Sortino ratio: like the Sharpe ratio, but only the returns
+    below the risk free rate count as risk (downside deviation).
+    """
+    excess = _values(rets) - risk_free / float(periods)
+    if len(excess) < 2:
+        return 0.0
+    downside = np.sqrt(np.mean(np.minimum(excess, 0.0) ** 2))
+    if downside == 0:
+        return 0.0
+    return float(np.sqrt(periods) * np.mean(excess) / downside)
+
+
+def calmar_ratio(equity, periods=252):
+    """
+    Annualised return divided by the maximum relative drawdown.
+    """
+    max_dd = relative_drawdowns(equity).max() if len(equity) else 0.0
+    return _calmar(annualised_return(equity, periods), max_dd)
+
+
+def _calmar(annual_return, max_relative_drawdown):
+    if max_relative_drawdown == 0:
+        return 0.0
+    return float(annual_return / max_relative_drawdown)
+
+
+def hit_rate(pnls):
+    """
+    Fraction of the closed trades, given by their realised P&L, that made
+    money.
+    """
+    pnls = _values(pnls)
+    if len(pnls) == 0:
+        return 0.0
+    return float((pnls > 0).mean())
+
+
+def exposure(position_types):
+    """
+    Fraction of the points with an open position. position_types has one row
+    per point and one column per pair, non-zero where a position is open.
+    """
+    types = np.asarray(position_types)
+    if len(types) == 0:
+        return 0.0
+    if types.ndim > 1:
+        types = types.any(axis=1)
+    return float((types != 0).mean())
+
+
+def summary(equity, times=None, periods=None, realised=None,
+            position_types=None, risk_free=0.0):
+    """
+    All statistics of an equity curve in a dict.
+
+    Args:
+        equity: equity curve
+        times: timestamps of the points, used for the annualisation when
+            periods is not given
+        periods: points per year, 252 (daily points) if neither periods nor
+            times are given
+        realised: realised P&L of the closed trades, for the hit rate
+        position_types: open positions per point, for the exposure
+        risk_free: annual risk free rate
+    """
+    values = _values(equity)
+    if periods is None:
+        periods = (periods_per_year(times) if times is not None else 0) or 252
+    rets = returns(values) if len(values) else values
+    _, max_dd, max_duration = create_drawdowns(values)
+    max_dd_pct = float(relative_drawdowns(values).max()) if len(values) else 0.0
+    annual_return = annualised_return(values, periods)
+    stats = {
+            "total_return": float(values[-1] / values[0] - 1.0)
+            if len(values) else 0.0,
+            "annualised_return": annual_return,
+            "annualised_volatility": annualised_volatility(rets, periods),
+            "sharpe_ratio": sharpe_ratio(rets, periods, risk_free),
+            "sortino_ratio": sortino_ratio(rets, periods, risk_free),
+            "calmar_ratio": _calmar(annual_return, max_dd_pct),
+            "max_drawdown": max_dd,
+            "max_drawdown_pct": max_dd_pct,
+            "max_drawdown_duration": max_duration,
+            }
+    if realised is not None:
+        stats["trades"] = len(realised)
+        stats["hit_rate"] = hit_rate(realised)
+    if position_types is not None:
+        stats["exposure"] = exposure(position_types)
+    return stats
@@ -0,0 +1,247 @@
+"""
+
+Incremental risk metrics of a running Portfolio.
+
+A MetricsTracker is fed by the Portfolio on every tick, signal and order and
+keeps, in constant time per event:
+
+    equity, realised and unrealised P&L
+    high water mark, drawdown and maximum drawdown (absolute and relative)
+    mean, standard deviation and Sharpe ratio of the per tick returns of
+    the equity over the last 'window' ticks (not annualised)
+    tick, signal and order counts and their rates per second, exponentially
+    decayed over 'rate_halflife' seconds
+
+The values are published as a snapshot dict at most every 'interval'
+seconds. A snapshot is never modified once published, so readers in other
+threads only ever see a complete, consistent set of values and never block
+the trading thread. Besides snapshot(), the published values can be exposed
+through a JSON file that is replaced atomically (path) and through
+MetricsServer, a read-only local HTTP endpoint:
+
+    metrics = MetricsTracker(path="metrics.json")
+    portfolio = Portfolio(..., metrics=metrics)
+    server = MetricsServer(metrics, port=8765).start()
+    # curl http://127.0.0.1:8765/metrics
+"""
+import sys
+sys.path.append('../')
+
+import os
+import json
+import math
+import time
+import threading
+import logging
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+from strategy.indicators import RollingVariance
+
+
+class _Rate(object):
+    """
+    Exponentially decayed event rate per second.
+    """
+
+    def __init__(self, halflife):
+        self.tau = halflife / math.log(2)
+        self.rate = 0.0
+        self.last = None
+
+    def decayed(self, now):
+        if self.last is None:
+            return 0.0
+        return self.rate * math.exp(-(now - self.last) / self.tau)
+
+    def add(self, now):
+        self.rate = self.decayed(now) + 1.0 / self.tau
+        self.last = now
+
+
+class MetricsTracker(object):
+    """
+    Running risk metrics of a portfolio, updated in O(1) per event.
+    """
+
+    def __init__(self, window=1000, interval=1.0, rate_halflife=10.0,
+                 path=None, clock=time.time):
+        """
+        Args:
+            window: number of ticks of the rolling return statistics
+            interval: shortest time in seconds between two published
+                snapshots
+            rate_halflife: half-life in seconds of the event rates
+            path: JSON file the snapshots are written to, if given
+            clock: time source of the rates and the publishing interval
+        """
+        self.window = window
+        self.interval = interval
+        self.path = path
+        self.clock = clock
+        self.started = clock()
+        self.returns = RollingVariance(window, ddof=1)
+        self.rates = {
+                "tick": _Rate(rate_halflife),
+                "signal": _Rate(rate_halflife),
+                "order": _Rate(rate_halflife),
+                }
+        self.counts = {"tick": 0, "signal": 0, "order": 0}
+        self.time = None
+        self.initial_equity = None
+        self.equity = None
+        self.realised = 0.0
+        self.unrealised = 0.0
+        self.high_water_mark = None
+        self.drawdown = 0.0
+        self.max_drawdown = 0.0
+        self.max_drawdown_pct = 0.0
+        self.published = None
+        self.next_publish = self.started
+        self.logger = logging.getLogger(__name__)
+
+    def _count(self, kind):
+        now = self.clock()
+        self.counts[kind] += 1
+        self.rates[kind].add(now)
+        if now >= self.next_publish:
+            self.publish(now)
+
+    def on_tick(self, time, balance, unrealised, initial_balance):
+        """
+        Updates the metrics with the state of the portfolio after a tick:
+        its balance, the unrealised profit of all positions and the balance
+        it started with, all floats in the home currency.
+        """
+        equity = balance + unrealised
+        if self.equity is None:
+            self.initial_equity = initial_balance
+            self.high_water_mark = equity
+        elif self.equity:
+            self.returns.update(equity / self.equity - 1.0)
+        self.time = time
+        self.equity = equity
+        self.realised = balance - initial_balance
+        self.unrealised = unrealised
+        if equity > self.high_water_mark:
+            self.high_water_mark = equity
+        self.drawdown = self.high_water_mark - equity
+        if self.drawdown > self.max_drawdown:
+            self.max_drawdown = self.drawdown
+        if self.high_water_mark > 0:
+            self.max_drawdown_pct = max(self.max_drawdown_pct,
+                                        self.drawdown / self.high_water_mark)
+        self._count("tick")
+
+    def on_signal(self, signal_event):
+        self._count("signal")
+
+    def on_order(self, order_event):
+        self._count("order")
+
+    def sharpe_ratio(self):
+        """
+        Mean over standard deviation of the returns in the window.
+        """
+        variance = self.returns.value
+        if not variance:
+            return 0.0
+        return self.returns.mean / math.sqrt(variance)
+
+    def snapshot(self, now=None):
+        """
+        Builds a new dict of the current metrics.
+        """
+        now = self.clock() if now is None else now
+        std = math.sqrt(self.returns.value) if self.returns.value else 0.0
+        return {
+                "time": str(self.time) if self.time is not None else None,
+                "published": now,
+                "uptime": now - self.started,
+                "equity": self.equity,
+                "initial_equity": self.initial_equity,
+                "realised_pnl": self.realised,
+                "unrealised_pnl": self.unrealised,
+                "high_water_mark": self.high_water_mark,
+                "drawdown": self.drawdown,
+                "max_drawdown": self.max_drawdown,
+                "max_drawdown_pct": self.max_drawdown_pct,
+                "return_mean": float(self.returns.mean),
+                "return_std": std,
+                "sharpe_ratio": self.sharpe_ratio(),
+                "window": self.window,
+                "ticks": self.counts["tick"],
+                "signals": self.counts["signal"],
+                "orders": self.counts["order"],
+                "tick_rate": self.rates["tick"].decayed(now),
+                "signal_rate": self.rates["signal"].decayed(now),
+                "order_rate": self.rates["order"].decayed(now),
+                }
+
+    def publish(self, now=None):
+        """
+        Publishes a new snapshot for the readers and writes it to the JSON
+        file, if there is one. The file is replaced atomically, so a reader
+        never sees a partly written file.
+        """
+        now = self.clock() if now is None else now
+        snapshot = self.snapshot(now)
+        # a single reference assignment, readers see the old or the new dict
+        self.published = snapshot
+        self.next_publish = now + self.interval
+        if self.path is not None:
+            tmp = "%s.tmp" % self.path
+            try:
+                with open(tmp, "w") as f:
+                    json.dump(snapshot, f)
+                os.replace(tmp, self.path)
+            except (IOError, OSError) as e:
+                self.logger.warning("Could not write metrics to %s: %s"
+                                    % (self.path, e))
+        return snapshot
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/metrics"):
+            self.send_error(404)
+            return
+        body = json.dumps(self.server.tracker.published).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.getLogger(__name__).debug(format % args)
+
+
+class MetricsServer(object):
+    """
+    Read-only HTTP endpoint (GET /metrics) of the last published snapshot of
+    a MetricsTracker, served from a daemon thread on the loopback interface.
+    """
+
+    def __init__(self, tracker, host="127.0.0.1", port=8765):
+        self.server = HTTPServer((host, port), _MetricsHandler)
+        self.server.tracker = tracker
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
@@ -2,6 +2,7 @@ import sys
 sys.path.append('../')
 
 import os
+import numpy as np
 import pandas as pd
 import logging
 from copy import deepcopy
@@ -9,7 +10,8 @@ from decimal import Decimal
 
 from settings import BASE_CURRENCY, EQUITY, OUTPUT_RESULT_DIR
 from portfolio.position import Position
-from performance.performance import create_drawdowns
+from portfolio.recorder import EquityRecorder
+from performance.performance import create_drawdowns, summary
 from event.event import OrderEvent
 
 # TODO:
@@ -17,19 +19,34 @@ from event.event import OrderEvent
 class Portfolio(object):
     def __init__(self, ticker, events, equity= EQUITY, 
                  risk_per_trade=Decimal("0.02"), home_currency=BASE_CURRENCY, 
-                 leverage=20, backtest=True):
+                 leverage=20, backtest=True, output_dir=OUTPUT_RESULT_DIR,
+                 recorder_params=None, export_results=False, metrics=None):
         self.ticker = ticker
         self.events = events
         self.equity = equity
-        self.balance = deepcopy(self.equity)
+        # prices, P&L and the balance use the numeric backend of the ticker
+        self.numeric = ticker.numeric
+        self.balance = self.numeric.money(deepcopy(self.equity))
         self.risk_per_trade = risk_per_trade
         self.home_currency = home_currency
         self.leverage = leverage
         self.positions = {}
+        # instrument -> {pair: position} of the open positions whose profit
+        # depends on the prices a tick of the instrument updates
+        self.dependents = {}
+        # number of closed positions (round trip trades)
+        self.trades = 0
         self.trade_units = self.calc_risk_position_size()
         self.backtest = backtest
+        # directory of the optional backtest.csv and equity.csv
+        self.output_dir = output_dir
+        self.export_results = export_results
+        self.results = None
+        self.statistics = None
+        # optional MetricsTracker (see portfolio/metrics.py), live or backtest
+        self.metrics = metrics
         if self.backtest:
-            self.backtest_file = self.create_equity_file()
+            self.recorder = self.create_recorder(recorder_params)
         self.logger = logging.getLogger(__name__)
         
     def calc_risk_position_size(self):
@@ -39,7 +56,38 @@ class Portfolio(object):
     def add_new_position(self, position_type, currency_pair, units, ticker):
         ps = Position(self.home_currency, position_type, 
                       currency_pair, units, ticker)
+        if currency_pair in self.positions:
+            self.unindex_position(self.positions[currency_pair])
         self.positions[currency_pair] = ps
+        self.index_position(ps)
+    
+    def order_pairs(self, currency_pair):
+        """
+        Entries of ticker.prices a position in currency_pair needs: the pair
+        and its quote/home conversion pair (see Position.price_dependencies).
+        """
+        return (currency_pair, "%s%s" % (currency_pair[3:], self.home_currency))
+    
+    def index_position(self, ps):
+        """
+        Adds a position to the dependency index. A tick of a pair updates
+        its own price and the price of its inverse, so a position depends
+        on the ticks of both pairs of every price it uses.
+        """
+        for price in ps.price_dependencies():
+            for instrument in (price, price[3:] + price[:3]):
+                self.dependents.setdefault(instrument, {})[
+                        ps.currency_pair] = ps
+    
+    def unindex_position(self, ps):
+        for price in ps.price_dependencies():
+            for instrument in (price, price[3:] + price[:3]):
+                dependents = self.dependents.get(instrument)
+                if dependents is not None and \
+                        dependents.get(ps.currency_pair) is ps:
+                    del dependents[ps.currency_pair]
+                    if not dependents:
+                        del self.dependents[instrument]
     
     def add_position_units(self, currency_pair, units):
         if currency_pair not in self.positions:
@@ -66,78 +114,108 @@ class Portfolio(object):
             pnl = ps.close_position()
             self.balance += pnl
             del[self.positions[currency_pair]]
+            self.unindex_position(ps)
+            self.trades += 1
             return True
     
     #TODO: 
     #   1. check if created files are overitten when performing multiple backtests 
     #   2. maybe add numbering to file name or keep the last 5 files or so?
-    def create_equity_file(self):
+    def create_recorder(self, recorder_params=None):
         """
-        Create output file: backtest.csv
-        
+        Create the equity recorder (see portfolio/recorder.py). The
+        recording is kept in memory; the output file backtest.csv (or
+        backtest.npz) is only written when recorder_params ask for it with
+        {"fmt": "csv"} ({"fmt": "npz"}) or an explicit "path". The other
+        recorder_params are passed on to EquityRecorder, e.g.
+        {"policy": "every", "every": 100}.
         """
-        filename = 'backtest.csv'
-        out_file = open(os.path.join(OUTPUT_RESULT_DIR, filename), 'w')
-        header = "Timestamp,Balance"
-        for pair in self.ticker.pairs:
-            header += ",%s,%s,%s" % (pair,
-                                     pair + "_PositionType", 
-                                     pair + "_Units")
-        header += "\n"
-        out_file.write(header)
-        if self.backtest:
-            print(header)
-        return out_file
+        params = dict(recorder_params or {})
+        if "fmt" in params:
+            params.setdefault("path", os.path.join(
+                    self.output_dir, "backtest.%s" % params["fmt"]))
+        return EquityRecorder(self.ticker.pairs, self.numeric, **params)
     
-    def output_results(self):
-        # Closes off the Backteste.csv file so it can be read via Pandas 
-        # without the problems
-        self.backtest_file.close()
-        
-        in_filename = 'backtest.csv'
-        out_filename = 'equity.csv'
-        in_file = os.path.join(OUTPUT_RESULT_DIR, in_filename)
-        out_file = os.path.join(OUTPUT_RESULT_DIR, out_filename)
-        
-        # Create equity curve dataframe
-        df = pd.read_csv(in_file, index_col=0)
-        df.dropna(inplace=True)
-        df["Total"] = df.sum(axis=1) # what value are we summing from backtest.csv?
-        df["Returns"] = df["Total"].pct_change()
-        df["Equity"] = (1.0 + df["Returns"]).cumprod()
+    def equity_curve(self):
+        """
+        Balance plus unrealised profit at every recorded tick.
+        """
+        return self.recorder.equity()
+    
+    def output_results(self, export=None):
+        """
+        Computes the equity curve (Total), its returns, the curve normalised
+        to start at 1.0 (Equity) and its drawdown straight from the recorded
+        rows in memory. The DataFrame is kept in self.results and returned;
+        with export (export_results of the portfolio by default) it is also
+        written to output_dir/equity.csv. The performance statistics (see
+        performance/performance.py) are kept in self.statistics.
+        """
+        self.recorder.close()
+        total = self.equity_curve()
+        values = total.values
+        returns = np.zeros(len(values))
+        equity = np.ones(len(values))
+        if len(values):
+            returns[1:] = values[1:] / values[:-1] - 1.0
+            equity = values / values[0]
+        drawdown, max_dd, dd_duration = create_drawdowns(equity)
         
-        # Create drawdown statistics
-        drawdown, max_dd, dd_duration = create_drawdowns(df["Equity"]) # input needs to be pnl
-        df['Drawdown'] = drawdown
-        df.to_csv(out_file, index=True)
+        # realised P&L of the closed trades: the changes of the balance
+        data = self.recorder.data()
+        realised = np.diff(data[:, 1])
+        self.statistics = summary(
+                values, times=total.index, realised=realised[realised != 0],
+                position_types=data[:, 3::3])
+        self.results = pd.DataFrame({
+                "Total": values,
+                "Returns": returns,
+                "Equity": equity,
+                "Drawdown": drawdown}, index=total.index)
         
-        print("Simulation compelte and results exported to %s" % out_filename)
+        if export is None:
+            export = self.export_results
+        if export:
+            out_filename = 'equity.csv'
+            self.results.to_csv(os.path.join(self.output_dir, out_filename),
+                                index=True)
+            print("Simulation complete and results exported to %s" % out_filename)
+        else:
+            print("Simulation complete")
+        for name, value in self.statistics.items():
+            print("%s: %s" % (name, value))
+        return self.results
     
     def update_portfolio(self, tick_event):
         """
         This updates all positions ensuring an up to date unrealised profit
-        and loss (PnL)
+        and loss (PnL). Only the positions whose traded pair or quote/home
+        conversion pair the tick re-priced are updated, found in the
+        dependency index.
         """
-        currency_pair = tick_event.instrument
-        if currency_pair in self.positions:
-            #print("self.positions: %s" % self.positions)
-            ps = self.positions[currency_pair]
-            # perform the price update
-            ps.update_position_price()
+        dependents = self.dependents.get(tick_event.instrument)
+        if dependents:
+            for ps in dependents.values():
+                # perform the price update
+                ps.update_position_price()
         if self.backtest:
-            #print("self.positions: %s" % self.positions)
-            out_line = "%s,%s" % (tick_event.time, self.balance)
-            for pair in self.ticker.pairs:
-                if pair in self.positions:
-                    
-                    out_line += ",%s, %s, %s" % (self.positions[pair].profit_base,
-                                                 self.positions[pair].position_type,
-                                                 self.positions[pair].units)
-                    print(out_line)
-                else:
-                    out_line += ",0.00, 0.00, 0.00"
-            out_line += "\n"
-            self.backtest_file.write(out_line)
+            # buffered, written out a whole chunk at a time
+            self.recorder.record(tick_event.time, self.balance, self.positions)
+        if self.metrics is not None:
+            self.update_metrics(tick_event)
+    
+    def update_metrics(self, tick_event):
+        """
+        Feeds the balance and the unrealised profit after a tick to the
+        metrics tracker.
+        """
+        numeric = self.numeric
+        unrealised = 0.0
+        for ps in self.positions.values():
+            unrealised += float(numeric.profit_to_decimal(ps.profit_base))
+        self.metrics.on_tick(tick_event.time,
+                             float(numeric.money_to_decimal(self.balance)),
+                             unrealised, float(self.equity))
                 
             
     # TODO:
@@ -146,14 +224,8 @@ class Portfolio(object):
         print(signal_event)
         # Check that the price ticker contians all necessary currency pairs
         # prior to executing an order
-        execute = True
-        tp = self.ticker.prices
-        #print("Ticker.prices: ", self.ticker.prices)
-        for pair in tp:
-            if tp[pair]['ask'] is None or tp[pair]['bid'] is None:
-                execute = False
-                print("ERROR: Pair[ask] and pair[bid] are equal to None so execute = False. \
-                      Check ask and bid prices!!!")
+        execute = self.ticker.prices_ready(
+                self.order_pairs(signal_event.instrument))
             
         # All necessary pricing data is available so we can execute
         if execute:
@@ -252,21 +324,21 @@ class Portfolio(object):
             
             
             
-            self.logger.info("Portfolio Balance: %s" % self.balance)
+            self.logger.info("Portfolio Balance: %s" % 
+                             self.numeric.money_to_decimal(self.balance))
         else:
-            self.logger.info("Unable to execute order as price data was insufficient")
+            self.logger.info("Unable to execute order as price data for %s "
+                             "was insufficient" % signal_event.instrument)
             
     # temporary function until you fix the _execute_signal function
     def execute_signal(self, signal_event):
         print(signal_event)
+        if self.metrics is not None:
+            self.metrics.on_signal(signal_event)
 
-        execute = True
-        tp = self.ticker.prices
-        for pair in tp:
-            if tp[pair]['ask'] is None or tp[pair]['bid'] is None:
-                execute = False
-                print("ERROR: Pair[ask] and pair[bid] are equal to None so execute = False. \
-                      Check ask and bid prices!!!")
+        # Check that the ticker has the prices a position in the pair needs
+        execute = self.ticker.prices_ready(
+                self.order_pairs(signal_event.instrument))
             
         if execute:
             side = signal_event.side
@@ -313,9 +385,13 @@ class Portfolio(object):
             
             order = OrderEvent(currency_pair, units, "market", side)
             self.events.put(order)
+            if self.metrics is not None:
+                self.metrics.on_order(order)
                 
 
-            self.logger.info("Portfolio Balance: %s" % self.balance)
+            self.logger.info("Portfolio Balance: %s" % 
+                             self.numeric.money_to_decimal(self.balance))
         else:
-            self.logger.info("Unable to execute order as price data was insufficient")
+            self.logger.info("Unable to execute order as price data for %s "
+                             "was insufficient" % signal_event.instrument)
     
\ No newline at end of file
@@ -1,8 +1,6 @@
 import sys
 sys.path.append('../')
 
-from decimal import Decimal, getcontext, ROUND_HALF_DOWN
-
 
 class Position(object):
     
@@ -13,6 +11,8 @@ class Position(object):
         self.currency_pair = currency_pair
         self.units = units
         self.ticker = ticker
+        # numeric backend of the ticker prices (see numeric/numeric.py)
+        self.numeric = ticker.numeric
         self.set_up_currencies()
         self.profit_base = self.calculate_profit_base()
         self.profit_perc = self.calculate_profit_perc()
@@ -43,37 +43,33 @@ class Position(object):
         # Ask > Bid
 
         if self.position_type == 'long' :
-            self.avg_price = Decimal(str(ticker_cur['ask'])) # price you pay when buying
-            self.cur_price = Decimal(str(ticker_cur['bid'])) # current price
+            self.avg_price = ticker_cur['ask'] # price you pay when buying
+            self.cur_price = ticker_cur['bid'] # current price
         else:
-            self.avg_price = Decimal(str(ticker_cur['bid'])) # price you receive when selling
-            self.cur_price = Decimal(str(ticker_cur['ask'])) # current price
+            self.avg_price = ticker_cur['bid'] # price you receive when selling
+            self.cur_price = ticker_cur['ask'] # current price
 
     
+    def price_dependencies(self):
+        """
+        Entries of ticker.prices the profit of the position depends on: the
+        traded pair and the quote/home conversion pair.
+        """
+        return (self.currency_pair, self.quote_home_currency_pair)
+    
     def calculate_pips(self):
         """
         Calculates pips as a difference between current and average price.
+        If i'm buying the pips are calc as Ask - Bid so the mult is positive,
+        if i'm selling the pips are calc as Bid - Ask so the mult is negative.
         """
-        getcontext().rounding = ROUND_HALF_DOWN
-
-        if self.position_type == 'long':
-            # If i'm buying the pips are calc as Ask - Bid so the mult is positive
-            mult = Decimal("1")
-        elif self.position_type == 'short':
-            # If i'm selling the pips are calc as Bid - Ask so the mult is negative  
-            mult = Decimal("-1")
-        #print("cur_price: ", self.cur_price)
-        pips = (mult * (self.cur_price - self.avg_price).quantize(
-                Decimal("0.00001")))
-        return pips
+        return self.numeric.pips(self.position_type, self.cur_price,
+                                 self.avg_price)
     
     def calculate_profit_base(self):
         """
         Calculate absolute amount of trade (?) profit.
         """
-        #print("calculate_profit_base")
-        getcontext().rounding = ROUND_HALF_DOWN
-        
         pips = self.calculate_pips()
         ticker_qh = self.ticker.prices[self.quote_home_currency_pair]
         if self.position_type == 'long':
@@ -81,16 +77,14 @@ class Position(object):
         else:
             qh_close = ticker_qh['ask']
         
-        profit = pips * qh_close * self.units
-        return profit.quantize(Decimal("0.00001"))
+        return self.numeric.profit(pips, qh_close, self.units)
     
     def calculate_profit_perc(self):
         """
         Calculate trade (?) profit in relative terms. The denominator is 
         numbner of traded units * 100.
         """
-        return (self.profit_base / self.units * Decimal("100.00")).quantize(
-                Decimal("0.00001"), ROUND_HALF_DOWN)
+        return self.numeric.profit_perc(self.profit_base, self.units)
     
     def update_position_price(self):
         """
@@ -99,9 +93,9 @@ class Position(object):
         ticker_cur = self.ticker.prices[self.currency_pair]
         
         if self.position_type == 'long':
-            self.cur_price = Decimal(str(ticker_cur['bid']))
+            self.cur_price = ticker_cur['bid']
         else:
-            self.cur_price = Decimal(str(ticker_cur['ask']))
+            self.cur_price = ticker_cur['ask']
         
         self.profit_base = self.calculate_profit_base()
         self.profit_perc = self.calculate_profit_perc()
@@ -111,7 +105,7 @@ class Position(object):
         Add units to existing trade. First update current prices
         and then calculate new total cost.
         """
-        dec_units = Decimal(str(units))
+        dec_units = self.numeric.units(units)
         cp = self.ticker.prices[self.currency_pair]
         # get current CCY quote
         if self.position_type == 'long':
@@ -119,13 +113,13 @@ class Position(object):
         elif self.position_type == 'short':
             add_price = cp['bid']
             
-        new_total_units = self.units + dec_units
-        # New total cost is equal to:
+        # New average price is equal to:
         # previously paid price (self.avg_price * self.units) plus
         # new cost of bying additional units add_price * units
-        new_total_cost = self.avg_price * self.units + add_price * units
-        self.avg_price = new_total_cost / new_total_units
-        self.units = new_total_units
+        # divided by the new total number of units
+        self.avg_price = self.numeric.average_price(
+                self.avg_price, self.units, add_price, dec_units)
+        self.units = self.units + dec_units
         self.update_position_price()
         
     
@@ -135,10 +129,7 @@ class Position(object):
         Dont udnerstand why getting remove_price and then not using it.
         Check if pnl is calcualted correctly.
         """
-        #print("remove_units")
-        getcontext().rounding = ROUND_HALF_DOWN
-        
-        dec_units = Decimal(str(units))
+        dec_units = self.numeric.units(units)
         #ticker_cp = self.ticker.prices[self.currency_pair]
         ticker_qh = self.ticker.prices[self.quote_home_currency_pair]
         
@@ -152,16 +143,13 @@ class Position(object):
         self.units -= dec_units
         self.update_position_price()
         # Calculate pnl
-        pnl = self.calculate_pips() * qh_close * dec_units
-        return pnl.quantize(Decimal("0.01"))
+        return self.numeric.pnl(self.calculate_pips(), qh_close, dec_units)
     
     def close_position(self):
         """
         ???
         Check this
         """
-        getcontext().rounding = ROUND_HALF_DOWN
-        
         #ticker_cp = self.ticker.prices[self.currency_pair]
         ticker_qh = self.ticker.prices[self.quote_home_currency_pair]
         if self.position_type == 'long':
@@ -170,6 +158,4 @@ class Position(object):
             qh_close = ticker_qh['bid'] # If we are short, wht is closing price bid?!
         self.update_position_price()
         # Calculate pnl
-        pnl = self.calculate_pips() * qh_close * self.units
-        return pnl.quantize(Decimal("0.01"))
-        
\ No newline at end of file
+        return self.numeric.pnl(self.calculate_pips(), qh_close, self.units)
\ No newline at end of file
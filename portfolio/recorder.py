@@ -0,0 +1,312 @@
+"""
+
+Buffered equity recorder of the Portfolio.
+
+Instead of formatting and writing a line of backtest.csv on every tick, the
+Portfolio hands the balance and its positions to an EquityRecorder. The
+recorder stores them as fixed-point integers in preallocated int64 chunks of
+chunk_size rows, one row per recorded tick:
+
+    time (epoch ns), balance (cents),
+    and for every pair: unrealised profit (0.00001), position type
+    (1 long, -1 short, 0 none), units
+
+and writes them out a whole chunk at a time. Which ticks are recorded is set
+by the policy:
+
+    tick:   every tick (the default, same rows as the original backtest.csv)
+    every:  every 'every'-th tick
+    change: only ticks on which the balance or a position changed
+    bucket: the last tick of every time bucket, e.g. bucket="1min"
+
+With every policy but 'tick' the last tick of the backtest is recorded as
+well, so the recording always ends with the final state. The file is either
+backtest.csv, byte for byte in the original format, or a compressed NumPy
+archive (fmt="npz") that load_equity() reads back. Without a path nothing is
+written and the rows are only kept in memory (see data(), to_frame() and
+equity()).
+"""
+import sys
+sys.path.append('../')
+
+import numpy as np
+import pandas as pd
+
+from numeric.numeric import PRICE_PLACES, MONEY_PLACES
+
+
+POLICIES = ("tick", "every", "change", "bucket")
+FORMATS = ("csv", "npz")
+
+POSITION_TYPES = {"long": 1, "short": -1}
+POSITION_NAMES = {1: "long", -1: "short"}
+
+_DAY = 86400 * 10**9
+_ZERO = ord("0")
+
+
+def fixed_to_str(value, places):
+    """
+    Formats an integer count of 10**-places like str() of the Decimal.
+    """
+    sign = "-" if value < 0 else ""
+    q, r = divmod(abs(value), 10 ** places)
+    return "%s%d.%0*d" % (sign, q, places, r)
+
+
+def format_times(times):
+    """
+    Formats an int64 array of epoch nanoseconds like str(pd.Timestamp).
+
+    The digits are computed on the whole array at once into a fixed width
+    'YYYY-MM-DD HH:MM:SS.ffffff' byte matrix; only the times without a
+    fraction of a second or with nanoseconds are fixed up one by one.
+    """
+    n = len(times)
+    days = times // _DAY
+    tod = times - days * _DAY
+    unique, inverse = np.unique(days, return_inverse=True)
+    dates = "".join(np.datetime_as_string(
+            unique.astype("datetime64[D]")).tolist()).encode()
+    out = np.empty((n, 26), dtype=np.uint8)
+    out[:, :10] = np.frombuffer(dates, dtype=np.uint8).reshape(-1, 10)[inverse]
+    out[:, 10] = ord(" ")
+    out[:, 13] = out[:, 16] = ord(":")
+    out[:, 19] = ord(".")
+    seconds, frac = np.divmod(tod, 10**9)
+    hours, rest = np.divmod(seconds, 3600)
+    minutes, seconds = np.divmod(rest, 60)
+    for col, value in ((11, hours), (14, minutes), (17, seconds)):
+        out[:, col] = value // 10 + _ZERO
+        out[:, col + 1] = value % 10 + _ZERO
+    micros = frac // 1000
+    for col in range(25, 19, -1):
+        out[:, col] = micros % 10 + _ZERO
+        micros //= 10
+    text = out.tobytes().decode()
+    formatted = [text[i:i + 26] for i in range(0, 26 * n, 26)]
+    for i in np.flatnonzero(frac == 0).tolist():
+        formatted[i] = formatted[i][:19]
+    for i in np.flatnonzero(frac % 1000).tolist():
+        formatted[i] = "%s%09d" % (formatted[i][:20], frac[i])
+    return formatted
+
+
+def _frame(data, pairs):
+    """
+    DataFrame of recorded rows with the columns of backtest.csv. Money and
+    profit are floats, the position types 1 (long), -1 (short) or 0.
+    """
+    index = pd.DatetimeIndex(data[:, 0].view("datetime64[ns]"),
+                             name="Timestamp")
+    columns = {"Balance": data[:, 1] / 10.0 ** MONEY_PLACES}
+    for i, pair in enumerate(pairs):
+        col = 2 + 3 * i
+        columns[pair] = data[:, col] / 10.0 ** PRICE_PLACES
+        columns[pair + "_PositionType"] = data[:, col + 1]
+        columns[pair + "_Units"] = data[:, col + 2]
+    return pd.DataFrame(columns, index=index)
+
+
+def load_equity(path):
+    """
+    Reads a recording written with fmt="npz" into a DataFrame (see
+    EquityRecorder.to_frame()).
+    """
+    with np.load(path) as archive:
+        return _frame(archive["data"], archive["pairs"].tolist())
+
+
+class EquityRecorder(object):
+    """
+    Records the balance and the unrealised profit, position type and units
+    of every pair into preallocated int64 chunks.
+    """
+
+    def __init__(self, pairs, numeric, policy="tick", every=1, bucket=None,
+                 path=None, fmt="csv", chunk_size=65536):
+        """
+        Args:
+            pairs: the recorded currency pairs
+            numeric: numeric backend of the portfolio
+            policy: 'tick', 'every', 'change' or 'bucket'
+            every: record every n-th tick with the 'every' policy
+            bucket: bucket length with the 'bucket' policy, anything
+                pd.Timedelta accepts ("1min", "1h", nanoseconds)
+            path: output file, nothing is written if None
+            fmt: 'csv' or 'npz'
+            chunk_size: rows per preallocated chunk
+        """
+        if policy not in POLICIES:
+            raise ValueError("Unknown recording policy: %s" % policy)
+        if fmt not in FORMATS:
+            raise ValueError("Unknown recording format: %s" % fmt)
+        if policy == "bucket":
+            if bucket is None:
+                raise ValueError("The bucket policy needs a bucket length")
+            bucket = pd.Timedelta(bucket).value
+        if policy == "every" and every < 1:
+            raise ValueError("every has to be at least 1, got %s" % every)
+        self.pairs = list(pairs)
+        self.numeric = numeric
+        self.policy = policy
+        self.every = every
+        self.bucket = bucket
+        self.path = path
+        self.fmt = fmt
+        self.chunk_size = chunk_size
+        self.width = 2 + 3 * len(self.pairs)
+        self.chunks = []
+        self.chunk = np.empty((chunk_size, self.width), dtype=np.int64)
+        # committed rows of the current chunk
+        self.rows = 0
+        # whether the row at self.rows holds a tick that is not committed yet
+        self.pending = False
+        self.ticks = 0
+        self._balance = None
+        self._balance_fixed = None
+        # last committed row ('change') or bucket of the pending row ('bucket')
+        self.last = None
+        self.closed = False
+        self.file = None
+        # text of the recently written rows without their time
+        self._text = {}
+        if path is not None and fmt == "csv":
+            self.file = open(path, "w")
+            self.file.write(self.header())
+
+    def __len__(self):
+        return len(self.chunks) * self.chunk_size + self.rows
+
+    def header(self):
+        header = "Timestamp,Balance"
+        for pair in self.pairs:
+            header += ",%s,%s,%s" % (pair,
+                                     pair + "_PositionType",
+                                     pair + "_Units")
+        return header + "\n"
+
+    def record(self, time, balance, positions):
+        """
+        Records the state of the portfolio at a tick: its balance and the
+        dict of open positions by pair.
+        """
+        numeric = self.numeric
+        if balance is not self._balance:
+            # the balance only changes when a position is reduced or closed
+            self._balance = balance
+            self._balance_fixed = numeric.money_to_fixed(balance)
+        try:
+            row = [time.value, self._balance_fixed]
+        except AttributeError:
+            row = [pd.Timestamp(time).value, self._balance_fixed]
+        for pair in self.pairs:
+            ps = positions.get(pair)
+            if ps is None:
+                row += (0, 0, 0)
+            else:
+                row += (numeric.profit_to_fixed(ps.profit_base),
+                        POSITION_TYPES[ps.position_type], int(ps.units))
+
+        policy = self.policy
+        if policy == "tick":
+            commit = True
+        elif policy == "every":
+            commit = self.ticks % self.every == 0
+        elif policy == "change":
+            commit = self.last is None or row[1:] != self.last
+            if commit:
+                self.last = row[1:]
+        else:
+            bucket = row[0] // self.bucket
+            if self.pending and bucket != self.last:
+                self._commit()
+            self.last = bucket
+            commit = False
+        self.ticks += 1
+
+        self.chunk[self.rows] = row
+        if commit:
+            self._commit()
+        else:
+            self.pending = True
+
+    def _commit(self):
+        self.pending = False
+        self.rows += 1
+        if self.rows == self.chunk_size:
+            self.chunks.append(self.chunk)
+            if self.file is not None:
+                self._write_csv(self.chunk)
+            self.chunk = np.empty((self.chunk_size, self.width), dtype=np.int64)
+            self.rows = 0
+
+    def _write_csv(self, rows):
+        """
+        Appends rows to the CSV file in the format of the original
+        backtest.csv. The text after the time repeats as long as the
+        balance and the positions do not change, so it is cached.
+        """
+        cache = self._text
+        if len(cache) > self.chunk_size:
+            cache.clear()
+        lines = []
+        for time, values in zip(format_times(rows[:, 0]),
+                                map(tuple, rows[:, 1:].tolist())):
+            text = cache.get(values)
+            if text is None:
+                line = [fixed_to_str(values[0], MONEY_PLACES)]
+                for i in range(1, len(values), 3):
+                    if values[i + 1] == 0:
+                        line.append("0.00, 0.00, 0.00")
+                    else:
+                        line.append("%s, %s, %d" % (
+                                fixed_to_str(values[i], PRICE_PLACES),
+                                POSITION_NAMES[values[i + 1]], values[i + 2]))
+                text = cache[values] = ",".join(line)
+            lines.append("%s,%s\n" % (time, text))
+        self.file.write("".join(lines))
+
+    def data(self):
+        """
+        All recorded rows as a single int64 array.
+        """
+        return np.concatenate(self.chunks + [self.chunk[:self.rows]])
+
+    def equity(self):
+        """
+        Balance plus the unrealised profit of every pair at every recorded
+        tick, as a Series of floats in the home currency. The sum is exact,
+        on the fixed-point values.
+        """
+        data = self.data()
+        total = data[:, 1] * 10 ** (PRICE_PLACES - MONEY_PLACES) + \
+            data[:, 2::3].sum(axis=1)
+        index = pd.DatetimeIndex(data[:, 0].view("datetime64[ns]"),
+                                 name="Timestamp")
+        return pd.Series(total / 10.0 ** PRICE_PLACES, index=index,
+                         name="Equity")
+
+    def to_frame(self):
+        """
+        The recorded rows as a DataFrame with the columns of backtest.csv,
+        indexed by time.
+        """
+        return _frame(self.data(), self.pairs)
+
+    def close(self):
+        """
+        Records the pending last tick and writes the remaining rows out.
+        Calling close() again does nothing.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        if self.pending:
+            self._commit()
+        if self.file is not None:
+            self._write_csv(self.chunk[:self.rows])
+            self.file.close()
+        elif self.path is not None:
+            np.savez_compressed(self.path, data=self.data(),
+                                pairs=np.array(self.pairs))
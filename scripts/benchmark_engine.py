@@ -0,0 +1,72 @@
+"""
+
+Parity check and benchmark of the backtest engines (backtest/backtest.py).
+
+Runs the same backtest over [start, end] with the polling queue engine and
+the direct dispatch engine, checks that the final balances and the recorded
+backtest.csv lines are identical and reports the wall time of both runs.
+Both runs stream every tick of the range, so max_iters is set high enough
+for the queue engine, which counts loop iterations instead of ticks.
+
+Usage:
+    python scripts/benchmark_engine.py [start] [end] [test|ma]
+"""
+import sys
+sys.path.append('../')
+
+import os
+import time
+import hashlib
+import contextlib
+
+from backtest.backtest import Backtest
+from data.price import HistoricCSVPriceHandler
+from execution.execution import SimulatedExecution
+from portfolio.portfolio import Portfolio
+from settings import EQUITY, OUTPUT_RESULT_DIR
+from strategy.strategy import TestStrategy, MovingAverageCrossStrategy
+
+
+def run(engine, strategy, strategy_params, start, end):
+    """
+    Runs a single backtest and returns (final balance, md5 of backtest.csv,
+    wall time in seconds).
+    """
+    backtest = Backtest(
+            ["GBPUSD"], HistoricCSVPriceHandler,
+            strategy, strategy_params,
+            Portfolio, SimulatedExecution,
+            equity=EQUITY, heartbeat=0.0, max_iters=10**9,
+            start=start, end=end, engine=engine,
+            portfolio_params={"recorder_params": {"fmt": "csv"}})
+    started = time.time()
+    with open(os.devnull, "w") as devnull:
+        with contextlib.redirect_stdout(devnull):
+            backtest._run_backtest()
+    elapsed = time.time() - started
+    portfolio = backtest.portfolio
+    portfolio.recorder.close()
+    with open(os.path.join(OUTPUT_RESULT_DIR, "backtest.csv"), "rb") as f:
+        digest = hashlib.md5(f.read()).hexdigest()
+    return portfolio.numeric.money_to_decimal(portfolio.balance), digest, elapsed
+
+
+if __name__ == '__main__':
+    start = sys.argv[1] if len(sys.argv) > 1 else "2018-07-03"
+    end = sys.argv[2] if len(sys.argv) > 2 else "2018-07-03 23:59:59"
+    if len(sys.argv) > 3 and sys.argv[3] == 'ma':
+        strategy, strategy_params = MovingAverageCrossStrategy, {
+                "short_window": 500, "long_window": 2000}
+    else:
+        strategy, strategy_params = TestStrategy, {}
+
+    results = {}
+    for engine in ("queue", "direct"):
+        results[engine] = run(engine, strategy, strategy_params, start, end)
+        print("%s: balance %s, backtest.csv md5 %s, %.2fs" % (
+                (engine,) + results[engine]))
+
+    slow, fast = results["queue"], results["direct"]
+    print("Identical balance: %s" % (slow[0] == fast[0]))
+    print("Identical backtest.csv: %s" % (slow[1] == fast[1]))
+    print("Speedup: %.2fx" % (slow[2] / fast[2]))
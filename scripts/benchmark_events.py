@@ -0,0 +1,147 @@
+"""
+
+Measures the memory per event and the dispatch cost of the event types in
+event/event.py against the previous dict-backed events with a string type,
+and the tick throughput of streaming TickBatchEvents instead of TickEvents
+from the CSV files in settings.CSV_DATA_DIR.
+
+Usage:
+    python scripts/benchmark_events.py [n_events] [batch_size]
+"""
+import sys
+sys.path.append('../')
+
+import time
+import tracemalloc
+import pandas as pd
+
+from settings import CSV_DATA_DIR
+from backtest.backtest import EventDeque
+from data.price import HistoricCSVPriceHandler
+from event.event import TickEvent, SignalEvent, OrderEvent, EventType
+
+
+class DictTickEvent(object):
+    """
+    The previous TickEvent: a __dict__ per instance and a string type.
+    """
+    def __init__(self, instrument, time, bid, ask):
+        self.type = 'TICK'
+        self.instrument = instrument
+        self.time = time
+        self.bid = bid
+        self.ask = ask
+
+
+def bytes_per_event(cls, n):
+    """
+    Average number of bytes allocated per event, excluding its values.
+    """
+    stamp = pd.Timestamp("2018-07-03")
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    events = [cls("GBPUSD", stamp, 1.31754, 1.31766) for _ in range(n)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del events
+    return (after - before) / float(n)
+
+
+def _counters():
+    count = [0, 0, 0]
+    def on_tick(event):
+        count[0] += 1
+    def on_signal(event):
+        count[1] += 1
+    def on_order(event):
+        count[2] += 1
+    return count, on_tick, on_signal, on_order
+
+
+def dispatch_strings(events):
+    count, on_tick, on_signal, on_order = _counters()
+    for event in events:
+        if event.type == 'TICK':
+            on_tick(event)
+        elif event.type == 'SIGNAL':
+            on_signal(event)
+        elif event.type == 'ORDER':
+            on_order(event)
+    return count
+
+
+def dispatch_enum(events):
+    count, on_tick, on_signal, on_order = _counters()
+    TICK, SIGNAL, ORDER = EventType.TICK, EventType.SIGNAL, EventType.ORDER
+    for event in events:
+        kind = event.type
+        if kind is TICK:
+            on_tick(event)
+        elif kind is SIGNAL:
+            on_signal(event)
+        elif kind is ORDER:
+            on_order(event)
+    return count
+
+
+def dispatch_table(events):
+    count, on_tick, on_signal, on_order = _counters()
+    handlers = {EventType.TICK: on_tick, EventType.SIGNAL: on_signal,
+                EventType.ORDER: on_order}
+    for event in events:
+        handlers[event.type](event)
+    return count
+
+
+def timed(func, *args):
+    start = time.time()
+    func(*args)
+    return time.time() - start
+
+
+def stream(batch_size, max_ticks):
+    """
+    Streams max_ticks ticks one by one or in batches and returns ticks/s.
+    """
+    events = EventDeque()
+    handler = HistoricCSVPriceHandler(["GBPUSD"], events, CSV_DATA_DIR)
+    ticks = 0
+    start = time.time()
+    while ticks < max_ticks and handler.continue_backtest:
+        if batch_size:
+            ticks += handler.stream_next_batch(batch_size)
+        else:
+            handler.stream_next_tick()
+            ticks += 1
+        events.clear()
+    return ticks / (time.time() - start)
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    print("Bytes per tick event: dict %.0f, slotted %.0f" % (
+            bytes_per_event(DictTickEvent, n), bytes_per_event(TickEvent, n)))
+
+    stamp = pd.Timestamp("2018-07-03")
+    old = [DictTickEvent("GBPUSD", stamp, 1.3, 1.3) for _ in range(n)]
+    new = []
+    for i in range(n):
+        if i % 10 == 8:
+            new.append(SignalEvent("GBPUSD", "market", "buy", stamp))
+        elif i % 10 == 9:
+            new.append(OrderEvent("GBPUSD", 2000, "market", "buy"))
+        else:
+            new.append(TickEvent("GBPUSD", stamp, 1.3, 1.3))
+    for i in range(8, n, 10):
+        old[i].type = 'SIGNAL'
+    for i in range(9, n, 10):
+        old[i].type = 'ORDER'
+    print("Dispatch of %d events: string if/elif %.3fs, EventType if/elif "
+          "%.3fs, EventType table %.3fs" % (
+            n, timed(dispatch_strings, old), timed(dispatch_enum, new),
+            timed(dispatch_table, new)))
+
+    print("Streaming: TickEvent %.0f ticks/s, TickBatchEvent(%d) %.0f ticks/s" % (
+            stream(None, n), batch_size, stream(batch_size, n)))
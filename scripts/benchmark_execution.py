@@ -0,0 +1,86 @@
+"""
+
+Benchmark of the OANDA order execution (execution/execution.py) against the
+local fake v20 order endpoint (scripts/fake_v20.py).
+
+Submits the same orders with every setup and reports how long the trading
+thread was held up per order, the time until the last FillEvent arrived on
+the events queue, the order throughput, the order latencies and the number
+of HTTP connections the broker saw. In the last setup the broker holds back
+the answer to a share of the orders past the timeout of the handler, which
+has to reconcile each of them by its client order id. The synchronous setup (workers=0) is how
+every order used to be sent, on the trading thread. max_pending is set to
+the number of orders, so submitting never waits for a worker.
+
+Usage:
+    python scripts/benchmark_execution.py [orders] [latency in seconds]
+"""
+import sys
+sys.path.append('../')
+
+import time
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+import numpy as np
+
+from event.event import OrderEvent
+from execution.execution import OANDAExecutionHandler
+from fake_v20 import FakeV20Server
+
+
+SETUPS = [
+        ("synchronous", {"workers": 0, "rate": None}, {}),
+        ("1 worker", {"workers": 1, "rate": None}, {}),
+        ("4 workers", {"workers": 4, "rate": None}, {}),
+        ("8 workers", {"workers": 8, "rate": None}, {}),
+        ("8 workers, broker limit 50/s", {"workers": 8, "rate": None},
+         {"max_rate": 50}),
+        ("8 workers, limit 45/s", {"workers": 8, "rate": 45},
+         {"max_rate": 50}),
+        ("8 workers, 5% answers lost",
+         {"workers": 8, "rate": None, "timeout": 0.5, "reconcile_delay": 0.1},
+         {"lost_rate": 0.05, "lost_delay": 1.0}),
+        ]
+
+
+def run(orders, latency, params, server_params):
+    server = FakeV20Server(latency=latency, **server_params).start()
+    events = queue.Queue()
+    execution = OANDAExecutionHandler(
+            "practice", "token", "101-004-0000000-001", events_queue=events,
+            max_pending=orders, api_url=server.url, **params)
+    started = time.monotonic()
+    for i in range(orders):
+        side = "buy" if i % 2 else "sell"
+        execution.execute_order(OrderEvent(
+                "GBPUSD", 1000 if i % 2 else -1000, "market", side))
+    submitted = time.monotonic() - started
+    fills = [events.get() for _ in range(orders)]
+    elapsed = time.monotonic() - started
+    execution.stop()
+    server.stop()
+    return fills, submitted, elapsed, server
+
+
+if __name__ == '__main__':
+    orders = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.02
+    print("%d orders, broker latency %.0f ms" % (orders, latency * 1000))
+    for name, params, server_params in SETUPS:
+        fills, submitted, elapsed, server = run(orders, latency, params,
+                                                server_params)
+        latencies = np.array([fill.latency for fill in fills]) * 1000
+        filled = sum(1 for fill in fills if fill.filled)
+        unknown = sum(1 for fill in fills if fill.status == "unknown")
+        print("%-30s submit %8.1f us/order, done %6.2fs, %6.1f orders/s, "
+              "latency p50 %6.1f ms p95 %6.1f ms, %d filled, %d rejected, "
+              "%d unknown, %d answers lost, %d connections" % (
+                      name, submitted / orders * 1e6, elapsed,
+                      orders / elapsed, np.percentile(latencies, 50),
+                      np.percentile(latencies, 95), filled,
+                      orders - filled - unknown, unknown, server.lost,
+                      server.connections))
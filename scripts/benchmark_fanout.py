@@ -0,0 +1,125 @@
+"""
+
+Parity check and benchmark of the multi-strategy fan-out
+(backtest/fanout.py).
+
+Runs a set of strategies over [start, end] once as separate direct engine
+Backtests, each streaming the data itself, and once as a single
+FanOutBacktest on one tick stream, and a third time as a FanOutBacktest
+whose moving average strategies share their averages through an
+IndicatorRegistry. Checks that every strategy ends with the same balance and
+the same backtest.csv in all modes and reports the wall times.
+
+Usage:
+    python scripts/benchmark_fanout.py [start] [end]
+"""
+import sys
+sys.path.append('../')
+
+import os
+import time
+import hashlib
+import contextlib
+
+from backtest.backtest import Backtest
+from backtest.fanout import FanOutBacktest
+from data.price import HistoricCSVPriceHandler
+from execution.execution import SimulatedExecution
+from portfolio.portfolio import Portfolio
+from settings import EQUITY, OUTPUT_RESULT_DIR
+from strategy.registry import IndicatorRegistry
+from strategy.strategy import TestStrategy, MovingAverageCrossStrategy
+
+
+STRATEGIES = {
+        "test": (TestStrategy, {}),
+        "ma_100_500": (MovingAverageCrossStrategy,
+                       {"short_window": 100, "long_window": 500}),
+        "ma_500_2000": (MovingAverageCrossStrategy,
+                        {"short_window": 500, "long_window": 2000}),
+        "ma_1000_4000": (MovingAverageCrossStrategy,
+                         {"short_window": 1000, "long_window": 4000}),
+        "ma_500_4000": (MovingAverageCrossStrategy,
+                        {"short_window": 500, "long_window": 4000}),
+        "ma_100_2000": (MovingAverageCrossStrategy,
+                        {"short_window": 100, "long_window": 2000}),
+        "ma_exact": (MovingAverageCrossStrategy,
+                     {"short_window": 500, "long_window": 2000,
+                      "exact_sma": True}),
+        }
+
+
+def result(portfolio):
+    """
+    (final balance, md5 of backtest.csv) of a finished portfolio.
+    """
+    portfolio.recorder.close()
+    with open(os.path.join(portfolio.output_dir, "backtest.csv"), "rb") as f:
+        digest = hashlib.md5(f.read()).hexdigest()
+    return portfolio.numeric.money_to_decimal(portfolio.balance), digest
+
+
+def run_separate(start, end):
+    results = {}
+    started = time.time()
+    for name, (strategy, params) in STRATEGIES.items():
+        output_dir = os.path.join(OUTPUT_RESULT_DIR, "separate", name)
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+        backtest = Backtest(
+                ["GBPUSD"], HistoricCSVPriceHandler, strategy, params,
+                Portfolio, SimulatedExecution,
+                equity=EQUITY, heartbeat=0.0, max_iters=10**9,
+                start=start, end=end, engine="direct", output_dir=output_dir,
+                portfolio_params={"recorder_params": {"fmt": "csv"}})
+        with open(os.devnull, "w") as devnull:
+            with contextlib.redirect_stdout(devnull):
+                backtest._run_backtest()
+        results[name] = result(backtest.portfolio)
+    return results, time.time() - started
+
+
+def run_fanout(start, end, registry=None):
+    strategies = STRATEGIES
+    if registry is not None:
+        strategies = {}
+        for name, (strategy, params) in STRATEGIES.items():
+            if strategy is MovingAverageCrossStrategy:
+                params = dict(params, indicators=registry)
+            strategies[name] = (strategy, params)
+    started = time.time()
+    backtest = FanOutBacktest(
+            ["GBPUSD"], HistoricCSVPriceHandler, strategies,
+            Portfolio, SimulatedExecution,
+            equity=EQUITY, heartbeat=0.0, max_iters=10**9,
+            start=start, end=end,
+            output_dir=os.path.join(OUTPUT_RESULT_DIR, "fanout"),
+            portfolio_params={"recorder_params": {"fmt": "csv"}})
+    with open(os.devnull, "w") as devnull:
+        with contextlib.redirect_stdout(devnull):
+            backtest._run_backtest()
+    results = dict((leg.name, result(leg.portfolio)) for leg in backtest.legs)
+    return results, time.time() - started
+
+
+if __name__ == '__main__':
+    start = sys.argv[1] if len(sys.argv) > 1 else "2018-07-03"
+    end = sys.argv[2] if len(sys.argv) > 2 else "2018-07-03 23:59:59"
+
+    separate, separate_time = run_separate(start, end)
+    fanout, fanout_time = run_fanout(start, end)
+    registry = IndicatorRegistry()
+    shared, shared_time = run_fanout(start, end, registry)
+    for name in STRATEGIES:
+        print("%s: balance %s, identical balance %s, identical backtest.csv %s"
+              % (name, fanout[name][0],
+                 separate[name][0] == fanout[name][0] == shared[name][0],
+                 separate[name][1] == fanout[name][1] == shared[name][1]))
+    print("Shared indicators: %d instead of %d" % (
+            len(registry), 2 * sum(1 for strategy, _ in STRATEGIES.values()
+                                   if strategy is MovingAverageCrossStrategy)))
+    print("%d separate backtests: %.2fs" % (len(STRATEGIES), separate_time))
+    print("Fan-out backtest: %.2fs (%.2fx)" % (
+            fanout_time, separate_time / fanout_time))
+    print("Fan-out backtest with shared indicators: %.2fs (%.2fx)" % (
+            shared_time, separate_time / shared_time))
@@ -0,0 +1,154 @@
+"""
+
+Parity check and benchmark of the dependency-indexed mark-to-market of the
+Portfolio (Portfolio.update_portfolio).
+
+A synthetic ticker quotes every pair of a list of currencies, with the home
+currency as the base of its pairs, and the portfolio holds a position in
+every pair. Random ticks are sent to the portfolio, which re-prices only the
+positions indexed under the instrument of the tick. After every tick of the
+parity pass all positions are re-priced again, which must not change any
+profit. The timing pass compares the indexed update with re-pricing every
+position on every tick and with the original update, which only re-priced
+the position of the ticked pair and left the positions converted through it
+stale.
+
+Usage:
+    python scripts/benchmark_mark_to_market.py [currencies] [ticks] [numeric]
+"""
+import sys
+sys.path.append('../')
+
+import time
+import random
+import itertools
+
+import pandas as pd
+
+from event.event import TickEvent
+from numeric.numeric import get_backend
+from portfolio.portfolio import Portfolio
+
+
+CURRENCIES = ["GBP", "USD", "EUR", "JPY", "CHF", "AUD", "CAD", "NZD", "SEK",
+              "NOK", "DKK", "PLN", "HUF", "CZK", "MXN", "ZAR", "SGD", "HKD",
+              "TRY", "CNH"]
+
+
+class SyntheticTicker(object):
+    """
+    Minimal ticker with the prices dict of a PriceHandler: every pair and its
+    inverse, updated together on every tick.
+    """
+
+    def __init__(self, pairs, numeric, seed=1):
+        self.pairs = pairs
+        self.numeric = numeric
+        self.random = random.Random(seed)
+        self.mids = dict((pair, self.random.uniform(0.5, 2.0))
+                         for pair in pairs)
+        self.prices = {}
+        for pair in pairs:
+            self.prices[pair] = {"bid": None, "ask": None, "time": None}
+            self.prices[pair[3:] + pair[:3]] = {
+                    "bid": None, "ask": None, "time": None}
+        self.time = pd.Timestamp("2018-07-03")
+        for pair in pairs:
+            self.tick(pair)
+
+    def tick(self, pair=None):
+        if pair is None:
+            pair = self.random.choice(self.pairs)
+        numeric = self.numeric
+        mid = self.mids[pair] * (1.0 + self.random.gauss(0.0, 0.0002))
+        self.mids[pair] = mid
+        bid = numeric.price(round(mid - 0.00005, 5))
+        ask = numeric.price(round(mid + 0.00005, 5))
+        self.time += pd.Timedelta("100ms")
+        self.prices[pair]["bid"] = bid
+        self.prices[pair]["ask"] = ask
+        self.prices[pair]["time"] = self.time
+        inverse = self.prices[pair[3:] + pair[:3]]
+        inverse["bid"] = numeric.invert(bid)
+        inverse["ask"] = numeric.invert(ask)
+        inverse["time"] = self.time
+        return TickEvent(pair, self.time, bid, ask)
+
+
+def setup(currencies, numeric, seed=1):
+    pairs = ["%s%s" % pair for pair in itertools.combinations(currencies, 2)]
+    ticker = SyntheticTicker(pairs, get_backend(numeric), seed)
+    portfolio = Portfolio(ticker, None, home_currency=currencies[0],
+                          backtest=False)
+    for i, pair in enumerate(pairs):
+        portfolio.add_new_position("long" if i % 2 else "short", pair,
+                                   1000 + i, ticker)
+    return ticker, portfolio
+
+
+def reprice_all(portfolio, tick_event):
+    for ps in portfolio.positions.values():
+        ps.update_position_price()
+
+
+def reprice_own(portfolio, tick_event):
+    ps = portfolio.positions.get(tick_event.instrument)
+    if ps is not None:
+        ps.update_position_price()
+
+
+def parity(currencies, ticks, numeric):
+    """
+    Returns the number of ticks after which a full re-price changed a profit
+    of the indexed update, and the number of positions the original update
+    left stale on average.
+    """
+    ticker, portfolio = setup(currencies, numeric)
+    mismatches = 0
+    stale = 0
+    for _ in range(ticks):
+        tick_event = ticker.tick()
+        before = dict((pair, ps.profit_base)
+                      for pair, ps in portfolio.positions.items())
+        portfolio.update_portfolio(tick_event)
+        indexed = dict((pair, ps.profit_base)
+                       for pair, ps in portfolio.positions.items())
+        reprice_all(portfolio, tick_event)
+        full = dict((pair, ps.profit_base)
+                    for pair, ps in portfolio.positions.items())
+        if indexed != full:
+            mismatches += 1
+        stale += sum(1 for pair in full
+                     if pair != tick_event.instrument and
+                     full[pair] != before[pair])
+    return mismatches, stale / float(ticks)
+
+
+def timing(currencies, ticks, numeric, update):
+    ticker, portfolio = setup(currencies, numeric)
+    tick_events = [ticker.tick() for _ in range(ticks)]
+    started = time.time()
+    for tick_event in tick_events:
+        update(portfolio, tick_event)
+    return (time.time() - started) / ticks * 1e6
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    ticks = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    numeric = sys.argv[3] if len(sys.argv) > 3 else "decimal"
+    currencies = CURRENCIES[:n]
+    pairs = n * (n - 1) // 2
+    print("%d currencies, %d pairs and positions, %d ticks, %s backend"
+          % (n, pairs, ticks, numeric))
+    mismatches, stale = parity(currencies, min(ticks, 5000), numeric)
+    print("indexed update differs from a full re-price after %d ticks"
+          % mismatches)
+    print("original update left %.2f converted positions stale per tick"
+          % stale)
+    for name, update in (
+            ("indexed", lambda p, e: p.update_portfolio(e)),
+            ("all positions", reprice_all),
+            ("own pair only", reprice_own)):
+        print("%-14s %8.2f us/tick" % (
+                name, timing(currencies, ticks, numeric, update)))
@@ -0,0 +1,126 @@
+"""
+
+Check and report of the order netting stage (execution/netting.py).
+
+Runs the same direct engine backtest over [start, end] once without netting
+and once per netting setup. Every run hands its orders to a recording
+execution handler. The portfolio has to book exactly the same balance and
+backtest.csv with and without netting. The net orders have to add up to the
+same units per instrument as the orders without netting. The report shows
+the orders and units sent to the broker and the saved share.
+
+Usage:
+    python scripts/benchmark_netting.py [start] [end] [test|ma]
+"""
+import sys
+sys.path.append('../')
+
+import os
+import time
+import hashlib
+import contextlib
+
+from backtest.backtest import Backtest
+from data.price import HistoricCSVPriceHandler
+from execution.netting import NettingExecution
+from execution.execution import SimulatedExecution
+from portfolio.portfolio import Portfolio
+from settings import EQUITY, OUTPUT_RESULT_DIR
+from strategy.strategy import TestStrategy, MovingAverageCrossStrategy
+
+
+SETUPS = [
+        ("max 2 orders", {"max_orders": 2}),
+        ("max 10 orders", {"max_orders": 10}),
+        ("1s window", {"window": 1.0}),
+        ("10s window", {"window": 10.0}),
+        ("60s window", {"window": 60.0}),
+        ("60s or 10 orders", {"window": 60.0, "max_orders": 10}),
+        ]
+
+
+class RecordingExecution(SimulatedExecution):
+    """
+    Simulated execution that keeps the orders it receives.
+    """
+
+    def __init__(self):
+        self.orders = []
+
+    def execute_order(self, event):
+        self.orders.append(event)
+
+
+def run(netting, strategy, strategy_params, start, end):
+    """
+    Runs a single backtest and returns (final balance, md5 of backtest.csv,
+    orders received by the broker, statistics of the netting stage, wall
+    time in seconds).
+    """
+    output_dir = os.path.join(OUTPUT_RESULT_DIR, "netting")
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    broker = RecordingExecution()
+    if netting is None:
+        execution, execution_params = lambda: broker, None
+    else:
+        execution, execution_params = NettingExecution, dict(
+                netting, execution=broker)
+    backtest = Backtest(
+            ["GBPUSD"], HistoricCSVPriceHandler, strategy, strategy_params,
+            Portfolio, execution,
+            equity=EQUITY, heartbeat=0.0, max_iters=10**9,
+            start=start, end=end, engine="direct", output_dir=output_dir,
+            portfolio_params={"recorder_params": {"fmt": "csv"}},
+            execution_params=execution_params)
+    started = time.time()
+    with open(os.devnull, "w") as devnull:
+        with contextlib.redirect_stdout(devnull):
+            backtest._run_backtest()
+    elapsed = time.time() - started
+    backtest.portfolio.recorder.close()
+    with open(backtest.portfolio.recorder.path, "rb") as f:
+        md5 = hashlib.md5(f.read()).hexdigest()
+    statistics = None
+    if netting is not None:
+        statistics = backtest.execution.statistics()
+    return backtest.portfolio.balance, md5, broker.orders, statistics, elapsed
+
+
+def net_units(orders):
+    units = {}
+    for order in orders:
+        units[order.instrument] = units.get(order.instrument, 0) + order.units
+    return units
+
+
+if __name__ == '__main__':
+    start = sys.argv[1] if len(sys.argv) > 1 else "2018-07-03"
+    end = sys.argv[2] if len(sys.argv) > 2 else "2018-07-03 23:59:59"
+    if len(sys.argv) > 3 and sys.argv[3] == 'ma':
+        strategy, strategy_params = MovingAverageCrossStrategy, {
+                "short_window": 500, "long_window": 2000}
+    else:
+        strategy, strategy_params = TestStrategy, {}
+
+    balance, md5, orders, _, elapsed = run(
+            None, strategy, strategy_params, start, end)
+    units = sum(abs(order.units) for order in orders)
+    print("%-17s %6d orders %10d units sent  balance %s  %.2fs" % (
+            "no netting", len(orders), units, balance, elapsed))
+    for name, netting in SETUPS:
+        nb, nmd5, norders, statistics, elapsed = run(
+                netting, strategy, strategy_params, start, end)
+        print("%-17s %6d orders %10d units sent  saved %5.1f%% of the "
+              "orders, %5.1f%% of the units  %.2fs" % (
+                      name, statistics["orders_sent"],
+                      statistics["units_sent"],
+                      100.0 * statistics["orders_saved"] /
+                      max(statistics["orders"], 1),
+                      100.0 * statistics["units_saved"] /
+                      max(statistics["units"], 1), elapsed))
+        print("%17s same portfolio: %s, same net units: %s, all orders "
+              "netted: %s" % (
+                      "", nb == balance and nmd5 == md5,
+                      net_units(norders) == net_units(orders),
+                      statistics["orders"] == len(orders)))
@@ -0,0 +1,51 @@
+"""
+
+Measures the tick throughput of the historic price handlers on the CSV files
+in settings.CSV_DATA_DIR (the bundled July 2018 GBPUSD data).
+
+Usage:
+    python scripts/benchmark_price_handler.py [max_ticks] [handler ...]
+"""
+import sys
+sys.path.append('../')
+
+import time
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+from settings import CSV_DATA_DIR
+from data import price
+
+
+def benchmark(handler_cls, pairs, max_ticks):
+    """
+    Streams up to max_ticks ticks through handler_cls and returns a tuple of
+    (ticks streamed, set up seconds, streaming seconds).
+    """
+    events = queue.Queue()
+    start = time.time()
+    handler = handler_cls(pairs, events, CSV_DATA_DIR)
+    set_up = time.time() - start
+
+    ticks = 0
+    start = time.time()
+    while ticks < max_ticks and handler.continue_backtest:
+        handler.stream_next_tick()
+        if not events.empty():
+            events.get(False)
+            ticks += 1
+    return ticks, set_up, time.time() - start
+
+
+if __name__ == '__main__':
+    max_ticks = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    names = sys.argv[2:] or ["HistoricCSVPriceHandler"]
+
+    for name in names:
+        ticks, set_up, elapsed = benchmark(
+                getattr(price, name), ["GBPUSD"], max_ticks)
+        print("%s: %s ticks, set up %.2fs, streaming %.2fs, %.0f ticks/s" % (
+                name, ticks, set_up, elapsed, ticks / elapsed))
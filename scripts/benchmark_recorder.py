@@ -0,0 +1,107 @@
+"""
+
+Benchmark of the equity recording policies of the Portfolio
+(portfolio/recorder.py).
+
+Runs the same direct engine backtest over [start, end] once per recording
+setup and reports the wall time and the size of the written file. The
+in-memory rows of the 'tick' policy are checked against backtest.csv and
+backtest.npz, and every other policy has to end with the same final row.
+
+Usage:
+    python scripts/benchmark_recorder.py [start] [end] [test|ma]
+"""
+import sys
+sys.path.append('../')
+
+import os
+import time
+import contextlib
+
+import numpy as np
+import pandas as pd
+
+from backtest.backtest import Backtest
+from data.price import HistoricCSVPriceHandler
+from execution.execution import SimulatedExecution
+from portfolio.portfolio import Portfolio
+from portfolio.recorder import load_equity
+from settings import EQUITY, OUTPUT_RESULT_DIR
+from strategy.strategy import TestStrategy, MovingAverageCrossStrategy
+
+
+SETUPS = [
+        ("tick, csv", {"fmt": "csv"}),
+        ("tick, npz", {"fmt": "npz"}),
+        ("tick, memory", {}),
+        ("every 100, csv", {"fmt": "csv", "policy": "every", "every": 100}),
+        ("change, csv", {"fmt": "csv", "policy": "change"}),
+        ("bucket 1min, csv", {"fmt": "csv", "policy": "bucket",
+                              "bucket": "1min"}),
+        ]
+
+
+def run(recorder_params, strategy, strategy_params, start, end):
+    """
+    Runs a single backtest and returns (recorder, size of the written file,
+    wall time in seconds).
+    """
+    output_dir = os.path.join(OUTPUT_RESULT_DIR, "recorder")
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    for name in ("backtest.csv", "backtest.npz"):
+        if os.path.exists(os.path.join(output_dir, name)):
+            os.remove(os.path.join(output_dir, name))
+    backtest = Backtest(
+            ["GBPUSD"], HistoricCSVPriceHandler, strategy, strategy_params,
+            Portfolio, SimulatedExecution,
+            equity=EQUITY, heartbeat=0.0, max_iters=10**9,
+            start=start, end=end, engine="direct", output_dir=output_dir,
+            portfolio_params={"recorder_params": recorder_params})
+    started = time.time()
+    with open(os.devnull, "w") as devnull:
+        with contextlib.redirect_stdout(devnull):
+            backtest._run_backtest()
+    recorder = backtest.portfolio.recorder
+    recorder.close()
+    elapsed = time.time() - started
+    size = 0
+    if recorder.path is not None:
+        size = os.path.getsize(recorder.path)
+    return recorder, size, elapsed
+
+
+if __name__ == '__main__':
+    start = sys.argv[1] if len(sys.argv) > 1 else "2018-07-03"
+    end = sys.argv[2] if len(sys.argv) > 2 else "2018-07-06 23:59:59"
+    if len(sys.argv) > 3 and sys.argv[3] == 'ma':
+        strategy, strategy_params = MovingAverageCrossStrategy, {
+                "short_window": 500, "long_window": 2000}
+    else:
+        strategy, strategy_params = TestStrategy, {}
+
+    reference = None
+    for name, params in SETUPS:
+        recorder, size, elapsed = run(params, strategy, strategy_params,
+                                      start, end)
+        data = recorder.data()
+        if reference is None:
+            reference = data
+            frame = pd.read_csv(recorder.path, index_col=0)
+            times = pd.to_datetime(frame.index, format="ISO8601")
+            check = "rows match backtest.csv: %s" % (
+                    np.array_equal(times.as_unit("ns").asi8, data[:, 0]) and
+                    np.allclose(frame[["Balance", "GBPUSD"]].values,
+                                recorder.to_frame()[["Balance", "GBPUSD"]].values))
+        elif params.get("fmt") == "npz":
+            check = "rows match backtest.csv: %s" % (
+                    np.array_equal(data, reference) and
+                    load_equity(recorder.path).equals(recorder.to_frame()))
+        elif recorder.policy == "tick":
+            check = "rows match backtest.csv: %s" % np.array_equal(
+                    data, reference)
+        else:
+            check = "final row matches: %s" % np.array_equal(
+                    data[-1], reference[-1])
+        print("%-17s %8d rows %10d bytes %6.2fs  %s" % (
+                name, len(data), size, elapsed, check))
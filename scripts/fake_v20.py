@@ -0,0 +1,265 @@
+"""
+
+Local stand-in for the order endpoints of the OANDA v20 REST API.
+
+Answers POST /v3/accounts/<account>/orders like v20 answers a market order:
+201 with an orderCreateTransaction and an orderFillTransaction, or with an
+orderCancelTransaction for a share of rejected orders. Every answer is
+delayed by a simulated broker latency, requests above max_rate per second
+are answered with 429 and requests without a bearer token with 401. For a
+share of lost orders the order is booked but the answer is held back for
+lost_delay seconds, so a client with a shorter timeout loses it. The booked
+orders can be looked up with GET /v3/accounts/<account>/orders/@<client id>
+and their transactions with GET /v3/accounts/<account>/transactions/<id>.
+The server speaks HTTP/1.1, so keep-alive sessions reuse their connection,
+and counts the requests and the connections it accepted.
+
+    server = FakeV20Server(latency=0.02).start()
+    execution = OANDAExecutionHandler("practice", "token", "account",
+                                      api_url=server.url)
+
+Usage:
+    python scripts/fake_v20.py [port] [latency in seconds]
+"""
+import sys
+sys.path.append('../')
+
+import json
+import time
+import random
+import datetime
+import threading
+from collections import deque
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc).strftime(
+            "%Y-%m-%dT%H:%M:%S.%f000Z")
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _OrderHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # the headers and the body are written separately; without TCP_NODELAY
+    # every answer on a kept-alive connection waits for a delayed ACK
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.fake.connected()
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode()
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except (IOError, OSError):
+            # the client gave up on a held back answer
+            self.close_connection = True
+
+    def _authorized(self):
+        if self.headers.get("Authorization", "").startswith("Bearer "):
+            return True
+        self._reply(401, {"errorMessage":
+                          "Insufficient authorization to perform request."})
+        return False
+
+    def do_GET(self):
+        parts = self.path.strip("/").split("/")
+        if len(parts) != 5 or parts[:2] != ["v3", "accounts"] or \
+                parts[3] not in ("orders", "transactions"):
+            self._reply(404, {"errorMessage": "Not found"})
+            return
+        if not self._authorized():
+            return
+        if parts[3] == "orders":
+            status, answer = self.server.fake.get_order(parts[4])
+        else:
+            status, answer = self.server.fake.get_transaction(parts[4])
+        self._reply(status, answer)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        parts = self.path.strip("/").split("/")
+        if len(parts) != 4 or parts[:2] != ["v3", "accounts"] or \
+                parts[3] != "orders":
+            self._reply(404, {"errorMessage": "Not found"})
+            return
+        if not self._authorized():
+            return
+        status, answer = self.server.fake.order(parts[2], json.loads(body))
+        self._reply(status, answer)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeV20Server(object):
+    """
+    Fake v20 order endpoints served from a daemon thread.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.02, jitter=0.0,
+                 reject_rate=0.0, max_rate=None, price="1.30000", seed=1,
+                 lost_rate=0.0, lost_delay=5.0):
+        """
+        Args:
+            host, port: address to listen on, port 0 picks a free port
+            latency: seconds every order takes at the broker
+            jitter: up to this many seconds are added to the latency at random
+            reject_rate: share of the orders that are cancelled
+            max_rate: orders per second above which the server answers 429
+            price: fill price of every order
+            lost_rate: share of the orders whose answer is held back
+            lost_delay: seconds the answer of a lost order is held back
+        """
+        self.server = _ThreadingHTTPServer((host, port), _OrderHandler)
+        self.server.fake = self
+        self.latency = latency
+        self.jitter = jitter
+        self.reject_rate = reject_rate
+        self.max_rate = max_rate
+        self.price = price
+        self.lost_rate = lost_rate
+        self.lost_delay = lost_delay
+        self.lost = 0
+        # booked orders by "@<client id>" and id, transactions by id
+        self.orders = {}
+        self.transactions = {}
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.transaction = 0
+        self.requests = 0
+        self.connections = 0
+        self.limited = 0
+        self.recent = deque()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+
+    @property
+    def url(self):
+        return "http://%s:%d" % self.server.server_address[:2]
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def connected(self):
+        with self.lock:
+            self.connections += 1
+
+    def order(self, account_id, body):
+        """
+        Status and JSON answer of a market order request.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.requests += 1
+            recent = self.recent
+            recent.append(now)
+            while recent[0] <= now - 1.0:
+                recent.popleft()
+            if self.max_rate is not None and len(recent) > self.max_rate:
+                self.limited += 1
+                return 429, {"errorMessage": "Rate limit violation of %s "
+                             "requests per second" % self.max_rate}
+            self.transaction += 2
+            order_id = str(self.transaction - 1)
+            fill_id = str(self.transaction)
+            delay = self.latency + self.random.uniform(0.0, self.jitter)
+            rejected = self.random.random() < self.reject_rate
+            lost = self.random.random() < self.lost_rate
+        time.sleep(delay)
+        order = body.get("order", {})
+        created = dict(order, id=order_id, accountID=account_id,
+                       time=_now(), reason="CLIENT_ORDER")
+        created["type"] = "MARKET_ORDER"
+        answer = {"orderCreateTransaction": created,
+                  "relatedTransactionIDs": [order_id, fill_id],
+                  "lastTransactionID": fill_id}
+        if rejected:
+            answer["orderCancelTransaction"] = {
+                    "id": fill_id, "type": "ORDER_CANCEL",
+                    "orderID": order_id, "accountID": account_id,
+                    "reason": "INSUFFICIENT_MARGIN", "time": _now()}
+        else:
+            answer["orderFillTransaction"] = {
+                    "id": fill_id, "type": "ORDER_FILL", "orderID": order_id,
+                    "accountID": account_id,
+                    "instrument": order.get("instrument"),
+                    "units": order.get("units"), "price": self.price,
+                    "reason": "MARKET_ORDER", "time": _now()}
+        self.book(created, answer)
+        if lost:
+            with self.lock:
+                self.lost += 1
+            time.sleep(self.lost_delay)
+        return 201, answer
+
+    def book(self, created, answer):
+        """
+        Keeps the order of an answer and its transactions for the look-ups.
+        """
+        closing = (answer.get("orderFillTransaction") or
+                   answer["orderCancelTransaction"])
+        order = dict(created, createTime=created["time"])
+        if closing["type"] == "ORDER_FILL":
+            order.update(state="FILLED", fillingTransactionID=closing["id"])
+        else:
+            order.update(state="CANCELLED",
+                         cancellingTransactionID=closing["id"])
+        with self.lock:
+            self.orders[order["id"]] = order
+            client_id = order.get("clientExtensions", {}).get("id")
+            if client_id is not None:
+                self.orders["@" + client_id] = order
+            self.transactions[created["id"]] = created
+            self.transactions[closing["id"]] = closing
+
+    def get_order(self, specifier):
+        with self.lock:
+            order = self.orders.get(specifier)
+        if order is None:
+            return 404, {"errorMessage": "The order specified does not exist",
+                         "errorCode": "ORDER_DOESNT_EXIST"}
+        return 200, {"order": order, "lastTransactionID": str(self.transaction)}
+
+    def get_transaction(self, transaction_id):
+        with self.lock:
+            transaction = self.transactions.get(transaction_id)
+        if transaction is None:
+            return 404, {"errorMessage":
+                         "The transaction specified does not exist"}
+        return 200, {"transaction": transaction,
+                     "lastTransactionID": str(self.transaction)}
+
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8080
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.02
+    server = FakeV20Server(port=port, latency=latency).start()
+    print("Fake v20 order endpoint on %s" % server.url)
+    try:
+        while True:
+            time.sleep(1.0)
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,98 @@
+"""
+
+Parity check and benchmark of the numeric backends (numeric/numeric.py).
+
+Runs the same backtest with the Decimal reference backend and the integer
+pipette backend on the data in settings.CSV_DATA_DIR, checks that the final
+balances and the recorded backtest.csv lines are identical and reports the
+wall time of both runs. The end-to-end time includes the event queue, the
+heartbeat sleep and the per-tick CSV output, so the per-tick arithmetic
+(quote conversion, inversion, pips and profit) is also timed on its own.
+
+Usage:
+    python scripts/numeric_parity.py [max_iters] [test|ma]
+"""
+import sys
+sys.path.append('../')
+
+import os
+import time
+import hashlib
+import contextlib
+
+from backtest.backtest import Backtest
+from data.price import HistoricCSVPriceHandler
+from execution.execution import SimulatedExecution
+from portfolio.portfolio import Portfolio
+from numeric.numeric import get_backend
+from settings import EQUITY, OUTPUT_RESULT_DIR
+from strategy.strategy import TestStrategy, MovingAverageCrossStrategy
+
+
+def run(numeric, strategy, strategy_params, max_iters):
+    """
+    Runs a single backtest and returns (final balance, md5 of backtest.csv,
+    wall time in seconds).
+    """
+    backtest = Backtest(
+            ["GBPUSD"], HistoricCSVPriceHandler,
+            strategy, strategy_params,
+            Portfolio, SimulatedExecution,
+            equity=EQUITY, heartbeat=0.0, max_iters=max_iters,
+            data_handler_params={"numeric": numeric},
+            portfolio_params={"recorder_params": {"fmt": "csv"}})
+    start = time.time()
+    with open(os.devnull, "w") as devnull:
+        with contextlib.redirect_stdout(devnull):
+            backtest._run_backtest()
+    elapsed = time.time() - start
+    portfolio = backtest.portfolio
+    portfolio.recorder.close()
+    with open(os.path.join(OUTPUT_RESULT_DIR, "backtest.csv"), "rb") as f:
+        digest = hashlib.md5(f.read()).hexdigest()
+    return portfolio.numeric.money_to_decimal(portfolio.balance), digest, elapsed
+
+
+def run_arithmetic(numeric, ticks=200000):
+    """
+    Times the per-tick price path of a single open position: converting the
+    bid/ask quotes, inverting them and computing pips and profit.
+    Returns the wall time in seconds.
+    """
+    backend = get_backend(numeric)
+    avg_price = backend.price(1.31754)
+    units = backend.units(2000)
+    bids = [1.31754 + (i % 500) * 0.00001 for i in range(ticks)]
+    start = time.time()
+    for quote in bids:
+        bid = backend.price(quote)
+        ask = backend.price(quote + 0.00012)
+        rate = backend.invert(ask)
+        pips = backend.pips('long', bid, avg_price)
+        backend.profit(pips, rate, units)
+    return time.time() - start
+
+
+if __name__ == '__main__':
+    max_iters = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    if len(sys.argv) > 2 and sys.argv[2] == 'ma':
+        strategy, strategy_params = MovingAverageCrossStrategy, {
+                "short_window": 500, "long_window": 2000}
+    else:
+        strategy, strategy_params = TestStrategy, {}
+
+    results = {}
+    for numeric in ("decimal", "pipette"):
+        results[numeric] = run(numeric, strategy, strategy_params, max_iters)
+        print("%s: balance %s, backtest.csv md5 %s, %.2fs" % (
+                (numeric,) + results[numeric]))
+
+    dec, pip = results["decimal"], results["pipette"]
+    print("Identical balance: %s" % (dec[0] == pip[0]))
+    print("Identical backtest.csv: %s" % (dec[1] == pip[1]))
+    print("Speedup (backtest): %.2fx" % (dec[2] / pip[2]))
+
+    arithmetic = dict((n, run_arithmetic(n)) for n in ("decimal", "pipette"))
+    print("Per-tick arithmetic: decimal %.2fs, pipette %.2fs, speedup %.2fx" % (
+            arithmetic["decimal"], arithmetic["pipette"],
+            arithmetic["decimal"] / arithmetic["pipette"]))
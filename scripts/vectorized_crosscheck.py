@@ -0,0 +1,105 @@
+"""
+
+Cross-check and benchmark of the vectorized MA cross backtest
+(backtest/vectorized.py) against the event driven Backtest.
+
+Runs the MovingAverageCrossStrategy on the first max_ticks ticks of the pair
+in settings.CSV_DATA_DIR with both, then compares the final balances and the
+balance and unrealised profit the portfolio recorded for every tick with
+the equity curve of the vectorized run, and reports the wall times.
+
+With a cache_dir both runs read the days through the parsed-day cache, which
+is filled before timing, so the times exclude CSV parsing.
+
+Usage:
+    python scripts/vectorized_crosscheck.py [max_ticks] [short] [long] [cache_dir]
+"""
+import sys
+sys.path.append('../')
+
+import os
+import time
+import contextlib
+
+import numpy as np
+import pandas as pd
+
+from backtest.backtest import Backtest
+from backtest.vectorized import VectorizedMACrossBacktest
+from data.price import HistoricCSVPriceHandler
+from execution.execution import SimulatedExecution
+from portfolio.portfolio import Portfolio
+from settings import EQUITY
+from strategy.strategy import MovingAverageCrossStrategy
+
+
+def run_events(pair, short_window, long_window, max_ticks, params):
+    """
+    Runs the event driven backtest and returns (final balance, recorded
+    DataFrame, wall time in seconds).
+    """
+    backtest = Backtest(
+            [pair], HistoricCSVPriceHandler,
+            MovingAverageCrossStrategy,
+            {"short_window": short_window, "long_window": long_window},
+            Portfolio, SimulatedExecution,
+            equity=EQUITY, heartbeat=0.0, max_iters=max_ticks,
+            engine="direct", data_handler_params=dict(params, numeric="pipette"))
+    start = time.time()
+    with open(os.devnull, "w") as devnull:
+        with contextlib.redirect_stdout(devnull):
+            backtest._run_backtest()
+    elapsed = time.time() - start
+    portfolio = backtest.portfolio
+    portfolio.recorder.close()
+    df = portfolio.recorder.to_frame()
+    return portfolio.numeric.money_to_decimal(portfolio.balance), df, elapsed
+
+
+def run_vectorized(pair, short_window, long_window, max_ticks, params):
+    """
+    Runs the vectorized backtest and returns (final balance, equity
+    DataFrame, number of trades, wall time in seconds).
+    """
+    start = time.time()
+    with open(os.devnull, "w") as devnull:
+        with contextlib.redirect_stdout(devnull):
+            results = VectorizedMACrossBacktest(
+                    pair, short_window, long_window, equity=EQUITY,
+                    max_ticks=max_ticks, data_handler_params=params).run()
+    elapsed = time.time() - start
+    return (results["balance"], results["equity"], len(results["trades"]),
+            elapsed)
+
+
+if __name__ == '__main__':
+    max_ticks = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    short_window = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    long_window = int(sys.argv[3]) if len(sys.argv) > 3 else 2000
+    params = {"cache_dir": sys.argv[4]} if len(sys.argv) > 4 else {}
+    pair = "GBPUSD"
+
+    if params:
+        # fill the parsed-day cache
+        run_vectorized(pair, short_window, long_window, max_ticks, params)
+    ev_balance, ev_df, ev_time = run_events(
+            pair, short_window, long_window, max_ticks, params)
+    vec_balance, vec_df, trades, vec_time = run_vectorized(
+            pair, short_window, long_window, max_ticks, params)
+
+    print("Event driven: balance %s, %d ticks, %.2fs" % (
+            ev_balance, len(ev_df), ev_time))
+    print("Vectorized:   balance %s, %d ticks, %d trades, %.3fs" % (
+            vec_balance, len(vec_df), trades, vec_time))
+    print("Identical balance: %s" % (ev_balance == vec_balance))
+    if len(ev_df) == len(vec_df):
+        same_time = (pd.DatetimeIndex(ev_df.index) == vec_df.index).all()
+        diff = np.maximum(
+                np.abs(ev_df["Balance"].values - vec_df["Balance"].values),
+                np.abs(ev_df[pair].values - vec_df[pair].values))
+        print("Identical tick times: %s" % same_time)
+        print("Ticks with a different balance or profit: %d" % (
+                (diff > 1e-9).sum()))
+    else:
+        print("Different number of recorded ticks")
+    print("Speedup: %.0fx" % (ev_time / vec_time))
@@ -6,6 +6,7 @@ Define basic settings:
     DOMAIN:             trading domain: 'practice' or 'live'
     CSV_DATA_DIR:       dir to save data csv files
     OUTPUTI_RESULT_DIR: dir to save outputs
+    TICK_STORE_DIR:     dir to save memory-mappable binary tick data
     BASE_CURRENCY:      OANDA account base CCY
     EQUITY:             starting amount of funds in base CCY
     
@@ -30,6 +31,7 @@ ACCESS_TOKEN = config['oanda']['access_token']
 
 CSV_DATA_DIR = r'C:\Users\2019765\Desktop\Naf\ML\trading\OANDA\tradingLayer\dump\Data'
 OUTPUT_RESULT_DIR = r'C:\Users\2019765\Desktop\Naf\ML\trading\OANDA\tradingLayer\dump\Results'
+TICK_STORE_DIR = r'C:\Users\2019765\Desktop\Naf\ML\trading\OANDA\tradingLayer\dump\Store'
 
 BASE_CURRENCY = 'GBP'
 EQUITY = Decimal('100000.00')
@@ -0,0 +1,335 @@
+"""
+
+Streaming indicators with constant cost per tick.
+
+Every indicator keeps its history in storage that is allocated once when it
+is created (a ring buffer of the window length), so update() never grows a
+list or recomputes a whole window:
+
+    SMA:             exact simple moving average over the last 'window' values
+    EMA:             exponential moving average, alpha = 2 / (window + 1) or
+                     an explicit alpha
+    RunningAverage:  the running average (avg * (window - 1) + value) / window
+                     of the original MovingAverageCrossStrategy
+    RollingVariance: variance over the last 'window' values (windowed
+                     Welford update), RollingStd its square root
+    RollingMax,
+    RollingMin:      maximum/minimum over the last 'window' values, kept in a
+                     monotonic queue
+    VWAP:            volume weighted average price over the last 'window'
+                     ticks
+
+The indicators work with floats, ints and Decimals alike. update(value)
+returns the new value of the indicator, which is also available as .value;
+.ready tells whether a full window has been seen.
+"""
+import sys
+sys.path.append('../')
+
+import math
+from decimal import Decimal
+
+
+def _like(x, value):
+    """
+    Converts x into a Decimal if value is one, so float parameters and
+    volumes can be combined with Decimal prices.
+    """
+    if isinstance(value, Decimal) and not isinstance(x, Decimal):
+        return Decimal(str(x))
+    return x
+
+
+class RingBuffer(object):
+    """
+    Fixed size buffer of the last 'size' values.
+    """
+
+    def __init__(self, size):
+        if size < 1:
+            raise ValueError("Window has to be at least 1, got %s" % size)
+        self.size = size
+        self.values = [None] * size
+        self.pos = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def full(self):
+        return self.count == self.size
+
+    def append(self, value):
+        """
+        Adds a value and returns the value it replaced, or None while the
+        buffer is not full yet.
+        """
+        old = self.values[self.pos]
+        self.values[self.pos] = value
+        self.pos += 1
+        if self.pos == self.size:
+            self.pos = 0
+        if self.count < self.size:
+            self.count += 1
+            return None
+        return old
+
+    def __iter__(self):
+        """
+        Iterates over the values from the oldest to the newest.
+        """
+        start = self.pos if self.full else 0
+        for i in range(self.count):
+            yield self.values[(start + i) % self.size]
+
+
+class Indicator(object):
+    """
+    Base class of the streaming indicators.
+    """
+
+    # whether update() takes the volume of the tick after the price
+    volumes = False
+
+    def __init__(self, window):
+        self.window = window
+        self.value = None
+
+    @property
+    def ready(self):
+        raise NotImplementedError("Should implement ready")
+
+    def update(self, value):
+        raise NotImplementedError("Should implement update()")
+
+
+class SMA(Indicator):
+    """
+    Exact simple moving average of the last 'window' values. Before the
+    window is full it is the average of the values seen so far.
+
+    The running sum is rebuilt from the buffer once per window, so float
+    rounding errors cannot accumulate over millions of ticks (ints and
+    Decimals are summed exactly anyway).
+    """
+
+    def __init__(self, window):
+        super(SMA, self).__init__(window)
+        self.buffer = RingBuffer(window)
+        self.total = 0
+        self.updates = 0
+
+    @property
+    def ready(self):
+        return self.buffer.full
+
+    def update(self, value):
+        old = self.buffer.append(value)
+        if old is None:
+            self.total += value
+        else:
+            self.total += value - old
+        self.updates += 1
+        if self.updates == self.window:
+            self.updates = 0
+            self.total = sum(self.buffer.values[:len(self.buffer)])
+        self.value = self.total / len(self.buffer)
+        return self.value
+
+
+class EMA(Indicator):
+    """
+    Exponential moving average, seeded with the first value:
+    ema = ema + alpha * (value - ema).
+    """
+
+    def __init__(self, window=None, alpha=None):
+        if alpha is None:
+            if window is None:
+                raise ValueError("EMA needs a window or an alpha")
+            alpha = 2.0 / (window + 1)
+        super(EMA, self).__init__(window)
+        self.alpha = alpha
+        self.count = 0
+
+    @property
+    def ready(self):
+        return self.count >= (self.window or 1)
+
+    def update(self, value):
+        self.count += 1
+        if self.value is None:
+            self.alpha = _like(self.alpha, value)
+            self.value = value
+        else:
+            self.value = self.value + self.alpha * (value - self.value)
+        return self.value
+
+
+class RunningAverage(Indicator):
+    """
+    Running average (avg * (window - 1) + value) / window, seeded with the
+    first value. This is EMA(alpha=1/window), but computed with exactly the
+    arithmetic of the original MovingAverageCrossStrategy, so it reproduces
+    its averages to the last bit.
+    """
+
+    def __init__(self, window):
+        super(RunningAverage, self).__init__(window)
+        self.count = 0
+
+    @property
+    def ready(self):
+        return self.count >= self.window
+
+    def update(self, value):
+        self.count += 1
+        if self.value is None:
+            self.value = value
+        else:
+            self.value = ((self.value * (self.window - 1)) + value) / self.window
+        return self.value
+
+
+class RollingVariance(Indicator):
+    """
+    Variance of the last 'window' values with a windowed Welford update,
+    which avoids the cancellation of the sum of squares formula. ddof=1
+    gives the sample variance. Like the SMA sum, the mean and the sum of
+    squared deviations are rebuilt from the buffer once per window.
+    """
+
+    def __init__(self, window, ddof=0):
+        super(RollingVariance, self).__init__(window)
+        self.ddof = ddof
+        self.buffer = RingBuffer(window)
+        self.mean = 0
+        self.m2 = 0
+        self.updates = 0
+
+    @property
+    def ready(self):
+        return self.buffer.full
+
+    def update(self, value):
+        old = self.buffer.append(value)
+        n = len(self.buffer)
+        if old is None:
+            delta = value - self.mean
+            self.mean = self.mean + delta / n
+            self.m2 = self.m2 + delta * (value - self.mean)
+        else:
+            # replace old by value in a window of constant size n
+            mean = self.mean + (value - old) / n
+            self.m2 = self.m2 + (value - old) * (value - mean + old - self.mean)
+            self.mean = mean
+        self.updates += 1
+        if self.updates == self.window:
+            self.updates = 0
+            values = self.buffer.values[:n]
+            self.mean = sum(values) / n
+            self.m2 = sum((v - self.mean) * (v - self.mean) for v in values)
+        if self.m2 < 0:
+            # rounding of a constant window
+            self.m2 = self.m2 * 0
+        self.value = self.m2 / (n - self.ddof) if n > self.ddof else None
+        return self.value
+
+
+class RollingStd(RollingVariance):
+    """
+    Standard deviation of the last 'window' values.
+    """
+
+    def update(self, value):
+        variance = super(RollingStd, self).update(value)
+        if variance is not None:
+            self.value = variance.sqrt() if hasattr(variance, "sqrt") \
+                else math.sqrt(variance)
+        return self.value
+
+
+class RollingMax(Indicator):
+    """
+    Maximum of the last 'window' values. A monotonic queue of (tick number,
+    value) pairs, stored in preallocated rings, holds the candidates in
+    decreasing order, so every value is added and removed at most once.
+    """
+
+    def __init__(self, window):
+        super(RollingMax, self).__init__(window)
+        self.ticks = [0] * window
+        self.values = [None] * window
+        self.head = 0
+        self.length = 0
+        self.count = 0
+
+    @property
+    def ready(self):
+        return self.count >= self.window
+
+    def _keep(self, candidate, value):
+        # True if candidate stays in front of the new value
+        return candidate > value
+
+    def update(self, value):
+        window = self.window
+        tick = self.count
+        self.count += 1
+        # drop the candidates that left the window
+        if self.length and self.ticks[self.head] <= tick - window:
+            self.head = (self.head + 1) % window
+            self.length -= 1
+        # drop the candidates the new value dominates
+        while self.length:
+            last = (self.head + self.length - 1) % window
+            if self._keep(self.values[last], value):
+                break
+            self.length -= 1
+        pos = (self.head + self.length) % window
+        self.ticks[pos] = tick
+        self.values[pos] = value
+        self.length += 1
+        self.value = self.values[self.head]
+        return self.value
+
+
+class RollingMin(RollingMax):
+    """
+    Minimum of the last 'window' values.
+    """
+
+    def _keep(self, candidate, value):
+        return candidate < value
+
+
+class VWAP(Indicator):
+    """
+    Volume weighted average price of the last 'window' ticks. Ticks without
+    volume leave the average unchanged.
+    """
+
+    volumes = True
+
+    def __init__(self, window):
+        super(VWAP, self).__init__(window)
+        self.buffer = RingBuffer(window)
+        self.price_volume = 0
+        self.volume = 0
+
+    @property
+    def ready(self):
+        return self.buffer.full
+
+    def update(self, price, volume):
+        volume = _like(volume, price)
+        old = self.buffer.append((price * volume, volume))
+        self.price_volume += price * volume
+        self.volume += volume
+        if old is not None:
+            self.price_volume -= old[0]
+            self.volume -= old[1]
+        if self.volume > 0:
+            self.value = self.price_volume / self.volume
+        return self.value
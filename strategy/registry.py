@@ -0,0 +1,142 @@
+"""
+
+Indicators shared by several strategies.
+
+Strategies that run over the same ticks (several parameterisations of
+MovingAverageCrossStrategy in a FanOutBacktest, for example) would otherwise
+each keep and update their own copies of the same moving averages. An
+IndicatorRegistry holds, per pair, one indicator for every distinct
+(indicator class, parameters, price field) key:
+
+    registry = IndicatorRegistry()
+    sma = registry.subscribe("GBPUSD", SMA, "bid", window=500)
+    ...
+    registry.update(tick_event)     # in calculate_signals of every strategy
+    sma.value
+
+Every subscriber of a key gets the same indicator object. update() computes
+all indicators of the pair of a tick once, however many strategies pass the
+same tick event to it. Subscriptions are reference counted and an indicator
+is dropped as soon as its last subscriber unsubscribes.
+
+A strategy that subscribes to a key that is already in use gets the existing,
+already updated indicator, so all subscribers should subscribe before the
+first tick.
+
+Indicators that take a volume besides the price (Indicator.volumes, e.g.
+VWAP) are updated with the bid or ask volume of VolumeTickEvents, or their
+sum on the mid field; price handlers only send those with volumes=True.
+Ticks without volumes leave them unchanged.
+"""
+import sys
+sys.path.append('../')
+
+
+PRICE_FIELDS = ("bid", "ask", "mid")
+
+
+class IndicatorRegistry(object):
+    """
+    Per pair registry of reference counted indicators, updated once per
+    tick.
+    """
+
+    def __init__(self):
+        # pair -> {key: [indicator, references]}
+        self.pairs = {}
+        # pair -> last tick event the indicators of the pair were updated with
+        self.last_ticks = {}
+
+    def __len__(self):
+        return sum(len(entries) for entries in self.pairs.values())
+
+    def key(self, indicator, field, params):
+        """
+        Registry key of an indicator class with the given parameters on a
+        price field.
+        """
+        if field not in PRICE_FIELDS:
+            raise ValueError("Unknown price field: %s" % field)
+        return (indicator, tuple(sorted(params.items())), field)
+
+    def subscribe(self, pair, indicator, field="bid", **params):
+        """
+        Returns the indicator(**params) of the price field of pair, creating
+        it if nobody has subscribed to it yet.
+        """
+        key = self.key(indicator, field, params)
+        entries = self.pairs.setdefault(pair, {})
+        entry = entries.get(key)
+        if entry is None:
+            entry = entries[key] = [indicator(**params), 0]
+        entry[1] += 1
+        return entry[0]
+
+    def unsubscribe(self, pair, indicator):
+        """
+        Releases one subscription of an indicator returned by subscribe().
+        The indicator is dropped when it has no subscribers left.
+        """
+        entries = self.pairs.get(pair, {})
+        for key, entry in entries.items():
+            if entry[0] is indicator:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del entries[key]
+                    if not entries:
+                        del self.pairs[pair]
+                        self.last_ticks.pop(pair, None)
+                return
+        raise KeyError("Indicator is not registered for %s" % pair)
+
+    def references(self, pair, indicator):
+        """
+        Number of subscribers of an indicator, 0 if it is not registered.
+        """
+        for entry in self.pairs.get(pair, {}).values():
+            if entry[0] is indicator:
+                return entry[1]
+        return 0
+
+    def update(self, event):
+        """
+        Updates every indicator of the pair of a tick event. Returns False
+        without doing anything if the indicators have already seen this
+        event, so every subscriber can call update() with the same tick.
+        """
+        pair = event.instrument
+        if self.last_ticks.get(pair) is event:
+            return False
+        entries = self.pairs.get(pair)
+        if not entries:
+            return True
+        self.last_ticks[pair] = event
+        bid = event.bid
+        ask = event.ask
+        mid = None
+        for key, entry in entries.items():
+            field = key[2]
+            if key[0].volumes:
+                self._update_volume(entry[0], field, event)
+            elif field == "bid":
+                entry[0].update(bid)
+            elif field == "ask":
+                entry[0].update(ask)
+            else:
+                if mid is None:
+                    mid = (bid + ask) / 2
+                entry[0].update(mid)
+        return True
+
+    def _update_volume(self, indicator, field, event):
+        bid_volume = event.bid_volume
+        ask_volume = event.ask_volume
+        if field == "bid":
+            if bid_volume is not None:
+                indicator.update(event.bid, bid_volume)
+        elif field == "ask":
+            if ask_volume is not None:
+                indicator.update(event.ask, ask_volume)
+        elif bid_volume is not None and ask_volume is not None:
+            indicator.update((event.bid + event.ask) / 2,
+                             bid_volume + ask_volume)
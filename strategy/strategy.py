@@ -3,7 +3,8 @@ sys.path.append('../')
 
 from copy import deepcopy
 
-from event.event import SignalEvent
+from event.event import SignalEvent, EventType
+from strategy.indicators import SMA, RunningAverage
 
 class TestStrategy(object):
     """
@@ -26,7 +27,7 @@ class TestStrategy(object):
     #   2. pring self.events
     def calculate_signals(self, event):
         #print("Event pased to strategy: %s" % event)
-        if event.type == 'TICK' and event.instrument == self.pairs[0]:
+        if event.type == EventType.TICK and event.instrument == self.pairs[0]:
             #print("Tick No: %s" % self.ticks)
             if self.ticks % 5 == 0:
                 #print("Tick No: %s" % self.ticks)
@@ -43,6 +44,13 @@ class TestStrategy(object):
                     #print("Invested: True; self.events: %s" % self.events)
                     self.invested = False
             self.ticks += 1
+            
+    def calculate_signals_batch(self, event):
+        """
+        Counts the ticks of a TickBatchEvent like single ticks.
+        """
+        for tick in event.ticks():
+            self.calculate_signals(tick)
     
 
 class MovingAverageCrossStrategy(object):
@@ -60,13 +68,29 @@ class MovingAverageCrossStrategy(object):
     by teliminating the need to call two full moving average calcualtions on 
     each tick.
     
+    The rolling calculation is the running average (sma*(w-1)+p)/w, which
+    weights prices exponentially. With exact_sma=True the strategy uses
+    exact windowed SMAs from strategy/indicators.py instead (also constant
+    time per tick) and only starts trading once the long window is full.
+    
+    Given an IndicatorRegistry (strategy/registry.py) as 'indicators', the
+    averages are subscribed from the registry instead, so strategies on the
+    same ticks share every average with the same window. release() gives the
+    subscriptions back.
+    
+    A TickBatchEvent updates the averages tick by tick, so they are the same
+    as without batches; only the signals are executed at the prices of the
+    last tick of the batch.
     """
     
-    def __init__(self, pairs, events, short_window=500, long_window=2000):
+    def __init__(self, pairs, events, short_window=500, long_window=2000,
+                 exact_sma=False, indicators=None):
         self.pairs = pairs
-        self.pairs_dict = self.create_pairs_dict()
         self.short_window = short_window
         self.long_window = long_window
+        self.exact_sma = exact_sma
+        self.indicators = indicators
+        self.pairs_dict = self.create_pairs_dict()
         self.events = events
         
     def create_pairs_dict(self):
@@ -78,21 +102,50 @@ class MovingAverageCrossStrategy(object):
         pairs_dict = {}
         for p in self.pairs:
             pairs_dict[p] = deepcopy(attr_dict)
+            if self.indicators is not None:
+                average = SMA if self.exact_sma else RunningAverage
+                pairs_dict[p]["short"] = self.indicators.subscribe(
+                        p, average, "bid", window=self.short_window)
+                pairs_dict[p]["long"] = self.indicators.subscribe(
+                        p, average, "bid", window=self.long_window)
+            elif self.exact_sma:
+                pairs_dict[p]["short"] = SMA(self.short_window)
+                pairs_dict[p]["long"] = SMA(self.long_window)
         return pairs_dict
-            
-            
+    
+    def release(self):
+        """
+        Unsubscribes the averages of every pair from the indicator registry.
+        """
+        if self.indicators is not None:
+            for p, pd in self.pairs_dict.items():
+                self.indicators.unsubscribe(p, pd.pop("short"))
+                self.indicators.unsubscribe(p, pd.pop("long"))
+            self.indicators = None
             
     def calc_rolling_sma(self, sma_m_1, window, price):
         return ((sma_m_1 * (window - 1)) + price) / window
     
+    def calculate_signals_batch(self, event):
+        for tick in event.ticks():
+            self.calculate_signals(tick)
+    
     def calculate_signals(self, event):
         #print("Event sent to MA strategy: %s" % event)
-        if event.type == 'TICK':
+        if event.type == EventType.TICK:
             pair = event.instrument
             price = event.bid
             pd = self.pairs_dict[pair]
             #print("Pair: %s; Price: %s; Pd: %s" %(pair, price, pd))
-            if pd['ticks'] == 0:
+            if self.indicators is not None:
+                # computed once per tick for all subscribers
+                self.indicators.update(event)
+                pd["short_sma"] = pd["short"].value
+                pd["long_sma"] = pd["long"].value
+            elif self.exact_sma:
+                pd["short_sma"] = pd["short"].update(price)
+                pd["long_sma"] = pd["long"].update(price)
+            elif pd['ticks'] == 0:
                 pd["short_sma"] = price
                 pd["long_sma"] = price
             else:
@@ -102,7 +155,12 @@ class MovingAverageCrossStrategy(object):
                         pd["long_sma"], self.long_window, price)
                 
         # Only start the strategy when we have crated and accurate short window
-        if pd["ticks"] > self.short_window:
+        # (the whole long window for the exact SMAs)
+        if self.exact_sma:
+            started = pd["long"].ready
+        else:
+            started = pd["ticks"] > self.short_window
+        if started:
             #print("Ticks > %s" % self.short_window)
             #print("Short_MA: %s; Long_MA: %s; Invesed: %s" % (
             #        pd["short_sma"], pd["long_sma"], pd["invested"]))
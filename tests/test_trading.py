@@ -0,0 +1,145 @@
+"""
+
+Shutdown of the live trading threads (trading/trading.py) while the price
+stream is being read.
+"""
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import time
+import threading
+import unittest
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+from oandapyV20.exceptions import StreamTerminated
+
+from data.streaming import StreamingForexPrices
+from trading.trading import trade, shutdown
+
+
+class FakeSession(object):
+
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeClient(object):
+
+    def __init__(self):
+        self.client = FakeSession()
+
+
+class FakeRequest(object):
+    """
+    Like oandapyV20's PricingStream, terminate() throws into the stream.
+    """
+
+    def __init__(self, response):
+        self.response = response
+
+    def terminate(self, message=""):
+        self.response.throw(StreamTerminated(message))
+
+
+class FakeStreamingPrices(StreamingForexPrices):
+    """
+    StreamingForexPrices on an endless local stream of prices and
+    heartbeats instead of the OANDA pricing stream.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(FakeStreamingPrices, self).__init__(*args, **kwargs)
+        self.messages = 0
+        self.stream_closed = threading.Event()
+
+    def _stream(self):
+        try:
+            while True:
+                self.messages += 1
+                if self.messages % 2:
+                    yield {"type": "HEARTBEAT"}
+                else:
+                    yield {"type": "PRICE", "instrument": "GBP_USD",
+                           "time": "2018-07-03T00:00:00.000000000Z",
+                           "bids": [{"price": "1.30000"}],
+                           "asks": [{"price": "1.30010"}]}
+                time.sleep(0.005)
+        finally:
+            self.stream_closed.set()
+
+    def connect_to_stream(self):
+        self.client = FakeClient()
+        response = self._stream()
+        self.request = FakeRequest(response)
+        return response
+
+
+class FailingStopPrices(FakeStreamingPrices):
+
+    def stop(self):
+        super(FailingStopPrices, self).stop()
+        raise RuntimeError("stop failed")
+
+
+class Recorder(object):
+    """
+    Stands in for the strategy, the portfolio and the execution handler.
+    """
+
+    def __init__(self):
+        self.ticks = 0
+
+    def calculate_signals(self, event):
+        self.ticks += 1
+
+    def update_portfolio(self, event):
+        pass
+
+
+class ShutdownTest(unittest.TestCase):
+
+    def start(self, prices_class):
+        events = queue.Queue()
+        prices = prices_class("practice", "token", "account", ["GBPUSD"],
+                              events)
+        recorder = Recorder()
+        stop = threading.Event()
+        trade_thread = threading.Thread(
+                target=trade, args=[events, recorder, recorder, recorder,
+                                    stop, 0.05])
+        price_thread = threading.Thread(target=prices.stream_to_queue)
+        trade_thread.start()
+        price_thread.start()
+        deadline = time.time() + 5.0
+        while recorder.ticks < 3 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertGreaterEqual(recorder.ticks, 3)
+        return events, prices, [price_thread, trade_thread], stop
+
+    def test_shutdown_while_streaming(self):
+        events, prices, threads, stop = self.start(FakeStreamingPrices)
+        shutdown(events, prices, threads, stop)
+        for thread in threads:
+            self.assertFalse(thread.is_alive())
+        self.assertTrue(prices.client.client.closed)
+        self.assertTrue(prices.stream_closed.is_set())
+
+    def test_shutdown_joins_threads_when_stop_fails(self):
+        events, prices, threads, stop = self.start(FailingStopPrices)
+        with self.assertRaises(RuntimeError):
+            shutdown(events, prices, threads, stop)
+        for thread in threads:
+            self.assertFalse(thread.is_alive())
+        self.assertTrue(prices.stream_closed.is_set())
+
+
+if __name__ == '__main__':
+    unittest.main()
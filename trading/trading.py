@@ -14,40 +14,83 @@ except ImportError:
 import threading
 import time
 
-from settings import WORKING_DIR, EQUITY, DOMAIN, BASE_CURRENCY, ACCESS_TOKEN, ACCOUNT_ID
+from settings import (WORKING_DIR, EQUITY, DOMAIN, BASE_CURRENCY, ACCESS_TOKEN,
+                      ACCOUNT_ID, OUTPUT_RESULT_DIR)
 from execution.execution import OANDAExecutionHandler
 from portfolio.portfolio import Portfolio
+from portfolio.metrics import MetricsTracker, MetricsServer
 from strategy.strategy import TestStrategy
 from data.streaming import StreamingForexPrices
+from event.event import EventType
 
-def trade(events, strategy, portfolio, execution, heartbeat):
-    """
-    Carries out an infinite while loop that pools the events queue and directs
-    each event to either the strategy component or the execution handler. The
-    loop will then pause for "heartbeat" seconds and continue.
+# Put on the events queue to make trade() return
+STOP = None
+
+logger = logging.getLogger(__name__)
+
+
+def trade(events, strategy, portfolio, execution, stop=None, timeout=1.0):
     """
+    Carries out a loop that blocks on the events queue and directs each event
+    to either the strategy component or the execution handler as soon as it
+    arrives, so there is no heartbeat delay between a tick and its order.
     
-    while True:
+    If the execution handler has a poll() method, like NettingExecution
+    (see execution/netting.py), it is called after every event and whenever
+    no event arrived within 'timeout', so netting windows close on time.
+    
+    The loop returns when the STOP sentinel is taken from the queue or, if a
+    threading.Event is given as stop, once it is set. 'timeout' is the longest
+    time in seconds between two checks of the stop event while no events
+    arrive.
+    """
+    poll = getattr(execution, "poll", None)
+    while stop is None or not stop.is_set():
         try:
-            event = events.get(False)
+            event = events.get(True, timeout)
         except queue.Empty:
-            pass
-        else:
-            if event is not None and event.type == 'TICK':
-                print("TICK")
-                logger.info("Received new TICK event: %s" % event)
-                strategy.calculate_signals(event)
-                portfolio.update_portfolio(event)
-            elif event.type == 'SIGNAL':
-                print("SIGNAL")
-                logger.info("Received new SIGNAL event: %s" % event)
-                portfolio.execute_signal(event)
-            elif event.type == 'ORDER':
-                print("ORDER")
-                logger.info("Received new ORDER event: %s" % event)
-                execution.execute_order(event)
-        time.sleep(heartbeat)
+            if poll is not None:
+                poll()
+            continue
+        if event is STOP:
+            break
+        if event.type == EventType.TICK:
+            print("TICK")
+            logger.info("Received new TICK event: %s" % event)
+            strategy.calculate_signals(event)
+            portfolio.update_portfolio(event)
+        elif event.type == EventType.SIGNAL:
+            print("SIGNAL")
+            logger.info("Received new SIGNAL event: %s" % event)
+            portfolio.execute_signal(event)
+        elif event.type == EventType.ORDER:
+            print("ORDER")
+            logger.info("Received new ORDER event: %s" % event)
+            execution.execute_order(event)
+        elif event.type == EventType.FILL:
+            print("FILL")
+            logger.info("Received new FILL event: %s" % event)
+        if poll is not None:
+            poll()
+    logger.info("Trading loop stopped")
+
+
+def shutdown(events, prices, threads, stop=None):
+    """
+    Stops the price stream and the trading loop and waits for their threads.
+    The trading loop is stopped and the threads are joined even if stopping
+    the price stream fails; the error is raised afterwards.
+    """
+    if stop is not None:
+        stop.set()
+    try:
+        prices.stop()
+    finally:
+        events.put(STOP)
+        for thread in threads:
+            thread.join()
         
+
 if __name__ == '__main__':
     """
     For logger to work restart the python kernel before each run!
@@ -63,8 +106,8 @@ if __name__ == '__main__':
     # Set the number of decimal palces to 2
     getcontext().prec = 2
     
-    heartbeat = 1 # Time in seconds between pooling
     events = queue.Queue()
+    stop = threading.Event()
     equity = EQUITY
     
     # Pairs to include in streaming data set
@@ -86,6 +129,13 @@ if __name__ == '__main__':
     # event queue
     strategy = TestStrategy(pairs, events)
         
+    # Running drawdown, P&L, Sharpe ratio and event rates of the portfolio,
+    # published to metrics.json and http://127.0.0.1:8765/metrics so they
+    # can be monitored without touching the trading thread
+    metrics = MetricsTracker(
+            path=os.path.join(OUTPUT_RESULT_DIR, "metrics.json"))
+    metrics_server = MetricsServer(metrics, port=8765).start()
+    
     # Create the portfolio objet that will be used to compare the OANDA
     # positions with the local, to ensure backtesting integirty
     portfolio = Portfolio(ticker=prices, 
@@ -94,13 +144,16 @@ if __name__ == '__main__':
                           risk_per_trade=Decimal("0.02"),
                           home_currency=BASE_CURRENCY,
                           leverage=20,
-                          backtest=False)
+                          backtest=False,
+                          metrics=metrics)
     
     # Create the execution handler making sure to provide authentication
-    # commands
+    # commands. Orders are sent by a pool of workers, so the trading loop
+    # does not wait for the broker; fills come back as FILL events
     execution = OANDAExecutionHandler(domain=DOMAIN, 
                                       access_token=ACCESS_TOKEN,
-                                      account_id=ACCOUNT_ID)
+                                      account_id=ACCOUNT_ID,
+                                      events_queue=events)
     
     # Create two seperate threads: One for the trading loop and another for 
     # the market price streaming class
@@ -108,7 +161,7 @@ if __name__ == '__main__':
                                                         strategy,
                                                         portfolio,
                                                         execution,
-                                                        heartbeat])
+                                                        stop])
     price_thread = threading.Thread(target=prices.stream_to_queue, args=[])
     
     # Start both threads
@@ -117,4 +170,19 @@ if __name__ == '__main__':
     logger.info("Starting price streaming thread")
     price_thread.start()
     
-    
\ No newline at end of file
+    # Wait for Ctrl-C, then stop the stream and the trading loop cleanly
+    try:
+        while trade_thread.is_alive():
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        logger.info("Shutting down")
+    finally:
+        try:
+            shutdown(events, prices, [price_thread, trade_thread], stop)
+        finally:
+            # send the queued orders and publish the final metrics in any case
+            try:
+                execution.stop()
+            finally:
+                metrics.publish()
+                metrics_server.stop()